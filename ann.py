@@ -0,0 +1,161 @@
+"""Approximate nearest-neighbour search over unit vectors: an IVF index in NumPy.
+
+Vectors are bucketed by their nearest k-means centroid (spherical k-means,
+so similarity is the inner product, as in embeddings.VectorIndex). A query
+scores the centroids and then only the vectors in the ``nprobe`` closest
+buckets: raising ``nprobe`` trades latency for recall, and with ``nprobe``
+equal to the number of lists the search is exact.
+
+Inserts go to the bucket of their nearest trained centroid and touch only
+that bucket, so newly scraped topics can be added without retraining. The
+centroids are not updated, so retrain once much of the index was added
+after training (``trained_on`` records how many vectors that was;
+vector_store.py reuses a store's centroids until the corpus doubles).
+Saved indexes are a directory of .npy files that ``load`` memory-maps,
+like vector_store.py.
+"""
+import json
+import math
+import os
+
+import numpy as np
+
+FORMAT_VERSION = 1
+DEFAULT_NPROBE = 8
+KMEANS_ITERATIONS = 10
+TRAIN_POINTS_PER_LIST = 40
+BATCH_ROWS = 16384
+
+
+def default_lists(count):
+    """Rule-of-thumb list count: about sqrt(count), at least 1."""
+    return max(1, int(round(math.sqrt(count))))
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def assign(vectors, centroids, batch_rows=BATCH_ROWS):
+    """Index of the nearest (highest inner product) centroid for each row, in bounded batches."""
+    labels = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), batch_rows):
+        block = np.asarray(vectors[start:start + batch_rows], dtype=np.float32)
+        labels[start:start + batch_rows] = np.argmax(block @ centroids.T, axis=1)
+    return labels
+
+
+def train_centroids(vectors, lists, iterations=KMEANS_ITERATIONS, seed=0):
+    """Spherical k-means on at most TRAIN_POINTS_PER_LIST * lists sampled rows."""
+    rng = np.random.default_rng(seed)
+    count = len(vectors)
+    if count < lists:
+        raise ValueError(f"Need at least {lists} vectors to train {lists} lists, got {count}")
+    sample_size = min(count, lists * TRAIN_POINTS_PER_LIST)
+    sample = np.asarray(vectors[np.sort(rng.choice(count, sample_size, replace=False))], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, lists, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        counts = np.bincount(labels, minlength=lists)
+        empty = counts == 0
+        # Empty lists restart from random points instead of staying dead
+        sums[empty] = sample[rng.choice(sample_size, int(empty.sum()), replace=False)]
+        centroids = _normalize(sums)
+    return centroids
+
+
+class IVFIndex:
+    """Inverted-file index: ``search`` scans the ``nprobe`` lists nearest the query."""
+
+    def __init__(self, centroids, nprobe=DEFAULT_NPROBE, trained_on=0):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        self.trained_on = trained_on
+        dimensions = self.centroids.shape[1]
+        self._vectors = [np.empty((0, dimensions), dtype=np.float32) for _ in range(len(self.centroids))]
+        self._ids = [np.empty(0, dtype=np.int64) for _ in range(len(self.centroids))]
+
+    @classmethod
+    def build(cls, vectors, ids=None, lists=None, nprobe=DEFAULT_NPROBE, seed=0):
+        """Train on ``vectors`` and add them; ``ids`` default to their row numbers."""
+        index = cls(train_centroids(vectors, lists or default_lists(len(vectors)), seed=seed), nprobe=nprobe,
+                    trained_on=len(vectors))
+        index.add(vectors, ids)
+        return index
+
+    def empty_copy(self):
+        """An index with the same trained centroids and no vectors, to ``add`` a new corpus to."""
+        return type(self)(self.centroids, nprobe=self.nprobe, trained_on=self.trained_on)
+
+    @property
+    def lists(self):
+        return len(self.centroids)
+
+    def __len__(self):
+        return sum(len(ids) for ids in self._ids)
+
+    def add(self, vectors, ids=None):
+        """Insert unit ``vectors`` (ids default to the next row numbers); only their lists are copied."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if ids is None:
+            ids = np.arange(len(self), len(self) + len(vectors), dtype=np.int64)
+        ids = np.asarray(ids, dtype=np.int64)
+        labels = assign(vectors, self.centroids)
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(self.lists + 1))
+        for label in np.flatnonzero(np.diff(bounds)):
+            rows = order[bounds[label]:bounds[label + 1]]
+            self._vectors[label] = np.concatenate([self._vectors[label], vectors[rows]])
+            self._ids[label] = np.concatenate([self._ids[label], ids[rows]])
+
+    def search(self, query, k=10, nprobe=None):
+        """(scores, ids) of the ``k`` best matches in the probed lists, best first."""
+        query = np.asarray(query, dtype=np.float32)
+        nprobe = min(nprobe or self.nprobe, self.lists)
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe] if nprobe < self.lists else range(self.lists)
+        scores = [self._vectors[label] @ query for label in probe if len(self._ids[label])]
+        if not scores:
+            return np.empty(0, dtype=np.float32), np.empty(0, dtype=np.int64)
+        scores = np.concatenate(scores)
+        ids = np.concatenate([self._ids[label] for label in probe if len(self._ids[label])])
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return scores[top], ids[top]
+
+    def save(self, path):
+        """Write the index as .npy files (lists concatenated, with offsets) and meta.json."""
+        os.makedirs(path, exist_ok=True)
+        offsets = np.zeros(self.lists + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(ids) for ids in self._ids])
+        np.save(os.path.join(path, "centroids.npy"), self.centroids)
+        np.save(os.path.join(path, "vectors.npy"), np.concatenate(self._vectors))
+        np.save(os.path.join(path, "ids.npy"), np.concatenate(self._ids))
+        np.save(os.path.join(path, "offsets.npy"), offsets)
+        with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"version": FORMAT_VERSION, "count": int(offsets[-1]), "lists": self.lists,
+                       "dimensions": int(self.centroids.shape[1]), "nprobe": self.nprobe,
+                       "trained_on": self.trained_on}, f)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Open a saved index; with ``mmap`` the lists are views of the mapped files."""
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported IVF index version in {path}: {meta.get('version')}")
+        mode = "r" if mmap else None
+        index = cls(np.load(os.path.join(path, "centroids.npy")), nprobe=meta["nprobe"],
+                    trained_on=meta.get("trained_on", meta["count"]))
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode=mode)
+        ids = np.load(os.path.join(path, "ids.npy"), mmap_mode=mode)
+        offsets = np.load(os.path.join(path, "offsets.npy"))
+        for label in range(index.lists):
+            index._vectors[label] = vectors[offsets[label]:offsets[label + 1]]
+            index._ids[label] = ids[offsets[label]:offsets[label + 1]]
+        return index
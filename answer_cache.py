@@ -0,0 +1,221 @@
+import hashlib
+import json
+import math
+import re
+import sqlite3
+import time
+from collections import Counter, OrderedDict, namedtuple
+
+from retrieval import STOPWORDS, TOKEN_RE
+
+CacheEntry = namedtuple("CacheEntry", ["question", "image_hash", "value", "created_at"])
+
+WHITESPACE_RE = re.compile(r"\s+")
+CONTRACTION_RE = re.compile(r"n['’]t\b")
+# Unlike retrieval, the cache must keep words that flip a question's meaning
+NEGATIONS = frozenset({"no", "not", "never", "nor", "without", "cannot"})
+CACHE_STOPWORDS = STOPWORDS - NEGATIONS
+
+
+def normalize_question(question):
+    """Lowercase, collapse whitespace and drop trailing punctuation."""
+    return WHITESPACE_RE.sub(" ", question.lower()).strip().rstrip("?!. ")
+
+
+def image_digest(image):
+    if not image:
+        return ""
+    return hashlib.sha256(image.encode("utf-8")).hexdigest()
+
+
+def cache_key(normalized_question, image_hash=""):
+    return hashlib.sha256(f"{normalized_question}\0{image_hash}".encode("utf-8")).hexdigest()
+
+
+def cache_tokens(text):
+    """Retrieval-style tokens that keep negations ("don't" becomes "do not")."""
+    text = CONTRACTION_RE.sub(" not", text.lower())
+    return [t for t in TOKEN_RE.findall(text) if t not in CACHE_STOPWORDS]
+
+
+def negations(text):
+    """The negation words in ``text``: near-duplicate matches must agree on them."""
+    return frozenset(t for t in cache_tokens(text) if t in NEGATIONS)
+
+
+def bag_of_words(text):
+    """Default embedding: a sparse term-frequency vector of the question."""
+    return Counter(cache_tokens(text))
+
+
+def cosine(a, b):
+    if len(a) > len(b):
+        a, b = b, a
+    dot = sum(weight * b.get(term, 0.0) for term, weight in a.items())
+    if not dot:
+        return 0.0
+    norm = math.sqrt(sum(w * w for w in a.values())) * math.sqrt(sum(w * w for w in b.values()))
+    return dot / norm
+
+
+class MemoryStore:
+    """In-process LRU store: least recently used entries sit at the front."""
+
+    def __init__(self):
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is not None:
+            self._data.move_to_end(key)
+        return entry
+
+    def put(self, key, entry):
+        self._data[key] = entry
+        self._data.move_to_end(key)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def pop_oldest(self):
+        key, _ = self._data.popitem(last=False)
+        return key
+
+    def items(self):
+        return list(self._data.items())
+
+    def clear(self):
+        self._data.clear()
+
+
+class SQLiteStore:
+    """On-disk LRU store so cached answers survive restarts."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers ("
+            " key TEXT PRIMARY KEY, question TEXT, image_hash TEXT, value TEXT,"
+            " created_at REAL, accessed_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS answers_accessed ON answers (accessed_at)")
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+
+    def get(self, key):
+        row = self._conn.execute(
+            "SELECT question, image_hash, value, created_at FROM answers WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        self._conn.execute("UPDATE answers SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return CacheEntry(row[0], row[1], json.loads(row[2]), row[3])
+
+    def put(self, key, entry):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO answers VALUES (?, ?, ?, ?, ?, ?)",
+            (key, entry.question, entry.image_hash, json.dumps(entry.value), entry.created_at, time.time()),
+        )
+
+    def delete(self, key):
+        self._conn.execute("DELETE FROM answers WHERE key = ?", (key,))
+
+    def pop_oldest(self):
+        row = self._conn.execute("SELECT key FROM answers ORDER BY accessed_at LIMIT 1").fetchone()
+        self.delete(row[0])
+        return row[0]
+
+    def items(self):
+        rows = self._conn.execute(
+            "SELECT key, question, image_hash, value, created_at FROM answers ORDER BY accessed_at"
+        )
+        return [(row[0], CacheEntry(row[1], row[2], json.loads(row[3]), row[4])) for row in rows]
+
+    def clear(self):
+        self._conn.execute("DELETE FROM answers")
+
+
+class AnswerCache:
+    """Size- and TTL-bounded LRU cache of answers keyed on question + image hash.
+
+    With ``similarity_threshold`` set, a miss on the exact key falls back to
+    the cached question whose embedding is closest (cosine) to this one, as
+    long as it clears the threshold and has the same image and negations
+    (so "should I not use X" never reuses "should I use X"). ``embed`` maps
+    text to a sparse ``{term: weight}`` vector. ``image_hash`` is any stable
+    identifier of the attached image (see images.process_image), "" for none.
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600, similarity_threshold=0.0, embed=bag_of_words, path=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embed = embed
+        self.store = SQLiteStore(path) if path else MemoryStore()
+        self.hits = 0
+        self.misses = 0
+        self._vectors = {}
+        if similarity_threshold:
+            for key, entry in self.store.items():
+                self._vectors[key] = ((entry.image_hash, negations(entry.question)), embed(entry.question))
+
+    def _expired(self, entry):
+        return self.ttl and time.time() - entry.created_at > self.ttl
+
+    def _nearest(self, vector, group):
+        best_key, best_score = None, self.similarity_threshold
+        for key, (other_group, other_vector) in self._vectors.items():
+            if other_group != group:
+                continue
+            score = cosine(vector, other_vector)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def _delete(self, key):
+        self.store.delete(key)
+        self._vectors.pop(key, None)
+
+    def get(self, question, image_hash=""):
+        normalized = normalize_question(question)
+        key = cache_key(normalized, image_hash)
+        entry = self.store.get(key)
+        if entry is None and self.similarity_threshold:
+            key = self._nearest(self.embed(normalized), (image_hash, negations(normalized)))
+            entry = self.store.get(key) if key else None
+        if entry is not None and self._expired(entry):
+            self._delete(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry.value
+
+    def set(self, question, image_hash, value):
+        normalized = normalize_question(question)
+        key = cache_key(normalized, image_hash)
+        self.store.put(key, CacheEntry(normalized, image_hash, value, time.time()))
+        if self.similarity_threshold:
+            self._vectors[key] = ((image_hash, negations(normalized)), self.embed(normalized))
+        while len(self.store) > self.max_entries:
+            self._vectors.pop(self.store.pop_oldest(), None)
+
+    def clear(self):
+        self.store.clear()
+        self._vectors.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self.store),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,208 @@
+"""Parse, validate and serialize assistant answers on the hot path.
+
+Every /api/ response is an ``{"answer": str, "links": [{str: str}]}``
+object. It is decoded and checked once here with plain type checks, then
+sent as pre-serialized bytes, instead of going through json.loads, a
+pydantic model and FastAPI's response_model validation and encoder.
+
+Replies that are not strict JSON (code fences, surrounding prose, trailing
+commas, truncation, sloppy links) go through extract_json and
+normalize_answer instead of failing the request.
+"""
+import json
+import re
+
+try:
+    import orjson
+except ImportError:  # orjson is optional: the stdlib encoder gives the same output, slower
+    orjson = None
+
+
+class InvalidAnswerError(ValueError):
+    """The assistant's reply does not have the ``{answer, links}`` shape."""
+
+
+def loads(data):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(value):
+    """Compact UTF-8 JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def validate_answer(data):
+    """Return ``data`` as a fresh ``{"answer", "links"}`` dict or raise InvalidAnswerError.
+
+    Mirrors QueryResponse (answer: str, links: list[dict[str, str]]); extra
+    keys are dropped.
+    """
+    if not isinstance(data, dict):
+        raise InvalidAnswerError(f"Answer must be a JSON object, got {type(data).__name__}")
+    answer = data.get("answer")
+    if not isinstance(answer, str):
+        raise InvalidAnswerError("Answer field 'answer' must be a string")
+    links = data.get("links", [])
+    if not isinstance(links, list):
+        raise InvalidAnswerError("Answer field 'links' must be a list")
+    for link in links:
+        if not isinstance(link, dict) or not all(
+            isinstance(k, str) and isinstance(v, str) for k, v in link.items()
+        ):
+            raise InvalidAnswerError("Each link must be an object of strings")
+    return {"answer": answer, "links": links}
+
+
+# Lenient extraction for replies that are not strict JSON
+
+FENCE_RE = re.compile(r"```[a-zA-Z]*[ \t]*\n?(.*?)(?:```|\Z)", re.S)
+URL_RE = re.compile(r"https?://[^\s<>()\[\]\"'`]+[^\s<>()\[\]\"'`.,;:!?]")
+CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+URL_KEYS = ("url", "link", "href", "source")
+TEXT_KEYS = ("text", "title", "label", "name", "description")
+MAX_CANDIDATES = 8
+
+
+def _strip_trailing_comma(out):
+    while out and out[-1].isspace():
+        out.pop()
+    if out and out[-1] == ",":
+        out.pop()
+
+
+def _scan_object(text, start):
+    """Copy the JSON object starting at ``text[start]`` while repairing it.
+
+    A single pass that tracks strings and nesting: it escapes raw control
+    characters inside strings, drops trailing commas, fixes mismatched
+    closers and closes whatever a truncated reply left open. A string cut
+    off inside a nested value (e.g. half a link URL) is dropped rather than
+    closed; a cut-off top-level answer is kept. Returns (repaired text,
+    index just past the object).
+    """
+    out, stack = [], []
+    safe = 0  # length of ``out`` at the last point a nested value could be cut
+    in_string = escape = False
+    i = start
+    while i < len(text):
+        char = text[i]
+        i += 1
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            elif char < " ":
+                char = CONTROL_ESCAPES.get(char, f"\\u{ord(char):04x}")
+            out.append(char)
+            continue
+        if char == '"':
+            in_string = True
+        elif char == ",":
+            safe = len(out)
+        elif char in "{[":
+            stack.append("}" if char == "{" else "]")
+            safe = len(out) + 1
+        elif char in "}]":
+            _strip_trailing_comma(out)
+            out.append(stack.pop())
+            if not stack:
+                return "".join(out), i
+            continue
+        out.append(char)
+
+    if in_string and len(stack) > 1:
+        del out[safe:]
+    elif in_string:
+        if escape:
+            out.pop()
+        out.append('"')
+    _strip_trailing_comma(out)
+    if out and out[-1] == ":":
+        out.append("null")
+    out.extend(reversed(stack))
+    return "".join(out), i
+
+
+def extract_json(text):
+    """Pull the ``{"answer": ...}`` object out of a reply; returns (data, repaired).
+
+    Strict JSON is tried first. Otherwise the body of a code fence (or the
+    whole reply) is scanned left to right for objects, each repaired by
+    _scan_object, and the first that decodes to a dict with an ``answer``
+    wins. Raises InvalidAnswerError when there is none.
+    """
+    try:
+        data = loads(text)
+        if isinstance(data, dict):
+            return data, False
+    except ValueError:
+        pass
+
+    fence = FENCE_RE.search(text)
+    body = fence.group(1) if fence and "{" in fence.group(1) else text
+    start = body.find("{")
+    for _ in range(MAX_CANDIDATES):
+        if start < 0:
+            break
+        candidate, end = _scan_object(body, start)
+        try:
+            data = loads(candidate)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and "answer" in data:
+            return data, True
+        start = body.find("{", start + 1 if data is None else end)
+    raise InvalidAnswerError("No JSON answer object found in the reply")
+
+
+def normalize_links(links):
+    """Coerce ``links`` to the [{"url", "text"}] list the API promises.
+
+    Accepts bare URL strings and objects using link/href/title-style keys;
+    entries without a URL are dropped and a missing text falls back to the URL.
+    """
+    if isinstance(links, (str, dict)):
+        links = [links]
+    elif not isinstance(links, list):
+        return []
+    normalized = []
+    for link in links:
+        if isinstance(link, str):
+            url, text = link.strip(), ""
+        elif isinstance(link, dict):
+            url = next((link[k] for k in URL_KEYS if isinstance(link.get(k), str) and link[k].strip()), "")
+            text = next((link[k] for k in TEXT_KEYS if isinstance(link.get(k), str) and link[k].strip()), "")
+            url, text = url.strip(), text.strip()
+        else:
+            continue
+        if url:
+            normalized.append({"url": url, "text": text or url})
+    return normalized
+
+
+def normalize_answer(data):
+    """Validated ``{"answer", "links"}`` from a decoded, possibly sloppy reply."""
+    if not isinstance(data, dict):
+        raise InvalidAnswerError(f"Answer must be a JSON object, got {type(data).__name__}")
+    answer = data.get("answer")
+    if answer is None:
+        raise InvalidAnswerError("Answer object has no 'answer' field")
+    if not isinstance(answer, str):
+        answer = dumps(answer).decode("utf-8") if isinstance(answer, (dict, list)) else str(answer)
+    return validate_answer({"answer": answer, "links": normalize_links(data.get("links"))})
+
+
+def prose_answer(text):
+    """Last resort for a reply with no JSON at all: the text is the answer, its URLs the links."""
+    text = FENCE_RE.sub(lambda m: m.group(1), text).strip()
+    if not text:
+        raise InvalidAnswerError("Empty reply")
+    urls = list(dict.fromkeys(URL_RE.findall(text)))
+    return {"answer": text, "links": [{"url": url, "text": url} for url in urls]}
@@ -0,0 +1,107 @@
+"""In-memory static assets served compressed, with validators for browser caching.
+
+Encodings prebuilt next to the file (``.gz``/``.br``, see build_frontend.py)
+are loaded as is; any other is built once, on the first request that
+accepts it, and reused. The ETag is a content hash so it is stable across
+workers and deploys of the same file, with a suffix per content-coding
+(strong validators must differ between representations). Brotli is
+optional.
+"""
+import gzip
+import hashlib
+import os
+
+from starlette.responses import Response
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: gzip alone is served without it
+    brotli = None
+
+BROTLI_QUALITY = 9
+GZIP_LEVEL = 9
+DEFAULT_CACHE_CONTROL = "public, max-age=300, must-revalidate"
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+ETAG_SUFFIXES = {"br": "-br", "gzip": "-gz", "identity": ""}
+
+
+def accepted_encodings(accept_encoding):
+    """Codings from an Accept-Encoding header that are not refused with q=0."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        q = params.strip()
+        if q.startswith("q="):
+            try:
+                if float(q[2:]) == 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip())
+    return accepted
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = (tag.strip() for tag in if_none_match.split(","))
+    return any(tag.removeprefix("W/") == etag for tag in tags)
+
+
+class CompressedAsset:
+    """One static response body with gzip/brotli variants, each with its own strong ETag."""
+
+    def __init__(self, body, media_type, cache_control=DEFAULT_CACHE_CONTROL):
+        self.body = body
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:32]
+        self._encoded = {}
+
+    @classmethod
+    def from_file(cls, path, media_type, cache_control=DEFAULT_CACHE_CONTROL):
+        """Load ``path`` and whichever precompressed siblings exist."""
+        with open(path, "rb") as f:
+            asset = cls(f.read(), media_type, cache_control)
+        for encoding, suffix in PRECOMPRESSED_SUFFIXES.items():
+            if os.path.exists(path + suffix):
+                with open(path + suffix, "rb") as f:
+                    asset._encoded[encoding] = f.read()
+        return asset
+
+    def encoded(self, encoding):
+        data = self._encoded.get(encoding)
+        if data is None:
+            if encoding == "br":
+                data = brotli.compress(self.body, quality=BROTLI_QUALITY)
+            elif encoding == "gzip":
+                data = gzip.compress(self.body, compresslevel=GZIP_LEVEL, mtime=0)
+            else:
+                data = self.body
+            self._encoded[encoding] = data
+        return data
+
+    def etag(self, encoding="identity"):
+        return f'"{self.digest}{ETAG_SUFFIXES[encoding]}"'
+
+    def choose_encoding(self, accept_encoding):
+        accepted = accepted_encodings(accept_encoding or "")
+        if "br" in accepted and (brotli is not None or "br" in self._encoded):
+            return "br"
+        if "gzip" in accepted or "*" in accepted:
+            return "gzip"
+        return "identity"
+
+    def response(self, headers):
+        """Response for a request with ``headers``: 304 when the client's copy is current."""
+        encoding = self.choose_encoding(headers.get("accept-encoding"))
+        etag = self.etag(encoding)
+        response_headers = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if etag_matches(headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=response_headers)
+        if encoding != "identity":
+            response_headers["Content-Encoding"] = encoding
+        return Response(self.encoded(encoding), media_type=self.media_type, headers=response_headers)
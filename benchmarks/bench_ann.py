@@ -0,0 +1,114 @@
+"""Recall@10 and query latency of the IVF index against exact search.
+
+Usage: python -m benchmarks.bench_ann [--sizes 10000 100000 1000000] [--dimensions 64]
+         [--nprobe 1 4 16 64] [--queries 200] [--noise 1.0]
+
+Synthetic unit vectors drawn around random cluster centres (--noise is
+the spread around them; larger overlaps the clusters more, which is harder
+for IVF), with held-out queries from the same distribution. For each size
+the table lists build time, then per nprobe the recall@10 against exact
+inner-product search and the median latency per query; the last lines time
+save/load (memory-mapped) and inserting 1% new vectors, then rebuild the
+index the way vector_store.py does after the corpus grew by half: the
+centroids of an index trained on the first 2/3 reused, every vector added.
+"""
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+from ann import IVFIndex
+
+K = 10
+
+
+def synthetic(count, dimensions, noise, rng, centres):
+    vectors = np.empty((count, dimensions), dtype=np.float32)
+    for start in range(0, count, 100_000):
+        n = min(100_000, count - start)
+        block = centres[rng.integers(0, len(centres), n)] + noise * rng.standard_normal((n, dimensions))
+        vectors[start:start + n] = block / np.linalg.norm(block, axis=1, keepdims=True)
+    return vectors
+
+
+def timed_searches(search, queries):
+    results, latencies = [], []
+    for query in queries:
+        start = time.perf_counter()
+        results.append(search(query))
+        latencies.append(time.perf_counter() - start)
+    return results, statistics.median(latencies) * 1000
+
+
+def exact_top(vectors, query):
+    scores = vectors @ query
+    top = np.argpartition(-scores, K - 1)[:K]
+    return top[np.argsort(-scores[top])]
+
+
+def recall(found, truth):
+    return statistics.mean(len(set(f.tolist()) & set(t.tolist())) / K for f, t in zip(found, truth))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--dimensions", type=int, default=64)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--clusters", type=int, default=500, help="cluster centres in the synthetic data")
+    parser.add_argument("--noise", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        rng = np.random.default_rng(args.seed)
+        centres = rng.standard_normal((args.clusters, args.dimensions)) / np.sqrt(args.dimensions) * 4
+        vectors = synthetic(size, args.dimensions, args.noise / np.sqrt(args.dimensions) * 4, rng, centres)
+        queries = synthetic(args.queries, args.dimensions, args.noise / np.sqrt(args.dimensions) * 4, rng, centres)
+
+        truth, exact_ms = timed_searches(lambda q: exact_top(vectors, q), queries)
+        start = time.perf_counter()
+        index = IVFIndex.build(vectors)
+        build_s = time.perf_counter() - start
+        print(f"\n{size:,} x {args.dimensions} vectors: {index.lists} lists built in {build_s:.1f}s, "
+              f"exact search {exact_ms:.2f} ms/query")
+        print(f"{'nprobe':>8} {'recall@10':>10} {'ms/query':>9} {'speedup':>8}")
+        for nprobe in args.nprobe:
+            if nprobe > index.lists:
+                continue
+            found, ms = timed_searches(lambda q: index.search(q, K, nprobe=nprobe)[1], queries)
+            print(f"{nprobe:>8} {recall(found, truth):>10.3f} {ms:>9.3f} {exact_ms / ms:>7.1f}x")
+
+        with tempfile.TemporaryDirectory() as path:
+            start = time.perf_counter()
+            index.save(path)
+            save_s = time.perf_counter() - start
+            start = time.perf_counter()
+            loaded = IVFIndex.load(path)
+            load_ms = (time.perf_counter() - start) * 1000
+            assert np.array_equal(loaded.search(queries[0], K)[1], index.search(queries[0], K)[1])
+        extra = synthetic(max(size // 100, 1), args.dimensions, args.noise / np.sqrt(args.dimensions) * 4, rng, centres)
+        start = time.perf_counter()
+        index.add(extra)
+        add_ms = (time.perf_counter() - start) * 1000
+        print(f"save {save_s:.2f}s, load (mmap) {load_ms:.1f} ms, insert {len(extra):,} vectors {add_ms:.1f} ms")
+
+        old = IVFIndex.build(vectors[:size * 2 // 3])
+        start = time.perf_counter()
+        reused = old.empty_copy()
+        reused.add(vectors)
+        reuse_s = time.perf_counter() - start
+        recalls = []
+        for nprobe in args.nprobe:
+            if nprobe <= reused.lists:
+                found, _ = timed_searches(lambda q: reused.search(q, K, nprobe=nprobe)[1], queries)
+                recalls.append(f"{recall(found, truth):.3f} at nprobe {nprobe}")
+        print(f"reused centroids: rebuilt in {reuse_s:.1f}s (vs {build_s:.1f}s retraining), "
+              f"recall@10 {', '.join(recalls)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""How malformed assistant replies are handled: strict json.loads vs the repair parser.
+
+Usage: python -m benchmarks.bench_answers [--iterations 5000] [--requests 200] [--malformed-rate 0.3]
+
+The first table runs each MALFORMED reply shape from the fake assistant
+through the old strict path (json.loads, which made /api/ return a 500)
+and through answers.extract_json + normalize_answer, with the parse cost
+per reply. The second sends --requests questions to /api/ with a fake
+assistant that malforms that share of its replies and reports 500s,
+retries and upstream calls per answered question.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from answers import InvalidAnswerError, extract_json, normalize_answer, prose_answer
+from benchmarks.fake_assistant import MALFORMED, FakeAssistant, load_app
+from metrics import ANSWER_PARSES
+
+
+def old_parse(reply):
+    data = json.loads(reply)
+    return {"answer": data["answer"], "links": data["links"]}
+
+
+def new_parse(reply):
+    try:
+        data, _ = extract_json(reply)
+        return normalize_answer(data)
+    except InvalidAnswerError:
+        return prose_answer(reply)
+
+
+def outcome(fn, reply):
+    try:
+        response = fn(reply)
+    except (ValueError, KeyError):
+        return "500"
+    return f"ok, {len(response['links'])} links"
+
+
+def per_call_us(fn, reply, iterations):
+    start = time.process_time()
+    for _ in range(iterations):
+        try:
+            fn(reply)
+        except (ValueError, KeyError):
+            pass
+    return (time.process_time() - start) / iterations * 1e6
+
+
+async def run_requests(main_module, n):
+    transport = httpx.ASGITransport(app=main_module.app)
+    statuses = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for i in range(n):
+            response = await client.post("/api/", json={"question": f"question {i}"})
+            statuses.append(response.status_code)
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--malformed-rate", type=float, default=0.3)
+    args = parser.parse_args()
+
+    content = FakeAssistant()._content()
+    shapes = {"strict": content, **{name: make(content) for name, make in MALFORMED.items()}}
+    print(f"{'reply':<15} {'old':>8} {'new':>14} {'old us':>8} {'new us':>8}")
+    for name, reply in shapes.items():
+        print(f"{name:<15} {outcome(old_parse, reply):>8} {outcome(new_parse, reply):>14} "
+              f"{per_call_us(old_parse, reply, args.iterations):>8.1f} "
+              f"{per_call_us(new_parse, reply, args.iterations):>8.1f}")
+
+    fake = FakeAssistant(latency=0, malformed_rate=args.malformed_rate)
+    main_module = load_app(fake)
+    main_module.answer_cache = None
+    statuses = asyncio.run(run_requests(main_module, args.requests))
+    answered = statuses.count(200)
+    counts = {name: ANSWER_PARSES.value(outcome=name) for name in ("strict", "repaired", "retried", "prose")}
+    print(f"\n{args.requests} requests, {args.malformed_rate:.0%} malformed replies: "
+          f"{answered} answered, {len(statuses) - answered} errors")
+    print("  parsed: " + ", ".join(f"{name} {count}" for name, count in counts.items()))
+    print(f"  upstream calls per answer: {fake.calls / max(answered, 1):.3f} "
+          f"(strict json.loads would have failed ~{args.malformed_rate:.0%} of requests)")
+
+
+if __name__ == "__main__":
+    main()
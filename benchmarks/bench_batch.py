@@ -0,0 +1,54 @@
+"""Wall time of N questions sent one by one to /api/ vs one /api/batch call.
+
+Usage: python -m benchmarks.bench_batch [--questions 100] [--latency 0.1]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.fake_assistant import FakeAssistant, load_app
+
+
+async def run(main_module, payloads):
+    transport = httpx.ASGITransport(app=main_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        start = time.perf_counter()
+        for payload in payloads:
+            await client.post("/api/", json=payload)
+        sequential = time.perf_counter() - start
+
+        # Start the batch cold too, so only in-batch dedup saves upstream calls
+        if main_module.answer_cache is not None:
+            main_module.answer_cache.clear()
+        start = time.perf_counter()
+        response = await client.post("/api/batch", json=payloads)
+        batched = time.perf_counter() - start
+        assert len(response.json()) == len(payloads)
+    return sequential, batched
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--questions", type=int, default=100)
+    parser.add_argument("--duplicates", type=float, default=0.2, help="fraction of repeated questions")
+    parser.add_argument("--latency", type=float, default=0.1, help="fake assistant latency in seconds")
+    args = parser.parse_args()
+
+    fake = FakeAssistant(latency=args.latency)
+    main_module = load_app(fake)
+    unique = max(int(args.questions * (1 - args.duplicates)), 1)
+    payloads = [{"question": f"question {i % unique}"} for i in range(args.questions)]
+
+    calls_before = fake.calls
+    sequential, batched = asyncio.run(run(main_module, payloads))
+    print(f"{args.questions} questions ({unique} unique), latency={args.latency}s, "
+          f"batch concurrency={main_module.BATCH_MAX_CONCURRENCY}")
+    print(f"  sequential /api/: {sequential:.2f}s")
+    print(f"  /api/batch:       {batched:.2f}s ({sequential / batched:.1f}x faster)")
+    print(f"  upstream calls:   {fake.calls - calls_before}")
+
+
+if __name__ == "__main__":
+    main()
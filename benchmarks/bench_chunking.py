@@ -0,0 +1,69 @@
+"""Chunk sizes, context tokens per answer and link quality: word windows vs the token-aware chunker.
+
+Usage: python -m benchmarks.bench_chunking [--k 5] [--words 200] [--overlap 40]
+
+Chunks data/*.json two ways: the fixed --words windows (--overlap words
+shared) retrieval used before chunking.py, and chunking.chunk_records.
+For each it prints the chunk count and token distribution (estimated with
+chunking.count_tokens), how many chunks carry page front matter and how
+many Discourse replies were indexed without the question they answer.
+Then, for every question in the promptfoo config, it retrieves the top --k
+chunks with HybridIndex and reports the tokens they would add to a prompt,
+and hit@k / MRR of the asserted links.
+"""
+import argparse
+import statistics
+
+from benchmarks.bench_hybrid import evaluate
+from benchmarks.questions import promptfoo_link_cases, promptfoo_questions
+from chunking import chunk_records, count_tokens, post_number
+from retrieval import HybridIndex, load_records
+
+
+def word_windows(records, size, overlap):
+    """The previous chunking: each record split into overlapping windows of ``size`` words."""
+    chunks = []
+    for record in records:
+        words = record["content"].split()
+        pieces = [record["content"]] if len(words) <= size else [
+            " ".join(words[i:i + size]) for i in range(0, len(words) - overlap, size - overlap)]
+        chunks.extend({"url": record["url"], "title": record["title"], "content": piece} for piece in pieces)
+    return chunks
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--k", type=int, default=5, help="chunks retrieved per question")
+    parser.add_argument("--words", type=int, default=200, help="word window size of the baseline")
+    parser.add_argument("--overlap", type=int, default=40, help="words shared by consecutive baseline windows")
+    args = parser.parse_args()
+
+    records = load_records()
+    questions = promptfoo_questions()
+    link_cases = promptfoo_link_cases()
+    print(f"{len(records)} records, {len(questions)} promptfoo questions ({len(link_cases)} assert a link)")
+    print(f"{'chunker':<14} {'chunks':>7} {'p50 tok':>8} {'p95 tok':>8} {'max tok':>8} {'front m.':>9} "
+          f"{'no quest.':>10} {'ctx tok':>8} {f'hit@{args.k}':>7} {'MRR':>6}")
+    for name, chunks in (("word windows", word_windows(records, args.words, args.overlap)),
+                         ("token-aware", chunk_records(records))):
+        tokens = [count_tokens(chunk["content"]) for chunk in chunks]
+        front_matter = sum("original_url:" in chunk["content"] for chunk in chunks)
+        # Reply chunks (not the first post of a topic) that don't restate the question
+        replies = sum(1 for chunk in chunks if "discourse" in chunk["url"] and post_number(chunk) > 1
+                      and not chunk["content"].startswith("Question:"))
+        index = HybridIndex.from_chunks(chunks)
+        context = [sum(count_tokens(chunk["content"]) for _, chunk in index.search(question, k=args.k))
+                   for question in questions]
+        hit_rate, mrr, _ = evaluate(index, link_cases, args.k)
+        print(f"{name:<14} {len(chunks):>7} {statistics.median(tokens):>8.0f} {percentile(tokens, 0.95):>8} "
+              f"{max(tokens):>8} {front_matter:>9} {replies:>10} {statistics.mean(context):>8.0f} "
+              f"{hit_rate:>7.1%} {mrr:>6.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""Requests/sec of /api/ against a fake assistant with injected latency.
+
+Usage: python -m benchmarks.bench_concurrency [--latency 0.2] [--requests 64]
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.fake_assistant import FakeAssistant, load_app
+
+
+async def fire(app, total, clients):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        semaphore = asyncio.Semaphore(clients)
+
+        async def one(i):
+            async with semaphore:
+                r = await client.post("/api/", json={"question": f"question {i}"})
+                return r.status_code
+
+        start = time.perf_counter()
+        codes = await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+    return elapsed, codes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=0.2, help="fake assistant latency in seconds")
+    parser.add_argument("--requests", type=int, default=64, help="requests per run")
+    parser.add_argument("--clients", type=int, default=32, help="concurrent clients")
+    parser.add_argument("--limits", default="1,4,8,16,32", help="comma-separated CHAT_MAX_CONCURRENCY values")
+    args = parser.parse_args()
+
+    fake = FakeAssistant(latency=args.latency)
+    main_module = load_app(fake)
+    main_module.answer_cache = None  # every request must reach the executor
+
+    print(f"latency={args.latency}s requests={args.requests} clients={args.clients}")
+    print(f"{'limit':>6} {'seconds':>8} {'req/s':>8} {'errors':>7}")
+    for limit in (int(x) for x in args.limits.split(",")):
+        main_module.chat_executor.shutdown()
+        main_module.chat_executor = main_module.ChatExecutor(max_concurrency=limit, max_queue=args.requests)
+        main_module.upstream.executor = main_module.chat_executor
+        elapsed, codes = asyncio.run(fire(main_module.app, args.requests, args.clients))
+        errors = sum(1 for c in codes if c != 200)
+        print(f"{limit:>6} {elapsed:>8.2f} {args.requests / elapsed:>8.1f} {errors:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""Embedding throughput (chunks/sec): one at a time, batched, on a process pool and cached.
+
+Usage: python -m benchmarks.bench_embeddings [--workers 4] [--changed 0.05] [--model hashing]
+
+Embeds every chunk of data/*.json with --model (see embeddings.get_embedder):
+one text per call, then through embed_corpus with 1 and --workers
+processes, then again against a warm cache, and after editing a --changed
+share of the chunks (only those are re-embedded). The last line is the
+padding a model that pads each batch to its longest text would compute,
+for length-sorted token batches vs batches in corpus order.
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from embeddings import EmbeddingCache, chunk_text, embed_corpus, get_embedder, token_batches
+from retrieval import build_chunks, load_records
+
+
+def padding_share(texts, batches):
+    lengths = [len(text) // 4 + 1 for text in texts]
+    padded = sum(max(lengths[i] for i in batch) * len(batch) for batch in batches)
+    return 1 - sum(lengths) / padded
+
+
+def report(name, count, seconds, stats=None):
+    extra = f"  ({stats.cached} cached, {stats.embedded} embedded, {stats.batches} batches)" if stats else ""
+    print(f"{name:<22} {seconds * 1000:>9.0f} {count / seconds:>12,.0f}{extra}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--changed", type=float, default=0.05, help="share of chunks edited before the last run")
+    parser.add_argument("--model", default="hashing")
+    args = parser.parse_args()
+
+    texts = [chunk_text(chunk) for chunk in build_chunks(load_records())]
+    embedder = get_embedder(args.model)
+    print(f"{len(texts)} chunks, model {embedder.name}, {os.cpu_count()} CPUs")
+    print(f"{'run':<22} {'ms':>9} {'chunks/sec':>12}")
+
+    start = time.perf_counter()
+    for text in texts:
+        embedder.embed([text])
+    report("one at a time", len(texts), time.perf_counter() - start)
+
+    _, stats = embed_corpus(texts, embedder)
+    report("batched", len(texts), stats.seconds, stats)
+    if args.workers > 1:
+        _, stats = embed_corpus(texts, embedder, workers=args.workers)
+        report(f"batched, {args.workers} processes", len(texts), stats.seconds, stats)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = EmbeddingCache(os.path.join(tmp, "embeddings.sqlite"))
+        _, stats = embed_corpus(texts, embedder, cache=cache, workers=args.workers)
+        report("cold cache", len(texts), stats.seconds, stats)
+        _, stats = embed_corpus(texts, embedder, cache=cache, workers=args.workers)
+        report("warm cache", len(texts), stats.seconds, stats)
+        edited = list(texts)
+        for i in random.Random(0).sample(range(len(texts)), int(len(texts) * args.changed)):
+            edited[i] += " (edited)"
+        _, stats = embed_corpus(edited, embedder, cache=cache, workers=args.workers)
+        report(f"{args.changed:.0%} changed", len(texts), stats.seconds, stats)
+
+    indices = list(range(len(texts)))
+    sorted_batches = token_batches(texts, indices)
+    size = max(len(batch) for batch in sorted_batches)
+    in_order = [indices[i:i + size] for i in range(0, len(indices), size)]
+    print(f"\npadding in {size}-text batches: {padding_share(texts, sorted_batches):.0%} length-sorted, "
+          f"{padding_share(texts, in_order):.0%} in corpus order")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Page weight and TTFB of GET / before and after the static asset pipeline.
+
+Usage: python -m benchmarks.bench_frontend [--rounds 20] [--mbps 10] [--batch 20]
+
+"before" is the old handler: static/index.html returned as an HTMLResponse
+with no compression or validators. "after" is main.app serving the
+minified, precompressed static/dist build. A first visit downloads the
+page; a repeat visit sends the ETag it got back (If-None-Match), so only
+"after" can answer 304. Both servers run under uvicorn, and ``--mbps``
+turns the bytes on the wire into the transfer time localhost hides. The
+last lines compare a /api/batch JSON body with and without GZipMiddleware.
+"""
+import argparse
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+from fastapi.responses import HTMLResponse
+
+from benchmarks.fake_assistant import FakeAssistant, load_app
+from benchmarks.server import serve
+from build_frontend import SOURCE_FILE, build
+
+BROWSER_HEADERS = {"Accept-Encoding": "gzip, deflate, br"}
+
+
+def before_app():
+    with open(SOURCE_FILE, encoding="utf-8") as f:
+        page = f.read()
+    app = FastAPI()
+
+    @app.get("/", response_class=HTMLResponse)
+    async def serve_frontend():
+        return page
+
+    return app
+
+
+def visit(client, headers):
+    """(status, wire bytes, seconds to first byte, seconds total, etag)."""
+    start = time.perf_counter()
+    first, size = None, 0
+    with client.stream("GET", "/", headers=headers) as response:
+        for chunk in response.iter_raw():
+            if first is None:
+                first = time.perf_counter() - start
+            size += len(chunk)
+    total = time.perf_counter() - start
+    return response.status_code, size, first if first is not None else total, total, response.headers.get("etag")
+
+
+def measure(app, rounds):
+    with serve(app) as url, httpx.Client(base_url=url) as client:
+        visit(client, BROWSER_HEADERS)  # warm up: lazy loading and compression happen once
+        first_visits = [visit(client, BROWSER_HEADERS) for _ in range(rounds)]
+        etag = first_visits[0][4]
+        repeat_headers = {**BROWSER_HEADERS, **({"If-None-Match": etag} if etag else {})}
+        repeat_visits = [visit(client, repeat_headers) for _ in range(rounds)]
+    return first_visits, repeat_visits
+
+
+def summarize(name, visits, mbps):
+    status, size = visits[0][0], visits[0][1]
+    ttfb = statistics.median(v[2] for v in visits) * 1000
+    total = statistics.median(v[3] for v in visits) * 1000
+    transfer = size * 8 / (mbps * 1e6) * 1000
+    print(f"{name:<16} {status:>6} {size:>9,} {ttfb:>8.2f} {total:>8.2f} {transfer:>11.1f}")
+
+
+def json_weight(batch):
+    main_module = load_app(FakeAssistant(latency=0))
+    payload = [{"question": f"How do I submit project {i}?"} for i in range(batch)]
+    with serve(main_module.app) as url, httpx.Client(base_url=url) as client:
+        sizes = {}
+        for encoding in ("identity", "gzip"):
+            with client.stream("POST", "/api/batch", json=payload, headers={"Accept-Encoding": encoding}) as response:
+                sizes[encoding] = sum(len(chunk) for chunk in response.iter_raw())
+    return sizes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--mbps", type=float, default=10.0, help="client bandwidth, for transfer estimates")
+    parser.add_argument("--batch", type=int, default=20, help="questions in the /api/batch JSON sample")
+    args = parser.parse_args()
+
+    sizes = build()
+    print("build: " + ", ".join(f"{name} {size:,}" for name, size in sizes.items()))
+    print(f"\n{'GET /':<16} {'status':>6} {'bytes':>9} {'ttfb ms':>8} {'total ms':>8} {'transfer ms':>11}")
+    for name, app in (("before", before_app()), ("after", load_app(FakeAssistant()).app)):
+        first_visits, repeat_visits = measure(app, args.rounds)
+        summarize(f"{name} first", first_visits, args.mbps)
+        summarize(f"{name} repeat", repeat_visits, args.mbps)
+
+    weights = json_weight(args.batch)
+    print(f"\n/api/batch x{args.batch} JSON: {weights['identity']:,} bytes identity, "
+          f"{weights['gzip']:,} bytes gzip ({weights['gzip'] / weights['identity']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
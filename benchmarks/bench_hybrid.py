@@ -0,0 +1,77 @@
+"""Link quality and latency of BM25, vector, fused and re-ranked retrieval.
+
+Usage: python -m benchmarks.bench_hybrid [--queries 300] [--k 5] [--seed 0]
+
+Two query sets, both scored on whether the expected URL is among the top
+--k distinct links (hit@k) and its reciprocal rank (MRR):
+
+* promptfoo: the tests in project-tds-virtual-ta-promptfoo.yaml that
+  assert a link (one targets a thread that is not in data/, so no method
+  can find it);
+* noisy: --queries chunks sampled from the corpus, each queried with eight
+  of its content words, some truncated to mimic inflections and typos,
+  expecting the chunk's own URL.
+"""
+import argparse
+import random
+import statistics
+import time
+
+from benchmarks.questions import promptfoo_link_cases
+from retrieval import HybridIndex, build_chunks, hit_links, load_records, tokenize
+
+
+def noisy_cases(chunks, n, rng):
+    cases = []
+    candidates = [chunk for chunk in chunks if chunk["url"] and len(set(tokenize(chunk["content"]))) >= 20]
+    for chunk in rng.sample(candidates, min(n, len(candidates))):
+        words = rng.sample(sorted(set(tokenize(chunk["content"]))), 5)
+        words = [w[:-2] if len(w) > 5 and rng.random() < 0.6 else w for w in words]
+        cases.append((" ".join(words), chunk["url"]))
+    return cases
+
+
+def evaluate(index, cases, k):
+    hits, reciprocal, latencies = 0, 0.0, []
+    for query, expected in cases:
+        start = time.perf_counter()
+        results = index.search(query, k=k * 4)
+        latencies.append(time.perf_counter() - start)
+        urls = [link["url"] for link in hit_links(results, limit=k)]
+        rank = next((i for i, url in enumerate(urls, start=1) if expected in url), None)
+        if rank:
+            hits += 1
+            reciprocal += 1 / rank
+    return hits / len(cases), reciprocal / len(cases), statistics.median(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=300, help="noisy queries sampled from the corpus")
+    parser.add_argument("--k", type=int, default=5, help="links returned per query")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    chunks = build_chunks(load_records())
+    hybrid = HybridIndex.from_chunks(chunks)
+    print(f"{len(chunks)} chunks indexed (BM25 + vectors) in {(time.perf_counter() - start) * 1000:.0f}ms")
+    methods = {
+        "bm25": hybrid.bm25,
+        "vector": hybrid.vectors,
+        "rrf": HybridIndex(hybrid.bm25, hybrid.vectors, rerank_depth=0),
+        "rrf+rerank": hybrid,
+    }
+    query_sets = {
+        "promptfoo": promptfoo_link_cases(),
+        "noisy": noisy_cases(chunks, args.queries, random.Random(args.seed)),
+    }
+    for name, cases in query_sets.items():
+        print(f"\n{name} ({len(cases)} queries) {f'hit@{args.k}':>8} {'MRR':>6} {'p50 ms':>7}")
+        for method, index in methods.items():
+            hit_rate, mrr, p50 = evaluate(index, cases, args.k)
+            print(f"{method:>{len(name) + 13}} {hit_rate:>8.1%} {mrr:>6.3f} {p50:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
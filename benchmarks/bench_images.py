@@ -0,0 +1,104 @@
+"""Payload size and latency of image questions with and without server-side downscaling.
+
+Usage: python -m benchmarks.bench_images [--size 4000x3000] [--requests 20] [--mbps 20]
+
+A synthetic photo-like image (gradient plus smoothed noise, so it
+compresses roughly like a real photo) is sent to /api/ three ways:
+full-resolution with IMAGE_MAX_DIMENSION raised so nothing is resized,
+full-resolution with the default limit (server-side downscaling), and
+already resized the way the frontend now does it. The forwarded payload
+is captured from the fake assistant; ``--mbps`` turns request and
+forwarded sizes into the transfer time an in-process run cannot see.
+"""
+import argparse
+import asyncio
+import base64
+import io
+import random
+import statistics
+import time
+
+import httpx
+from PIL import Image
+
+from benchmarks.fake_assistant import FakeAssistant, load_app
+from images import process_image
+
+
+class RecordingAssistant(FakeAssistant):
+    """FakeAssistant that remembers how many base64 bytes each image carried."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.image_bytes = []
+
+    def chat(self, messages, stream=False, **kwargs):
+        image = messages[-1].get("image")
+        if image:
+            self.image_bytes.append(len(image["data"]))
+        return super().chat(messages, stream=stream, **kwargs)
+
+
+def synthetic_photo(width, height, seed=0):
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient("L").resize((width, height))
+    # Coarse noise upscaled: smooth texture with detail, unlike pure noise
+    small = (max(width // 4, 1), max(height // 4, 1))
+    noise = Image.frombytes("L", small, rng.randbytes(small[0] * small[1])).resize((width, height), Image.BICUBIC)
+    rgb = Image.merge("RGB", (gradient, noise, Image.blend(gradient, noise, 0.5)))
+    buffer = io.BytesIO()
+    rgb.save(buffer, format="JPEG", quality=90)
+    return base64.b64encode(buffer.getvalue()).decode("ascii")
+
+
+async def time_requests(main_module, payload, n):
+    transport = httpx.ASGITransport(app=main_module.app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        for _ in range(n):
+            start = time.perf_counter()
+            response = await client.post("/api/", json=payload)
+            latencies.append(time.perf_counter() - start)
+            assert response.status_code == 200, response.text
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", default="4000x3000", help="synthetic image WIDTHxHEIGHT")
+    parser.add_argument("--requests", type=int, default=20)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake assistant latency in seconds")
+    parser.add_argument("--mbps", type=float, default=20.0, help="link speed, for transfer-time estimates")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    image = synthetic_photo(width, height)
+    start = time.perf_counter()
+    processed = process_image(image)
+    process_ms = (time.perf_counter() - start) * 1000
+    print(f"input {width}x{height}: {len(image) / 1e6:.2f} MB base64; "
+          f"process_image {process_ms:.0f} ms -> {processed.width}x{processed.height}, "
+          f"{len(processed.data) / 1e6:.3f} MB base64")
+
+    question = "What does this screenshot show?"
+    modes = (
+        ("full-res", image, 10 ** 6),
+        ("server", image, None),
+        ("client", processed.data, None),
+    )
+    print(f"{'mode':<10} {'request MB':>10} {'forwarded MB':>12} {'transfer ms':>11} {'p50 ms':>8} {'max ms':>8}")
+    for mode, data, max_dimension in modes:
+        fake = RecordingAssistant(latency=args.latency)
+        main_module = load_app(fake)
+        main_module.answer_cache = None
+        if max_dimension:
+            main_module.IMAGE_MAX_DIMENSION = max_dimension
+        payload = {"question": question, "image": data}
+        latencies = asyncio.run(time_requests(main_module, payload, args.requests))
+        forwarded = statistics.mean(fake.image_bytes)
+        transfer_ms = (len(data) + forwarded) * 8 / (args.mbps * 1e6) * 1000
+        print(f"{mode:<10} {len(data) / 1e6:>10.3f} {forwarded / 1e6:>12.3f} {transfer_ms:>11.0f} "
+              f"{statistics.median(latencies) * 1000:>8.1f} {max(latencies) * 1000:>8.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Per-request CPU of the answer decode/validate/serialize path, old vs new.
+
+Usage: python -m benchmarks.bench_json [--iterations 20000] [--links 5] [--requests 2000]
+
+"old" replays what /api/ used to do with the assistant's JSON string:
+json.loads, QueryResponse(**data), then FastAPI's response_model pass
+(validate the returned model again, dump it) and the stdlib JSONResponse
+encoder. "new" is answers.loads + validate_answer + answers.dumps. The
+last line times whole cached /api/ requests in-process, to put the
+per-answer saving in proportion to a request's total CPU.
+"""
+import argparse
+import asyncio
+import json
+import time
+
+import httpx
+
+from answers import dumps, loads, orjson, validate_answer
+from benchmarks.fake_assistant import FakeAssistant, load_app
+
+
+def sample_content(n_links):
+    return json.dumps({
+        "answer": "Use Docker Desktop or Podman; the course accepts either. " * 6,
+        "links": [{"url": f"https://discourse.onlinedegree.iitm.ac.in/t/topic/{i}", "text": f"Post {i} about it"}
+                  for i in range(n_links)],
+    })
+
+
+def old_path(model, content):
+    response = model(**json.loads(content))
+    # FastAPI: serialize the returned model, validate against response_model, dump, encode
+    validated = model.model_validate(response.model_dump())
+    return json.dumps(validated.model_dump(mode="json"), ensure_ascii=False, allow_nan=False,
+                      indent=None, separators=(",", ":")).encode("utf-8")
+
+
+def new_path(content):
+    return dumps(validate_answer(loads(content)))
+
+
+def per_call_us(fn, iterations):
+    start = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - start) / iterations * 1e6
+
+
+async def cached_requests(main_module, n):
+    transport = httpx.ASGITransport(app=main_module.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        payload = {"question": "Should I use Docker or Podman?"}
+        await client.post("/api/", json=payload)  # warm the cache
+        start = time.process_time()
+        for _ in range(n):
+            await client.post("/api/", json=payload)
+        return (time.process_time() - start) / n * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--links", type=int, default=5, help="links per answer")
+    parser.add_argument("--requests", type=int, default=2000, help="cached /api/ requests to time")
+    args = parser.parse_args()
+
+    main_module = load_app(FakeAssistant(latency=0))
+    content = sample_content(args.links)
+    old_us = per_call_us(lambda: old_path(main_module.QueryResponse, content), args.iterations)
+    new_us = per_call_us(lambda: new_path(content), args.iterations)
+    print(f"encoder: {'orjson' if orjson else 'stdlib json'}, answer {len(content)} bytes, {args.links} links")
+    print(f"{'path':<6} {'us/answer':>10} {'cores @1k rps':>14}")
+    for name, us in (("old", old_us), ("new", new_us)):
+        print(f"{name:<6} {us:>10.1f} {us * 1000 / 1e6:>14.3f}")
+    print(f"saved  {old_us - new_us:>10.1f} us/answer ({old_us / new_us:.1f}x)")
+
+    request_us = asyncio.run(cached_requests(main_module, args.requests))
+    print(f"cached /api/ request end to end: {request_us:.0f} us CPU "
+          f"({1e6 / request_us:.0f} req/s per core, in-process)")
+
+
+if __name__ == "__main__":
+    main()
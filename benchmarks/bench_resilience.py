@@ -0,0 +1,91 @@
+"""Tail latency and success rate against a faulty upstream, per resilience policy.
+
+Usage: python -m benchmarks.bench_resilience [--requests 300] [--concurrency 8]
+         [--latency 0.1] [--error-rate 0.05] [--hang-rate 0.02] [--hang-seconds 3]
+
+The fake assistant answers with lognormal latency, fails a share of calls
+with a transient error and stalls on another share. The same load runs
+under: no deadline or retries (the old behaviour), deadline + jittered
+retries, and that plus hedging at the observed p95. A last run simulates
+a full outage to show the circuit breaker failing fast with the local
+fallback.
+"""
+import argparse
+import asyncio
+import time
+
+import httpx
+
+from benchmarks.fake_assistant import FakeAssistant, load_app
+from benchmarks.load_test import percentile
+from upstream import ChatExecutor, CircuitBreaker, UpstreamPolicy
+
+
+async def run_load(main_module, total, concurrency):
+    transport = httpx.ASGITransport(app=main_module.app)
+    latencies, statuses = [], []
+    remaining = total
+
+    async def worker(client):
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            start = time.perf_counter()
+            response = await client.post("/api/", json={"question": f"question {remaining}"})
+            latencies.append(time.perf_counter() - start)
+            statuses.append(response.status_code)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    return latencies, statuses
+
+
+def report(name, latencies, statuses, fake):
+    ms = [s * 1000 for s in latencies]
+    ok = statuses.count(200)
+    print(f"{name:<22} {ok / len(statuses):>7.1%} {percentile(ms, 50):>8.0f} {percentile(ms, 95):>8.0f} "
+          f"{percentile(ms, 99):>8.0f} {fake.calls / len(statuses):>6.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.1, help="fake assistant mean latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--hang-rate", type=float, default=0.02)
+    parser.add_argument("--hang-seconds", type=float, default=3.0)
+    parser.add_argument("--timeout", type=float, default=1.0, help="per-attempt deadline for the resilient runs")
+    args = parser.parse_args()
+
+    policies = (
+        ("no deadline/retries", dict(timeout=3600, retries=0, hedge_after=None)),
+        ("deadline + retries", dict(timeout=args.timeout, retries=2, hedge_after=None)),
+        ("+ hedge at p95", dict(timeout=args.timeout, retries=2, hedge_after="p95")),
+    )
+    print(f"{args.requests} requests at concurrency {args.concurrency}; upstream mean {args.latency}s, "
+          f"{args.error_rate:.0%} errors, {args.hang_rate:.0%} hangs of {args.hang_seconds}s")
+    print(f"{'policy':<22} {'success':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'calls':>6}")
+    for name, settings in policies:
+        fake = FakeAssistant(latency=args.latency, distribution="lognormal", error_rate=args.error_rate,
+                             hang_rate=args.hang_rate, hang_seconds=args.hang_seconds)
+        main_module = load_app(fake)
+        main_module.answer_cache = None
+        main_module.chat_executor = ChatExecutor(max_concurrency=args.concurrency * 2, max_queue=args.concurrency * 8)
+        main_module.upstream = UpstreamPolicy(main_module.chat_executor, backoff=0.05,
+                                              breaker=CircuitBreaker(failure_threshold=10 ** 6), **settings)
+        latencies, statuses = asyncio.run(run_load(main_module, args.requests, args.concurrency))
+        report(name, latencies, statuses, fake)
+
+    fake = FakeAssistant(latency=args.latency, error_rate=1.0)
+    main_module = load_app(fake)
+    main_module.answer_cache = None
+    main_module.UPSTREAM_FALLBACK = "local"
+    main_module.upstream = UpstreamPolicy(main_module.chat_executor, timeout=args.timeout, retries=2, backoff=0.05,
+                                          breaker=CircuitBreaker(failure_threshold=5, reset_timeout=60))
+    latencies, statuses = asyncio.run(run_load(main_module, args.requests, args.concurrency))
+    report("outage, breaker+local", latencies, statuses, fake)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Latency of the local retrieval backend vs the remote Pinecone assistant.
+
+Usage: python -m benchmarks.bench_retrieval [--rounds 50]
+
+The remote path is only measured when ``pinecone_api_key`` is set.
+"""
+import argparse
+import os
+import statistics
+import time
+
+from dotenv import load_dotenv
+
+from benchmarks.questions import promptfoo_questions
+from retrieval import LocalAssistant
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+def report(name, samples):
+    ms = [s * 1000 for s in samples]
+    print(f"{name:>8}: n={len(ms)} mean={statistics.mean(ms):.2f}ms "
+          f"p50={percentile(ms, 50):.2f}ms p95={percentile(ms, 95):.2f}ms")
+
+
+def time_calls(assistant, questions, rounds):
+    samples = []
+    for _ in range(rounds):
+        for q in questions:
+            start = time.perf_counter()
+            assistant.chat(messages=[{"role": "user", "content": q}])
+            samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rounds", type=int, default=50, help="passes over the question set (local)")
+    parser.add_argument("--remote-rounds", type=int, default=1, help="passes over the question set (remote)")
+    args = parser.parse_args()
+
+    load_dotenv()
+    questions = promptfoo_questions()
+
+    start = time.perf_counter()
+    local = LocalAssistant.from_corpus()
+    print(f"local index: {len(local.index.chunks)} chunks built in {(time.perf_counter() - start) * 1000:.0f}ms")
+    report("local", time_calls(local, questions, args.rounds))
+
+    if os.getenv("pinecone_api_key"):
+        from pinecone import Pinecone
+        remote = Pinecone(api_key=os.getenv("pinecone_api_key")).assistant.Assistant(
+            assistant_name="tds-virtual-assistant"
+        )
+        report("remote", time_calls(remote, questions, args.remote_rounds))
+    else:
+        print("  remote: skipped (pinecone_api_key not set)")
+
+
+if __name__ == "__main__":
+    main()
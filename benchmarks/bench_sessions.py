@@ -0,0 +1,127 @@
+"""Multi-turn sessions: payload and latency per turn, and memory per active session.
+
+Usage: python -m benchmarks.bench_sessions [--turns 30] [--sessions 2000] [--budget 1500] [--sqlite]
+
+The first table holds one conversation of --turns questions against /api/
+(fake assistant, no network delay) and reports, at a few turns, the
+messages sent upstream and the server-side time of the turn. "unbounded"
+is what resending the whole history would cost; "session" is the
+token-budgeted window plus summary the app actually sends. The second
+measures the memory (tracemalloc) held by --sessions conversations of
+--turns turns each, in the in-memory store.
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+import httpx
+
+from benchmarks.fake_assistant import FakeAssistant, load_app
+from sessions import SessionManager
+
+ANSWER = (
+    "You can submit the project through the course portal before the deadline. "
+    "Make sure the repository is public, the README explains how to run it and the "
+    "Docker image builds without errors; late submissions lose 25% of the marks. "
+) * 2
+REPORT_TURNS = (1, 2, 5, 10, 20, 30, 50, 100)
+
+
+class RecordingAssistant(FakeAssistant):
+    """FakeAssistant that remembers the size of every messages list it was sent."""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.payloads = []
+
+    def chat(self, messages, stream=False, **kwargs):
+        self.payloads.append(len(json.dumps(messages)))
+        self.answer = answer(len(self.payloads) - 1)
+        return super().chat(messages, stream=stream, **kwargs)
+
+
+def unbounded_bytes(turn):
+    """Size of the messages list when every earlier turn is resent verbatim."""
+    messages = []
+    for i in range(turn - 1):
+        messages.append({"role": "user", "content": question(i)})
+        messages.append({"role": "assistant", "content": answer(i)})
+    messages.append({"role": "user", "content": question(turn - 1)})
+    return len(json.dumps(messages))
+
+
+def answer(i):
+    return f"({i}) {ANSWER}"
+
+
+def question(i):
+    return f"Follow-up {i}: what about the deadline for project {i % 3 + 1}, and is Docker required?"
+
+
+async def conversation(main_module, turns):
+    transport = httpx.ASGITransport(app=main_module.app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        session_id = (await client.post("/api/session")).json()["session_id"]
+        for i in range(turns):
+            start = time.perf_counter()
+            response = await client.post("/api/", json={"question": question(i), "session_id": session_id})
+            latencies.append(time.perf_counter() - start)
+            response.raise_for_status()
+    return latencies
+
+
+def session_memory(manager, sessions, turns):
+    """Bytes allocated per session while ``sessions`` conversations of ``turns`` turns are held."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for s in range(sessions):
+        for i in range(turns):
+            manager.record(f"session-{s}", question(i), answer(i))
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return (after - before) / sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=30)
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--budget", type=int, default=1500, help="SESSION_TOKEN_BUDGET")
+    parser.add_argument("--sqlite", action="store_true", help="keep sessions in SQLite (SESSION_PATH)")
+    args = parser.parse_args()
+
+    os.environ["ANSWER_CACHE_SIZE"] = "0"
+    os.environ["SESSION_TOKEN_BUDGET"] = str(args.budget)
+    tmp = tempfile.TemporaryDirectory()
+    if args.sqlite:
+        os.environ["SESSION_PATH"] = os.path.join(tmp.name, "sessions.db")
+    fake = RecordingAssistant(latency=0, answer=ANSWER)
+    main_module = load_app(fake)
+    latencies = asyncio.run(conversation(main_module, args.turns))
+
+    store = "sqlite" if args.sqlite else "memory"
+    print(f"{args.turns} turns, token budget {args.budget}, {store} store")
+    print(f"{'turn':>5} {'unbounded bytes':>16} {'session bytes':>14} {'~tokens':>8} {'turn ms':>8}")
+    for turn in REPORT_TURNS:
+        if turn > args.turns:
+            break
+        sent = fake.payloads[turn - 1]
+        print(f"{turn:>5} {unbounded_bytes(turn):>16,} {sent:>14,} {sent // 4:>8,} "
+              f"{latencies[turn - 1] * 1000:>8.2f}")
+    print(f"median turn {statistics.median(latencies) * 1000:.2f} ms, max {max(latencies) * 1000:.2f} ms")
+
+    unbounded = session_memory(SessionManager(token_budget=10 ** 9), args.sessions, args.turns)
+    bounded = session_memory(SessionManager(token_budget=args.budget), args.sessions, args.turns)
+    print(f"\nmemory per session ({args.sessions} sessions x {args.turns} turns): "
+          f"{unbounded / 1024:.1f} KiB unbounded, {bounded / 1024:.1f} KiB with the budget")
+    tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
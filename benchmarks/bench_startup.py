@@ -0,0 +1,127 @@
+"""Cold-start report: import time of main.py and time to first byte of a fresh server.
+
+Usage: python -m benchmarks.bench_startup [--runs 5] [--top 15] [--output startup.json]
+         [--baseline previous.json] [--tolerance 0.2]
+
+Each run is a new interpreter, like a serverless cold start. The import
+breakdown comes from ``python -X importtime -c "import main"`` (cumulative
+microseconds per module, as in the importtime output); the time to first
+byte starts uvicorn and polls GET / until it answers. With --baseline, an
+import or first-byte time more than --tolerance slower exits non-zero.
+"""
+import argparse
+import http.client
+import json
+import os
+import platform
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.server import free_port
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def import_profile():
+    """(main's cumulative us, [(cumulative_us, self_us, module)] it imports directly).
+
+    importtime lists modules after their children, so main's direct imports
+    are the depth-1 lines between the previous top-level entry and "main";
+    modules the interpreter loaded before (site, .pth hooks) are excluded.
+    """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                            cwd=ROOT, capture_output=True, text=True, check=True)
+    entries = []
+    for match in IMPORTTIME_RE.finditer(result.stderr):
+        self_us, cumulative_us, indent, module = match.groups()
+        entries.append((int(cumulative_us), int(self_us), module, (len(indent) - 1) // 2))
+    end = next(i for i, entry in enumerate(entries) if entry[2] == "main" and entry[3] == 0)
+    direct = []
+    for cumulative, self_us, module, depth in reversed(entries[:end]):
+        if depth == 0:
+            break
+        if depth == 1:
+            direct.append((cumulative, self_us, module))
+    return entries[end][0], direct
+
+
+def import_wall_seconds():
+    code = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def first_byte_seconds(path="/", timeout=30.0):
+    """Seconds from spawning uvicorn until ``path`` returns its first response byte."""
+    port = free_port()
+    start = time.perf_counter()
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "main:app", "--port", str(port),
+                               "--log-level", "warning"], cwd=ROOT)
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=timeout)
+                conn.request("GET", path, headers={"Accept-Encoding": "br, gzip"})
+                response = conn.getresponse()
+                response.read(1)
+                conn.close()
+                return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.005)
+        raise TimeoutError(f"server did not answer {path} within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="slowest modules to list")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="previous --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+
+    total_us, direct = import_profile()
+    print(f"import main: {total_us / 1000:.1f} ms cumulative (-X importtime)")
+    print(f"{'cumulative ms':>13} {'self ms':>8}  module")
+    for cumulative, self_us, module in sorted(direct, reverse=True)[:args.top]:
+        print(f"{cumulative / 1000:>13.1f} {self_us / 1000:>8.1f}  {module}")
+
+    imports = [import_wall_seconds() for _ in range(args.runs)]
+    first_bytes = [first_byte_seconds() for _ in range(args.runs)]
+    results = {
+        "import_ms": statistics.median(imports) * 1000,
+        "first_byte_ms": statistics.median(first_bytes) * 1000,
+    }
+    print(f"\nmedian of {args.runs} runs: import {results['import_ms']:.0f} ms, "
+          f"spawn to first byte of / {results['first_byte_ms']:.0f} ms")
+
+    if args.output:
+        report = {
+            "python": platform.python_version(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "results": results,
+            "modules": {module: cumulative for cumulative, _, module in direct},
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            previous = json.load(f)["results"]
+        found = [f"{name}: {previous[name]:.0f} -> {value:.0f}" for name, value in results.items()
+                 if name in previous and value > previous[name] * (1 + args.tolerance)]
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Startup time and per-worker memory: corpus JSON in dicts vs the memory-mapped store.
+
+Usage: python -m benchmarks.bench_store [--workers 4] [--dtype float32]
+
+Each mode runs in --workers processes at once, like uvicorn workers on one
+host. Each process loads the corpus and its BM25 index, runs one vector
+query (so every vector page is touched) and one BM25 query, then reports
+its load time and how much its RSS and PSS grew (from
+/proc/self/smaps_rollup, Linux only). PSS charges shared pages to each
+process in proportion, which shows that mapped pages are shared across
+workers:
+
+* json-lists: data/*.json parsed into dicts, vectors as lists of floats;
+* json-numpy: data/*.json parsed into dicts, vectors in a private NumPy array;
+* mmap: vector_store.open_store (staleness check included) with its mapped
+  BM25 postings, built first into a temporary directory.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from benchmarks.bench_startup import ROOT
+from vector_store import build_store
+
+CHILD = r"""
+import json, sys, time
+import numpy as np
+from embeddings import HashingEmbedder, chunk_text
+
+def memory_kib():
+    fields = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if parts[0] in ("Rss:", "Pss:"):
+                fields[parts[0][:-1].lower()] = int(parts[1])
+    return fields
+
+mode, store_dir = sys.argv[1], sys.argv[2]
+embedder = HashingEmbedder()
+query = embedder.embed_one("docker podman course")
+before = memory_kib()
+start = time.perf_counter()
+if mode == "mmap":
+    from vector_store import open_store
+    store = open_store(store_dir)
+    chunks, vectors, bm25 = store.chunks, store.vectors, store.bm25()
+else:
+    from retrieval import BM25Index, build_chunks, load_records
+    chunks = build_chunks(load_records())
+    bm25 = BM25Index(chunks)
+    vectors = np.load(store_dir + "/vectors.npy")
+    if mode == "json-lists":
+        vectors = vectors.tolist()
+load_seconds = time.perf_counter() - start
+if mode == "json-lists":
+    best = max(range(len(vectors)), key=lambda i: sum(a * b for a, b in zip(vectors[i], query)))
+else:
+    best = int(np.argmax(vectors @ query))
+chunks[best]["content"]
+bm25.search("docker podman course")
+print("ready", flush=True)
+sys.stdin.readline()
+after = memory_kib()
+print(json.dumps({"load_ms": load_seconds * 1000, "rss_kib": after["rss"] - before["rss"],
+                  "pss_kib": after["pss"] - before["pss"]}), flush=True)
+"""
+
+
+def run_mode(mode, store_dir, workers):
+    procs = [subprocess.Popen([sys.executable, "-c", CHILD, mode, store_dir], cwd=ROOT, text=True,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE) for _ in range(workers)]
+    for proc in procs:  # all loaded and resident before anyone measures
+        assert proc.stdout.readline().strip() == "ready"
+    results = []
+    for proc in procs:
+        proc.stdin.write("\n")
+        proc.stdin.flush()
+        results.append(json.loads(proc.stdout.readline()))
+    for proc in procs:
+        proc.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32")
+    args = parser.parse_args()
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        sys.exit("needs /proc/self/smaps_rollup (Linux)")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store_dir = os.path.join(tmp, "index")
+        count = build_store(store_dir, dtype=args.dtype, cache_path=None).total
+        size = sum(os.path.getsize(os.path.join(store_dir, name)) for name in os.listdir(store_dir)
+                   if os.path.isfile(os.path.join(store_dir, name)))
+        print(f"{count} chunks, store {size / 1024:,.0f} KiB ({args.dtype}), {args.workers} workers")
+        print(f"{'mode':<12} {'load ms':>8} {'RSS KiB/worker':>15} {'PSS KiB/worker':>15}")
+        for mode in ("json-lists", "json-numpy", "mmap"):
+            results = run_mode(mode, store_dir, args.workers)
+            print(f"{mode:<12} {statistics.median(r['load_ms'] for r in results):>8.1f} "
+                  f"{statistics.median(r['rss_kib'] for r in results):>15,.0f} "
+                  f"{statistics.median(r['pss_kib'] for r in results):>15,.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Time to first byte of /api/ vs /api/stream against a fake assistant.
+
+Usage: python -m benchmarks.bench_streaming [--latency 1.0] [--rounds 5]
+"""
+import argparse
+import statistics
+import time
+
+import httpx
+
+from benchmarks.fake_assistant import FakeAssistant, load_app
+from benchmarks.server import serve
+
+
+def measure(client, path, question):
+    """Return (seconds to first body byte, seconds to last byte)."""
+    start = time.perf_counter()
+    first = None
+    with client.stream("POST", path, json={"question": question}) as response:
+        for _ in response.iter_raw():
+            if first is None:
+                first = time.perf_counter() - start
+    return first, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--latency", type=float, default=1.0, help="fake assistant generation time in seconds")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    main_module = load_app(FakeAssistant(latency=args.latency, answer="word " * 200))
+    main_module.answer_cache = None
+
+    with serve(main_module.app) as base_url, httpx.Client(base_url=base_url, timeout=None) as client:
+        print(f"latency={args.latency}s rounds={args.rounds}")
+        for path in ("/api/", "/api/stream"):
+            samples = [measure(client, path, f"question {i}") for i in range(args.rounds)]
+            ttfb = statistics.median(s[0] for s in samples) * 1000
+            total = statistics.median(s[1] for s in samples) * 1000
+            print(f"{path:>12}: ttfb p50={ttfb:.0f}ms total p50={total:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""Throughput of upload_corpus.sync against a fake assistant.
+
+Usage: python -m benchmarks.bench_upload [--upload-latency 0.05]
+
+Runs a full upload at several worker counts, then an incremental re-run
+with one changed and one removed document to show only those are touched.
+"""
+import argparse
+import os
+
+from benchmarks.fake_assistant import FakeAssistant
+from retrieval import DATA_DIR, data_files, iter_json_records
+from upload_corpus import build_documents, report, sync
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--upload-latency", type=float, default=0.05, help="fake seconds per upload")
+    parser.add_argument("--workers", default="1,4,16", help="comma-separated worker counts")
+    args = parser.parse_args()
+
+    records = [record for name in data_files() for record in iter_json_records(os.path.join(DATA_DIR, name))]
+    documents = build_documents(records)
+    print(f"{len(documents)} documents")
+    for workers in (int(w) for w in args.workers.split(",")):
+        fake, manifest = FakeAssistant(upload_latency=args.upload_latency), {}
+        print(f"full upload, workers={workers}:")
+        report(sync(fake, documents, manifest, workers=workers))
+
+    records[0] = {**records[0], "content": records[0]["content"] + "\nEdited."}
+    documents = build_documents(records)
+    documents.popitem()
+    print("incremental re-run (1 changed, 1 removed):")
+    report(sync(fake, documents, manifest, workers=workers))
+    assert len(fake.files) == len(documents), (len(fake.files), len(documents))
+
+
+if __name__ == "__main__":
+    main()
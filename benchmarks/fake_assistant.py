@@ -0,0 +1,121 @@
+import importlib
+import json
+import math
+import random
+import sys
+import threading
+import time
+import uuid
+
+from streaming import content_chunks
+
+
+# Ways real assistant replies miss the strict {"answer", "links"} format
+MALFORMED = {
+    "fenced": lambda content: f"```json\n{content}\n```",
+    "prose": lambda content: f"Here is the answer you asked for:\n{content}\nLet me know if that helps!",
+    "trailing_comma": lambda content: content[:-2] + ",]}",
+    "truncated": lambda content: content[:len(content) * 2 // 3],
+    "plain_text": lambda content: "Use Docker, see https://tds.s-anand.net/#/docker for details.",
+}
+
+
+class FakeAssistant:
+    """Stand-in for the Pinecone assistant with injected latency.
+
+    ``latency`` is the mean delay in seconds for each ``chat`` call, drawn
+    from ``distribution``: "fixed", "uniform" (+/- ``jitter``) or
+    "lognormal" (``sigma`` controls the tail). ``error_rate`` is the chance a
+    call raises a (transient) ConnectionError instead of answering,
+    ``hang_rate`` the chance it stalls for ``hang_seconds`` first, and
+    ``malformed_rate`` the chance the reply comes back in one of the
+    MALFORMED shapes instead of strict JSON. Calls block with ``time.sleep`` just
+    like the real (synchronous) client does. With ``stream=True`` the same
+    total delay is spread over the content chunks.
+    """
+
+    def __init__(self, latency=0.2, jitter=0.0, answer="This is a fake answer.", upload_latency=0.05,
+                 distribution="uniform", sigma=0.5, error_rate=0.0, malformed_rate=0.0,
+                 hang_rate=0.0, hang_seconds=30.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.distribution = distribution
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self.malformed_rate = malformed_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+        self.answer = answer
+        self.upload_latency = upload_latency
+        self.calls = 0
+        self.files = {}
+        self._files_lock = threading.Lock()
+
+    def _delay(self):
+        if self.distribution == "lognormal" and self.latency > 0:
+            mu = math.log(self.latency) - self.sigma ** 2 / 2
+            return random.lognormvariate(mu, self.sigma)
+        if self.distribution == "fixed":
+            return self.latency
+        return max(self.latency + random.uniform(-self.jitter, self.jitter), 0)
+
+    def _content(self):
+        content = json.dumps({
+            "answer": self.answer,
+            "links": [{"url": "https://tds.s-anand.net/#/docker", "text": "Docker"}],
+        })
+        if self.malformed_rate and random.random() < self.malformed_rate:
+            return random.choice(list(MALFORMED.values()))(content)
+        return content
+
+    def _stream(self, delay):
+        chunks = list(content_chunks(self._content()))
+        # The first token arrives after a tenth of the delay, the rest trickle in
+        time.sleep(delay * 0.1)
+        for chunk in chunks:
+            yield chunk
+            time.sleep(delay * 0.9 / len(chunks))
+
+    def chat(self, messages, stream=False, **kwargs):
+        self.calls += 1
+        delay = self._delay()
+        if self.hang_rate and random.random() < self.hang_rate:
+            delay += self.hang_seconds
+        if random.random() < self.error_rate:
+            time.sleep(delay)
+            raise ConnectionError("injected upstream fault")
+        if stream:
+            return self._stream(delay)
+        time.sleep(delay)
+        return {"message": {"role": "assistant", "content": self._content()}}
+
+    # Knowledge-file API used by upload_corpus.py
+
+    def upload_bytes_stream(self, stream, file_name, metadata=None, timeout=None):
+        data = stream.read()
+        time.sleep(self.upload_latency)
+        file_id = str(uuid.uuid4())
+        with self._files_lock:
+            self.files[file_id] = {"id": file_id, "name": file_name, "metadata": metadata, "size": len(data)}
+        return self.files[file_id]
+
+    def delete_file(self, file_id, timeout=None):
+        time.sleep(self.upload_latency / 2)
+        with self._files_lock:
+            del self.files[file_id]
+
+    def list_files(self, filter=None):
+        with self._files_lock:
+            return list(self.files.values())
+
+
+def load_app(fake_assistant):
+    """Import a fresh ``main`` answering with ``fake_assistant``.
+
+    main creates its assistant lazily on first use, so setting it before any
+    request means the real client is never built.
+    """
+    sys.modules.pop("main", None)
+    main = importlib.import_module("main")
+    main.assistant = fake_assistant
+    return main
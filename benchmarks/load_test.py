@@ -0,0 +1,167 @@
+"""Load test /api/ at rising concurrency and report latency percentiles.
+
+Usage:
+  python -m benchmarks.load_test                         # in-process, stub assistant
+  python -m benchmarks.load_test --url http://host:8000  # a running server
+  python -m benchmarks.load_test --questions qs.jsonl --concurrency 1,8,32 \\
+      --output results.json --baseline previous.json
+
+Questions come from project-tds-virtual-ta-promptfoo.yaml plus an optional
+JSONL file of {"question": ..., "image": ...} lines. In-process runs go
+through httpx's ASGI transport with the assistant replaced by
+FakeAssistant, whose latency distribution and error rate are configurable.
+Results are written as JSON; with --baseline, a p95 or RPS regression
+beyond --tolerance makes the exit status non-zero.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import platform
+import sys
+import time
+
+import httpx
+
+from benchmarks.fake_assistant import FakeAssistant, load_app
+from benchmarks.questions import promptfoo_questions
+
+
+def load_questions(jsonl_path=None):
+    payloads = [{"question": q} for q in promptfoo_questions()]
+    if jsonl_path:
+        with open(jsonl_path, encoding="utf-8") as f:
+            payloads.extend(json.loads(line) for line in f if line.strip())
+    return payloads
+
+
+def percentile(samples, pct):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(int(len(ordered) * pct / 100), len(ordered) - 1)]
+
+
+async def run_level(client, payloads, concurrency, total):
+    """Fire ``total`` requests with ``concurrency`` in flight; return a result dict."""
+    latencies, errors = [], 0
+    cycle = itertools.cycle(payloads)
+    remaining = total
+
+    async def worker():
+        nonlocal remaining, errors
+        while remaining > 0:
+            remaining -= 1
+            payload = next(cycle)
+            start = time.perf_counter()
+            try:
+                response = await client.post("/api/", json=payload)
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            elapsed = time.perf_counter() - start
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - start
+    ms = [s * 1000 for s in latencies]
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "error_rate": errors / total if total else 0.0,
+        "rps": total / wall if wall else 0.0,
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": max(ms) if ms else None,
+    }
+
+
+async def run(args, payloads):
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        fake = FakeAssistant(latency=args.latency, jitter=args.latency / 2, distribution=args.distribution,
+                             sigma=args.sigma, error_rate=args.error_rate)
+        main_module = load_app(fake)
+        if not args.with_cache:
+            main_module.answer_cache = None
+        transport = httpx.ASGITransport(app=main_module.app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=args.timeout)
+
+    results = []
+    async with client:
+        for level in (int(c) for c in args.concurrency.split(",")):
+            result = await run_level(client, payloads, level, args.requests or level * 10)
+            results.append(result)
+            print(f"{result['concurrency']:>5} {result['rps']:>8.1f} {result['p50_ms'] or 0:>8.1f} "
+                  f"{result['p95_ms'] or 0:>8.1f} {result['p99_ms'] or 0:>8.1f} {result['error_rate']:>7.1%}")
+    return results
+
+
+def regressions(results, baseline, tolerance):
+    previous = {r["concurrency"]: r for r in baseline["results"]}
+    found = []
+    for result in results:
+        old = previous.get(result["concurrency"])
+        if not old:
+            continue
+        if old["p95_ms"] and result["p95_ms"] and result["p95_ms"] > old["p95_ms"] * (1 + tolerance):
+            found.append(f"c={result['concurrency']}: p95 {old['p95_ms']:.1f}ms -> {result['p95_ms']:.1f}ms")
+        if result["rps"] < old["rps"] * (1 - tolerance):
+            found.append(f"c={result['concurrency']}: rps {old['rps']:.1f} -> {result['rps']:.1f}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="base URL of a running server (default: in-process with a stub)")
+    parser.add_argument("--questions", help="extra JSONL file of request payloads")
+    parser.add_argument("--concurrency", default="1,4,16,64", help="comma-separated concurrency levels")
+    parser.add_argument("--requests", type=int, default=0, help="requests per level (default: 10 x concurrency)")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--latency", type=float, default=0.2, help="stub mean latency in seconds")
+    parser.add_argument("--distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--sigma", type=float, default=0.5, help="lognormal shape (bigger = longer tail)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="stub fault probability")
+    parser.add_argument("--with-cache", action="store_true", help="keep the answer cache enabled (stub mode)")
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="previous --output file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    args = parser.parse_args()
+
+    payloads = load_questions(args.questions)
+    print(f"{len(payloads)} questions, target={args.url or 'in-process stub'}")
+    print(f"{'conc':>5} {'rps':>8} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'errors':>7}")
+    results = asyncio.run(run(args, payloads))
+
+    report = {
+        "target": args.url or "in-process",
+        "stub": None if args.url else {
+            "latency": args.latency, "distribution": args.distribution,
+            "sigma": args.sigma, "error_rate": args.error_rate,
+        },
+        "python": platform.python_version(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            found = regressions(results, json.load(f), args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,31 @@
+import os
+import re
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROMPTFOO_FILE = os.path.join(REPO_ROOT, "project-tds-virtual-ta-promptfoo.yaml")
+
+QUESTION_RE = re.compile(r"^\s*question:\s*(.+?)\s*$", re.MULTILINE)
+
+
+def promptfoo_questions(path=PROMPTFOO_FILE):
+    """Pull the ``question:`` vars out of the promptfoo config.
+
+    A regex is enough for this file and avoids a YAML dependency.
+    """
+    with open(path, encoding="utf-8") as f:
+        return QUESTION_RE.findall(f.read())
+
+
+LINK_ASSERT_RE = re.compile(r"transform:\s*JSON\.stringify\(output\.links\)\s*\n\s*value:\s*(\S+)")
+
+
+def promptfoo_link_cases(path=PROMPTFOO_FILE):
+    """(question, expected link) pairs for the tests that assert a link."""
+    with open(path, encoding="utf-8") as f:
+        tests = f.read().split("- vars:")[1:]
+    cases = []
+    for test in tests:
+        question, link = QUESTION_RE.search(test), LINK_ASSERT_RE.search(test)
+        if question and link:
+            cases.append((question.group(1), link.group(1)))
+    return cases
@@ -0,0 +1,32 @@
+import contextlib
+import socket
+import threading
+import time
+
+import uvicorn
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextlib.contextmanager
+def serve(app):
+    """Run ``app`` under uvicorn on a background thread; yield its base URL.
+
+    Needed wherever response timing matters: httpx's ASGI transport buffers
+    the whole body, so it cannot see the first byte arrive early.
+    """
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
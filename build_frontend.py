@@ -0,0 +1,207 @@
+"""Build the chat UI: minify static/index.html and precompress it.
+
+Writes static/dist/index.html plus .gz and .br (when brotli is installed)
+variants and a manifest with the source hash, so the server can serve the
+prebuilt files without compressing at runtime and notice a stale build.
+Run it after editing static/index.html and commit static/dist.
+
+The minifiers are deliberately conservative: they strip comments and
+insignificant whitespace but keep line breaks in scripts (so automatic
+semicolon insertion behaves the same) and never touch string or
+template-literal contents.
+
+Usage: python build_frontend.py [--check]
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+
+try:
+    import brotli
+except ImportError:  # brotli is optional: only the gzip variant is built without it
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+SOURCE_FILE = os.path.join(STATIC_DIR, "index.html")
+DIST_DIR = os.path.join(STATIC_DIR, "dist")
+MANIFEST_FILE = os.path.join(DIST_DIR, "manifest.json")
+
+RAW_BLOCK_RE = re.compile(r"(<(script|style|pre|textarea)\b[^>]*>)(.*?)(</\2\s*>)", re.S | re.I)
+HTML_COMMENT_RE = re.compile(r"<!--(?!\[if).*?-->", re.S)
+CSS_COMMENT_RE = re.compile(r"/\*.*?\*/", re.S)
+REGEX_PRECEDERS = set("(,=:[!&|?{};+-*%<>~^") | {""}
+
+
+def minify_css(css):
+    css = CSS_COMMENT_RE.sub("", css)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+def minify_js(js):
+    """Drop comments, indentation and blank lines; strings and templates are copied verbatim."""
+    out = []
+    i, n = 0, len(js)
+    in_template = False
+    depth = 0
+    template_depths = []  # brace depth at which each open ${ ... } returns to its template
+
+    def last_code_char():
+        for char in reversed(out):
+            if not char.isspace():
+                return char[-1]
+        return ""
+
+    while i < n:
+        char = js[i]
+        if in_template:
+            if char == "\\":
+                out.append(js[i:i + 2])
+                i += 2
+                continue
+            out.append(char)
+            i += 1
+            if char == "`":
+                in_template = False
+            elif char == "$" and js.startswith("{", i):
+                out.append("{")
+                i += 1
+                depth += 1
+                template_depths.append(depth)
+                in_template = False
+            continue
+
+        if char in "'\"":
+            end = i + 1
+            while end < n and js[end] != char:
+                end += 2 if js[end] == "\\" else 1
+            out.append(js[i:end + 1])
+            i = end + 1
+        elif char == "`":
+            out.append(char)
+            in_template = True
+            i += 1
+        elif js.startswith("//", i):
+            while i < n and js[i] != "\n":
+                i += 1
+        elif js.startswith("/*", i):
+            end = js.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+        elif char == "/" and last_code_char() in REGEX_PRECEDERS:
+            end, in_class = i + 1, False
+            while end < n and (js[end] != "/" or in_class):
+                if js[end] == "\\":
+                    end += 1
+                elif js[end] == "[":
+                    in_class = True
+                elif js[end] == "]":
+                    in_class = False
+                end += 1
+            out.append(js[i:end + 1])
+            i = end + 1
+        elif char == "\n":
+            while out and out[-1] in (" ", "\t"):
+                out.pop()
+            if out and out[-1] != "\n":
+                out.append("\n")
+            i += 1
+            while i < n and js[i] in " \t\r":
+                i += 1
+        elif char in " \t\r":
+            if out and out[-1] not in (" ", "\n"):
+                out.append(" ")
+            i += 1
+        else:
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                if template_depths and template_depths[-1] == depth:
+                    template_depths.pop()
+                    in_template = True
+                depth -= 1
+            out.append(char)
+            i += 1
+    return "".join(out).strip()
+
+
+def minify_html(html):
+    """Collapse markup whitespace; script, style, pre and textarea blocks are handled apart."""
+    blocks = []
+
+    def stash(match):
+        open_tag, tag, body, close_tag = match.groups()
+        tag = tag.lower()
+        if tag == "script":
+            body = minify_js(body)
+        elif tag == "style":
+            body = minify_css(body)
+        blocks.append(open_tag + body + close_tag)
+        return f"\0{len(blocks) - 1}\0"
+
+    html = RAW_BLOCK_RE.sub(stash, html)
+    html = HTML_COMMENT_RE.sub("", html)
+    html = re.sub(r"([>\0])\s*\n\s*(?=[<\0])", r"\1", html)
+    html = re.sub(r"\s*\n\s*", " ", html)
+    html = re.sub(r"[ \t]{2,}", " ", html)
+    return re.sub(r"\0(\d+)\0", lambda m: blocks[int(m.group(1))], html).strip()
+
+
+def source_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def build(source=SOURCE_FILE, dist=DIST_DIR):
+    """Write the minified page and its compressed variants; returns {file name: bytes}."""
+    with open(source, "rb") as f:
+        raw = f.read()
+    minified = minify_html(raw.decode("utf-8")).encode("utf-8")
+    outputs = {"index.html": minified, "index.html.gz": gzip.compress(minified, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        outputs["index.html.br"] = brotli.compress(minified, quality=11)
+
+    os.makedirs(dist, exist_ok=True)
+    for name, data in outputs.items():
+        with open(os.path.join(dist, name), "wb") as f:
+            f.write(data)
+    manifest = {"index.html": {"source_sha256": source_hash(raw), "sha256": source_hash(minified),
+                               "encodings": sorted(name.rsplit(".", 1)[-1] for name in outputs if name != "index.html")}}
+    with open(os.path.join(dist, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.write("\n")
+    return {"source": len(raw), **{name: len(data) for name, data in outputs.items()}}
+
+
+def is_stale(source=SOURCE_FILE, manifest_file=MANIFEST_FILE):
+    """Whether static/dist is missing or was built from a different static/index.html."""
+    try:
+        with open(manifest_file, encoding="utf-8") as f:
+            manifest = json.load(f)
+        with open(source, "rb") as f:
+            return manifest["index.html"]["source_sha256"] != source_hash(f.read())
+    except (OSError, KeyError, ValueError):
+        return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Minify and precompress static/index.html into static/dist.")
+    parser.add_argument("--check", action="store_true", help="exit non-zero if static/dist is out of date")
+    args = parser.parse_args()
+
+    if args.check:
+        stale = is_stale()
+        print("static/dist is out of date: run python build_frontend.py" if stale else "static/dist is up to date")
+        sys.exit(1 if stale else 0)
+
+    sizes = build()
+    for name, size in sizes.items():
+        print(f"{name:<16} {size:>8,} bytes ({size / sizes['source']:.0%})")
+
+
+if __name__ == "__main__":
+    main()
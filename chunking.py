@@ -0,0 +1,314 @@
+"""Token-aware chunking of course pages and Discourse threads for retrieval.
+
+Pages are split along their markdown structure: a chunk never spans two
+top-level (``#``/``##``) sections, fenced code blocks stay whole unless one
+alone is over the budget, and when a section continues in a new chunk that
+chunk repeats the heading path and the last ~``overlap`` tokens of prose.
+The ``---`` front matter crawled pages start with is parsed into fields
+instead of being indexed as text.
+
+Discourse posts are grouped by topic: the opening question is chunked on
+its own, and replies are packed together under the post they answer, each
+chunk starting with a clipped copy of the question (and of the parent post
+for nested replies), so a reply found alone still says what it answers.
+
+Token counts are estimates (one per punctuation mark, one per ~6
+characters of a word), close enough to BPE counts for budgeting.
+"""
+import re
+from collections import OrderedDict
+from html import unescape
+
+CHUNK_TOKENS = 300
+OVERLAP_TOKENS = 50
+QUESTION_TOKENS = 80
+SECTION_LEVEL = 2  # headings at this level or above always start a new chunk
+
+FRONT_MATTER_RE = re.compile(r"\A\s*---\n(.*?)\n---\n", re.DOTALL)
+HEADING_RE = re.compile(r"^(#{1,6})\s+(.*?)\s*#*\s*$")
+SETEXT_RE = re.compile(r"^(=+|-+)\s*$")
+FENCE_RE = re.compile(r"^\s*(`{3,}|~{3,})")
+TOKEN_PIECE_RE = re.compile(r"\w+|[^\w\s]")
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+POST_URL_RE = re.compile(r"/(\d+)/(\d+)/?$")
+LINK_RE = re.compile(r"\[([^\]]*)\]\([^)]*\)")
+
+
+def count_tokens(text):
+    """Estimated BPE tokens in ``text``."""
+    return sum(1 + (len(piece) - 1) // 6 for piece in TOKEN_PIECE_RE.findall(text))
+
+
+def clean_field(value):
+    """Strip whitespace and the stray JSON quotes some scrapes left around values."""
+    value = unescape(str(value or "")).strip()
+    while len(value) >= 2 and value[0] == value[-1] == '"':
+        value = value[1:-1].strip()
+    return value
+
+
+def parse_front_matter(markdown):
+    """Split a crawled page into ({key: value}, body)."""
+    match = FRONT_MATTER_RE.match(markdown)
+    if not match:
+        return {}, markdown
+    fields = {}
+    for line in match.group(1).splitlines():
+        if ":" in line:
+            key, value = line.split(":", 1)
+            fields[key.strip()] = clean_field(value)
+    return fields, markdown[match.end():]
+
+
+def markdown_blocks(text):
+    """Split markdown into (kind, text, headings) blocks; kind is "heading", "code" or "text".
+
+    ``headings`` is the ((level, title), ...) path in effect at the block.
+    Paragraphs end at blank lines; fenced code blocks are one block.
+    """
+    blocks, path, paragraph = [], (), []
+    fence, code = None, []
+
+    def end_paragraph():
+        if paragraph:
+            blocks.append(("text", "\n".join(paragraph).strip(), path))
+            paragraph.clear()
+
+    for line in text.split("\n"):
+        if fence:
+            code.append(line)
+            if line.strip().startswith(fence):
+                blocks.append(("code", "\n".join(code), path))
+                fence, code = None, []
+            continue
+        match = FENCE_RE.match(line)
+        if match:
+            end_paragraph()
+            fence, code = match.group(1), [line]
+            continue
+        heading = HEADING_RE.match(line)
+        setext = SETEXT_RE.match(line) if len(paragraph) == 1 else None
+        if heading or setext:
+            if heading:
+                end_paragraph()
+                level, title, source = len(heading.group(1)), heading.group(2), line
+            else:
+                level, title = (1 if line.lstrip().startswith("=") else 2), paragraph[0].strip()
+                source = f"{'#' * level} {title}"
+                paragraph.clear()
+            path = tuple(h for h in path if h[0] < level) + ((level, LINK_RE.sub(r"\1", title)),)
+            blocks.append(("heading", source, path))
+        elif line.strip():
+            paragraph.append(line)
+        else:
+            end_paragraph()
+    end_paragraph()
+    if code:
+        blocks.append(("code", "\n".join(code), path))
+    return blocks
+
+
+def _pack(units, budget, separator):
+    """Join ``units`` into pieces of at most ``budget`` tokens, splitting any unit that is too big."""
+    pieces, current, used = [], [], 0
+    for unit in units:
+        tokens = count_tokens(unit)
+        if tokens > budget:
+            if " " in unit.strip():
+                parts = _pack(unit.split(" "), budget, " ")
+            else:  # one huge "word" (a URL, base64): cut by characters
+                width = max(budget * 4, 1)
+                parts = [unit[i:i + width] for i in range(0, len(unit), width)]
+        else:
+            parts = [unit]
+        for part in parts:
+            tokens = count_tokens(part)
+            if current and used + tokens > budget:
+                pieces.append(separator.join(current))
+                current, used = [], 0
+            current.append(part)
+            used += tokens
+    if current:
+        pieces.append(separator.join(current))
+    return pieces
+
+
+def split_block(kind, block, budget):
+    """A block as pieces of at most ``budget`` tokens: prose by sentences, code by lines."""
+    if count_tokens(block) <= budget:
+        return [block]
+    if kind == "code":
+        return _pack(block.split("\n"), budget, "\n")
+    return _pack(SENTENCE_RE.split(block), budget, " ")
+
+
+def tail_tokens(text, budget):
+    """The last whole sentences (or words) of ``text`` within ``budget`` tokens."""
+    kept, used = [], 0
+    for sentence in reversed(SENTENCE_RE.split(text)):
+        tokens = count_tokens(sentence)
+        if used + tokens > budget:
+            if not kept:
+                words = sentence.split()
+                while words and used + count_tokens(words[-1]) <= budget:
+                    used += count_tokens(words[-1])
+                    kept.insert(0, words.pop())
+                return " ".join(kept)
+            break
+        kept.insert(0, sentence)
+        used += tokens
+    return " ".join(kept)
+
+
+def clip_tokens(text, budget):
+    """The first ``budget`` tokens of ``text`` (by words), with an ellipsis when cut."""
+    words, kept, used = text.split(), [], 0
+    for word in words:
+        used += count_tokens(word)
+        if used > budget:
+            return " ".join(kept) + " ..."
+        kept.append(word)
+    return " ".join(kept)
+
+
+def chunk_markdown(text, max_tokens=CHUNK_TOKENS, overlap=OVERLAP_TOKENS):
+    """Split markdown into [(content, section)] chunks of about ``max_tokens`` tokens.
+
+    ``section`` is the heading path ("Docker > Installing") of the chunk's
+    first block. Chunks holding only headings are dropped. ``overlap`` is
+    capped at a quarter of ``max_tokens``.
+    """
+    chunks = []
+    parts, used, has_body = [], 0, False
+    last_text = ""  # most recent prose, the source of the overlap
+    section = ""
+
+    def flush():
+        nonlocal parts, used, has_body
+        if has_body:
+            chunks.append(("\n\n".join(parts).strip(), section))
+        parts, used, has_body = [], 0, False
+
+    overlap = min(overlap, max_tokens // 4)
+    budget = max(max_tokens - overlap, 1)
+    for kind, block, path in markdown_blocks(text):
+        if kind == "heading" and path[-1][0] <= SECTION_LEVEL:
+            flush()
+            last_text = ""
+        breadcrumb = " > ".join(title for _, title in path)
+        for piece in split_block(kind, block, budget):
+            tokens = count_tokens(piece)
+            if has_body and used + tokens > max_tokens:
+                flush()
+                if kind != "heading":
+                    lead = [f"({breadcrumb})"] if breadcrumb else []
+                    tail = tail_tokens(last_text, overlap) if overlap and last_text else ""
+                    if tail and count_tokens(f"({breadcrumb}) {tail} {piece}") <= max_tokens:
+                        lead.append(tail)
+                    parts, used = lead, sum(count_tokens(part) for part in lead)
+            if not parts:
+                section = breadcrumb
+            parts.append(piece)
+            used += tokens
+            if kind != "heading":
+                has_body = True
+            if kind == "text":
+                last_text = piece
+    flush()
+    return chunks
+
+
+def post_number(record):
+    """A Discourse post's number: its post_number field, else the last part of its URL."""
+    if record.get("post_number"):
+        return int(record["post_number"])
+    match = POST_URL_RE.search(record.get("url", ""))
+    return int(match.group(2)) if match else 0
+
+
+def join_pieces(posts):
+    """One record per post, in post order: pieces sharing a post number are joined by their ``chunk`` index.
+
+    Older ingest runs split long posts into several records; each piece
+    still has the post's number, so without this all but one would be lost.
+    """
+    merged = OrderedDict()
+    for index, post in enumerate(sorted(posts, key=lambda post: (post_number(post), post.get("chunk") or 0))):
+        key = post_number(post) or ("unnumbered", index)
+        if key in merged:
+            merged[key] = {**merged[key], "content": merged[key]["content"] + "\n\n" + post["content"]}
+        else:
+            merged[key] = post
+    return list(merged.values())
+
+
+def thread_chunks(posts, max_tokens=CHUNK_TOKENS, question_tokens=QUESTION_TOKENS):
+    """Chunks of one Discourse topic: the question, then its replies grouped by parent post."""
+    posts = join_pieces(posts)
+    root = posts[0]
+    title = root["title"]
+    by_number = {post_number(post): post for post in posts}
+    chunks = [{"url": root["url"], "title": title, "content": content}
+              for content, _ in chunk_markdown(root["content"], max_tokens)]
+
+    replies = OrderedDict()  # parent post number -> its replies
+    for post in posts:
+        if post is root:
+            continue
+        parent = int(post.get("reply_to_post_number") or 0)
+        replies.setdefault(parent if parent in by_number else post_number(root), []).append(post)
+
+    question = clip_tokens(root["content"], question_tokens)
+    for parent, group in replies.items():
+        header = f"Question: {question}"
+        if parent != post_number(root):
+            header += f"\n\nIn reply to: {clip_tokens(by_number[parent]['content'], question_tokens)}"
+        budget = max(max_tokens - count_tokens(header), max_tokens // 2)
+        current, used, url = [], 0, None
+        for post in group:
+            for content, _ in chunk_markdown(post["content"], budget, overlap=0):
+                tokens = count_tokens(content)
+                if current and used + tokens > budget:
+                    chunks.append({"url": url, "title": title, "content": "\n\n".join([header, *current])})
+                    current, used = [], 0
+                if not current:
+                    url = post["url"]
+                current.append(content)
+                used += tokens
+        if current:
+            chunks.append({"url": url, "title": title, "content": "\n\n".join([header, *current])})
+    return chunks
+
+
+def page_chunks(record, max_tokens=CHUNK_TOKENS, overlap=OVERLAP_TOKENS):
+    """Chunks of one course page, with its front matter moved into url/title."""
+    fields, body = parse_front_matter(record["content"])
+    url = record.get("url") or fields.get("original_url", "")
+    title = record.get("title") or fields.get("title", "")
+    return [{"url": url, "title": title, "content": content} for content, _ in chunk_markdown(body, max_tokens, overlap)]
+
+
+def chunk_records(records, max_tokens=CHUNK_TOKENS, overlap=OVERLAP_TOKENS, question_tokens=QUESTION_TOKENS):
+    """Chunk corpus records ({url, title, content}, plus topic_id for Discourse posts).
+
+    Posts are grouped by topic_id and chunked per thread; everything else is
+    chunked as a markdown page. Chunks come out in the order their first
+    record appeared.
+    """
+    groups = OrderedDict()
+    for index, record in enumerate(records):
+        key = ("topic", record["topic_id"]) if record.get("topic_id") is not None else ("page", index)
+        groups.setdefault(key, []).append(record)
+    chunks = []
+    for (kind, _), group in groups.items():
+        if kind == "topic":
+            chunks.extend(thread_chunks(group, max_tokens, question_tokens))
+        else:
+            chunks.extend(page_chunks(group[0], max_tokens, overlap))
+    return chunks
+
+
+def settings():
+    """Chunking parameters, recorded with built indexes so a change makes them stale."""
+    return {"max_tokens": CHUNK_TOKENS, "overlap": OVERLAP_TOKENS, "question_tokens": QUESTION_TOKENS,
+            "section_level": SECTION_LEVEL}
@@ -1,8 +1,14 @@
 import requests
 import os
 import json
+import argparse
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone # Ensure timezone is imported
 from urllib.parse import urljoin, urlencode
+from requests.adapters import HTTPAdapter
 
 # ========== CONFIGURATION ==========
 
@@ -15,9 +21,17 @@ END_DATE = "2025-04-15"   # Inclusive
 RAW_COOKIE_STRING = """""" # Replace with your actual cookie string
 
 OUTPUT_DIR = "discourse_json"
+STATE_FILE = "discourse_sync_state.json" # Per-topic watermarks for --incremental runs
 POST_ID_BATCH_SIZE = 50
 MAX_CONSECUTIVE_PAGES_WITHOUT_NEW_TOPICS = 5 # New configuration for breaking loop
 
+WORKERS = 8                 # Topics downloaded in parallel
+REQUESTS_PER_SECOND = 4.0   # Token-bucket rate limit shared by all workers
+BURST = 8                   # Requests allowed back-to-back before throttling
+MAX_RETRIES = 5             # Retries on 429/5xx and connection errors
+BACKOFF_SECONDS = 1.0       # Base for exponential backoff between retries
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
 # ====================================
 
 def parse_cookie_string(raw_cookie_string):
@@ -33,8 +47,77 @@ def parse_cookie_string(raw_cookie_string):
     return cookies
 
 
-def get_topic_ids(base_url, category_slug, category_id, start_date_str, end_date_str, cookies):
-    """Fetches topic IDs from a specific category within a date range."""
+class TokenBucket:
+    """Thread-safe token bucket: `rate` requests per second, bursts up to `capacity`."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+rate_limiter = TokenBucket(REQUESTS_PER_SECOND, BURST)
+
+
+def build_session(cookies, pool_size=WORKERS):
+    """Creates a Session whose connection pool is shared by all workers (one TLS handshake per connection)."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.cookies.update(cookies)
+    return session
+
+
+def fetch(session, url, params=None, timeout=30):
+    """GETs a URL through the rate limiter, retrying 429/5xx and connection errors with jittered backoff."""
+    for attempt in range(MAX_RETRIES + 1):
+        rate_limiter.acquire()
+        try:
+            response = session.get(url, params=params, timeout=timeout)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == MAX_RETRIES:
+                raise
+            delay = BACKOFF_SECONDS * 2 ** attempt
+            print(f"Request to {url} failed ({e}), retrying in {delay:.1f}s...")
+        else:
+            if response.status_code not in RETRY_STATUS_CODES or attempt == MAX_RETRIES:
+                response.raise_for_status()
+                return response
+            retry_after = response.headers.get("Retry-After", "")
+            delay = float(retry_after) if retry_after.isdigit() else BACKOFF_SECONDS * 2 ** attempt
+            print(f"Got HTTP {response.status_code} from {url}, retrying in {delay:.1f}s...")
+        time.sleep(delay + random.uniform(0, delay / 2))
+
+
+def parse_discourse_date(value):
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def get_topic_ids(base_url, category_slug, category_id, start_date_str, end_date_str, session,
+                  topic_summaries=None, stop_before=None):
+    """Fetches topic IDs from a specific category within a date range.
+
+    If `topic_summaries` is a dict, it is filled with each topic's
+    bumped_at/last_posted_at/highest_post_number from the listing. If
+    `stop_before` is a datetime, paging stops at the first page whose
+    unpinned topics were all bumped before it (the listing is sorted by
+    bumped_at, so nothing older can have changed).
+    """
     url = urljoin(base_url, f"c/{category_slug}/{category_id}.json")
     topic_ids = []
     page = 0
@@ -53,8 +136,7 @@ def get_topic_ids(base_url, category_slug, category_id, start_date_str, end_date
     while True:
         paginated_url = f"{url}?page={page}"
         try:
-            response = requests.get(paginated_url, cookies=cookies, timeout=30)
-            response.raise_for_status()
+            response = fetch(session, paginated_url, timeout=30)
         except requests.exceptions.RequestException as e:
             print(f"Failed to fetch page {page}: {e}")
             break
@@ -79,13 +161,19 @@ def get_topic_ids(base_url, category_slug, category_id, start_date_str, end_date
             created_at_str = topic.get("created_at")
             if created_at_str:
                 try:
-                    created_date = datetime.fromisoformat(created_at_str.replace("Z", "+00:00"))
+                    created_date = parse_discourse_date(created_at_str)
                 except ValueError:
                     print(f"Warning: Could not parse date '{created_at_str}' for topic ID {topic.get('id')}")
                     continue
 
                 if start_dt <= created_date <= end_dt:
                     topic_ids.append(topic["id"]) # Add ID, will be deduped later for count
+                    if topic_summaries is not None:
+                        topic_summaries[topic["id"]] = {
+                            "bumped_at": topic.get("bumped_at"),
+                            "last_posted_at": topic.get("last_posted_at"),
+                            "highest_post_number": topic.get("highest_post_number"),
+                        }
 
         current_unique_topic_count = len(set(topic_ids))
 
@@ -105,6 +193,13 @@ def get_topic_ids(base_url, category_slug, category_id, start_date_str, end_date
 
         last_known_unique_topic_count = current_unique_topic_count
 
+        if stop_before is not None:
+            bumped = [parse_discourse_date(t["bumped_at"]) for t in topics_on_page
+                      if t.get("bumped_at") and not t.get("pinned")]
+            if bumped and max(bumped) <= stop_before:
+                print(f"Page {page} has nothing bumped since {stop_before}. Stopping incremental listing.")
+                break
+
         if consecutive_pages_with_no_new_unique_topics >= MAX_CONSECUTIVE_PAGES_WITHOUT_NEW_TOPICS:
             print(f"No new unique topics found for {MAX_CONSECUTIVE_PAGES_WITHOUT_NEW_TOPICS} consecutive pages. Assuming end of relevant category listing.")
             break
@@ -127,14 +222,17 @@ def get_topic_ids(base_url, category_slug, category_id, start_date_str, end_date
     return final_unique_topic_ids
 
 
-def get_full_topic_json(base_url, topic_id, cookies):
-    """Fetches the full topic JSON, including all posts by handling pagination."""
+def get_full_topic_json(base_url, topic_id, session, known_posts=None):
+    """Fetches the full topic JSON, including all posts by handling pagination.
+
+    `known_posts` are posts saved by a previous run; only post IDs in the
+    stream that are neither known nor in the initial response are fetched.
+    """
     initial_topic_url = urljoin(base_url, f"t/{topic_id}.json")
     print(f"Fetching initial data for topic {topic_id} from {initial_topic_url}")
 
     try:
-        response = requests.get(initial_topic_url, cookies=cookies, timeout=30)
-        response.raise_for_status()
+        response = fetch(session, initial_topic_url, timeout=30)
         topic_data = response.json()
     except requests.exceptions.RequestException as e:
         print(f"Failed to fetch initial topic data for {topic_id}: {e}")
@@ -149,6 +247,10 @@ def get_full_topic_json(base_url, topic_id, cookies):
         return topic_data
 
     all_post_ids_in_stream = post_stream.get("stream", [])
+    if known_posts:
+        # Fresh copies from the initial response win over the saved ones
+        initial_ids = {post["id"] for post in post_stream["posts"]}
+        post_stream["posts"].extend(post for post in known_posts if post["id"] not in initial_ids)
     loaded_post_ids = {post["id"] for post in post_stream.get("posts", [])}
 
     all_post_ids_in_stream = [pid for pid in all_post_ids_in_stream if pid is not None]
@@ -159,8 +261,11 @@ def get_full_topic_json(base_url, topic_id, cookies):
 
     if not missing_post_ids:
         print(f"All posts for topic {topic_id} already loaded in initial fetch.")
-        return topic_data
+        if not known_posts:
+            return topic_data
 
+    # Any failed batch fails the whole topic: a partial topic would be recorded
+    # as synced, and --incremental would never fetch the missing posts.
     fetched_additional_posts = []
     for i in range(0, len(missing_post_ids), POST_ID_BATCH_SIZE):
         batch_ids = missing_post_ids[i:i + POST_ID_BATCH_SIZE]
@@ -171,8 +276,7 @@ def get_full_topic_json(base_url, topic_id, cookies):
         print(f"Fetching batch of {len(batch_ids)} posts for topic {topic_id} (IDs: {batch_ids[0]}...{batch_ids[-1]})")
 
         try:
-            batch_response = requests.get(posts_url, params=query_params, cookies=cookies, timeout=60)
-            batch_response.raise_for_status()
+            batch_response = fetch(session, posts_url, params=query_params, timeout=60)
             batch_data = batch_response.json()
 
             if isinstance(batch_data, list):
@@ -182,14 +286,17 @@ def get_full_topic_json(base_url, topic_id, cookies):
             elif "posts" in batch_data and isinstance(batch_data["posts"], list):
                  fetched_additional_posts.extend(batch_data["posts"])
             else:
-                print(f"Warning: Unexpected JSON structure for post batch in topic {topic_id}. Data: {str(batch_data)[:200]}...")
+                print(f"Unexpected JSON structure for post batch in topic {topic_id}. Data: {str(batch_data)[:200]}...")
+                return None
 
         except requests.exceptions.RequestException as e:
             print(f"Failed to fetch post batch for topic {topic_id} (IDs: {batch_ids}): {e}")
+            return None
         except json.JSONDecodeError:
             print(f"Failed to decode JSON for post batch in topic {topic_id}. Response: {batch_response.text[:200]}...")
+            return None
 
-    if fetched_additional_posts:
+    if fetched_additional_posts or known_posts:
         print(f"Successfully fetched {len(fetched_additional_posts)} additional posts for topic {topic_id}.")
         existing_posts_in_topic_data = {post['id']: post for post in topic_data["post_stream"]["posts"]}
         for post in fetched_additional_posts:
@@ -211,33 +318,145 @@ def get_full_topic_json(base_url, topic_id, cookies):
 
 
 def save_topic_json(topic_id, json_data, output_dir):
-    """Saves the topic JSON data to a file."""
-    os.makedirs(output_dir, exist_ok=True)
+    """Saves the topic JSON data to a file. Returns True on success."""
     filepath = os.path.join(output_dir, f"topic_{topic_id}.json")
     try:
+        os.makedirs(output_dir, exist_ok=True)
         with open(filepath, "w", encoding="utf-8") as f:
             json.dump(json_data, f, indent=2, ensure_ascii=False)
         # print(f"Successfully saved topic {topic_id} to {filepath}") # Reduced verbosity
-    except IOError as e:
+    except OSError as e:
         print(f"Error saving topic {topic_id} to {filepath}: {e}")
+        return False
+    return True
+
+
+def load_saved_posts(topic_id, output_dir):
+    """Returns the posts saved for a topic by a previous run, or None."""
+    filepath = os.path.join(output_dir, f"topic_{topic_id}.json")
+    try:
+        with open(filepath, encoding="utf-8") as f:
+            return json.load(f).get("post_stream", {}).get("posts")
+    except (IOError, json.JSONDecodeError):
+        return None
+
+
+def load_sync_state(state_file):
+    """Loads {"watermark": bumped_at, "topics": {id: summary}} from a previous run."""
+    try:
+        with open(state_file, encoding="utf-8") as f:
+            return json.load(f)
+    except (IOError, json.JSONDecodeError):
+        return {"watermark": None, "topics": {}}
+
+
+def save_sync_state(state, state_file, failed=()):
+    """Saves the state with the newest synced bumped_at as the next run's watermark.
+
+    `failed` are the listing summaries of topics that could not be synced.
+    The watermark is kept below the earliest of them, so the next
+    --incremental run still lists those topics and retries them.
+    """
+    bumped = [t["bumped_at"] for t in state["topics"].values() if t.get("bumped_at")]
+    if failed:
+        failed_bumps = [t.get("bumped_at") for t in failed]
+        if all(failed_bumps):
+            cap = min(parse_discourse_date(b) for b in failed_bumps)
+            bumped = [b for b in bumped if parse_discourse_date(b) < cap]
+        else:
+            bumped = []  # Position in the listing unknown: list everything next time
+    state["watermark"] = max(bumped, key=parse_discourse_date) if bumped else None
+    tmp_file = state_file + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_file, state_file)
+
+
+def topic_changed(summary, previous):
+    """True if the listing shows new posts or activity since the last sync."""
+    if previous is None:
+        return True
+    return (summary.get("highest_post_number") != previous.get("highest_post_number")
+            or summary.get("bumped_at") != previous.get("bumped_at"))
+
+
+def download_topic(topic_id, session, incremental=False):
+    """Fetches and saves one topic. Returns True only if every post was fetched and saved.
+
+    In incremental mode, posts saved by the previous run are reused and only
+    missing post IDs are downloaded.
+    """
+    known_posts = load_saved_posts(topic_id, OUTPUT_DIR) if incremental else None
+    topic_json_data = get_full_topic_json(DISCOURSE_BASE_URL, topic_id, session, known_posts)
+    if not topic_json_data:
+        print(f"Failed to get complete data for topic {topic_id}.")
+        return False
+    return save_topic_json(topic_id, topic_json_data, OUTPUT_DIR)
+
+
+def positive_float(value):
+    """argparse type for rates: TokenBucket divides by them."""
+    number = float(value)
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
+
+def positive_int(value):
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Download Discourse topics from a category as JSON.")
+    parser.add_argument("--workers", type=positive_int, default=WORKERS, help="topics downloaded in parallel (1 = sequential)")
+    parser.add_argument("--rps", type=positive_float, default=REQUESTS_PER_SECOND, help="max requests per second across all workers")
+    parser.add_argument("--incremental", action="store_true",
+                        help=f"only fetch topics/posts that changed since the last run (uses {STATE_FILE})")
+    parser.add_argument("--state-file", default=STATE_FILE, help="where per-topic sync watermarks are kept")
+    return parser.parse_args()
 
 
 def main():
     """Main function to orchestrate the downloading process."""
+    args = parse_args()
     print("Script started.")
     cookies = parse_cookie_string(RAW_COOKIE_STRING)
     if not cookies and DISCOURSE_BASE_URL != "https://meta.discourse.org/":
         print("Warning: Running without cookies. This may fail for private forums or specific content.")
 
+    rate_limiter.rate = args.rps
+    session = build_session(cookies, pool_size=args.workers)
+
+    state = load_sync_state(args.state_file)
+    stop_before = None
+    if args.incremental and state["watermark"]:
+        stop_before = parse_discourse_date(state["watermark"])
+        print(f"Incremental sync: {len(state['topics'])} known topics, last bump seen at {state['watermark']}.")
+
+    topic_summaries = {}
     topic_ids = get_topic_ids(
         DISCOURSE_BASE_URL,
         CATEGORY_SLUG,
         CATEGORY_ID,
         START_DATE,
         END_DATE,
-        cookies
+        session,
+        topic_summaries=topic_summaries,
+        stop_before=stop_before
     )
 
+    if args.incremental:
+        topic_ids = [tid for tid in topic_ids
+                     if topic_changed(topic_summaries[tid], state["topics"].get(str(tid)))
+                     or not os.path.exists(os.path.join(OUTPUT_DIR, f"topic_{tid}.json"))]
+        print(f"{len(topic_ids)} topics are new or changed since the last sync.")
+        if not topic_ids:
+            print("Nothing to sync. Exiting.")
+            return
+
     if not topic_ids:
         print("No topic IDs found for the given criteria. Exiting.")
         return
@@ -245,19 +464,28 @@ def main():
     total_topics = len(topic_ids)
     success_downloads = 0
     failed_topic_ids = []
+    started = time.monotonic()
+
+    print(f"\nStarting download of {total_topics} topics with {args.workers} workers at <= {args.rps} req/s...\n")
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {executor.submit(download_topic, topic_id, session, args.incremental): topic_id
+                   for topic_id in topic_ids}
+        for i, future in enumerate(as_completed(futures), 1):
+            topic_id = futures[future]
+            try:
+                ok = future.result()
+            except Exception as e:
+                print(f"Unexpected error for topic {topic_id}: {e}")
+                ok = False
+            if ok:
+                success_downloads += 1
+                state["topics"][str(topic_id)] = topic_summaries[topic_id]
+            else:
+                failed_topic_ids.append(topic_id)
+            print(f"--- [{i}/{total_topics}] Finished topic ID: {topic_id} ---")
 
-    print(f"\nStarting download of {total_topics} topics...\n")
-
-    for i, topic_id in enumerate(topic_ids, 1):
-        print(f"--- [{i}/{total_topics}] Processing topic ID: {topic_id} ---")
-        topic_json_data = get_full_topic_json(DISCOURSE_BASE_URL, topic_id, cookies)
-        if topic_json_data:
-            save_topic_json(topic_id, topic_json_data, OUTPUT_DIR)
-            success_downloads += 1
-        else:
-            print(f"Failed to get complete data for topic {topic_id}.")
-            failed_topic_ids.append(topic_id)
-        # print(f"--- Finished processing topic ID: {topic_id} ---\n") # Reduced verbosity
+    save_sync_state(state, args.state_file, failed=[topic_summaries[tid] for tid in failed_topic_ids])
 
     print("\n========= SUMMARY =========")
     print(f"Total topics identified: {total_topics}")
@@ -265,6 +493,7 @@ def main():
     print(f"Failed to download/process: {len(failed_topic_ids)} topics")
     if failed_topic_ids:
         print("Failed topic IDs:", failed_topic_ids)
+    print(f"Elapsed: {time.monotonic() - started:.1f}s")
     print(f"Downloaded files are in: {os.path.abspath(OUTPUT_DIR)}")
     print("Script finished.")
 
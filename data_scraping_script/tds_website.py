@@ -1,15 +1,23 @@
 import os
 import json
 import re
+import time
+import asyncio
+import argparse
 from datetime import datetime
-from urllib.parse import urljoin
+from urllib.parse import urlsplit
 from markdownify import markdownify as md
-from playwright.sync_api import sync_playwright
+from playwright.async_api import async_playwright
 
 BASE_URL = "https://tds.s-anand.net/#/2025-01/"
 BASE_ORIGIN = "https://tds.s-anand.net"
 OUTPUT_DIR = "tds_pages_md"
 METADATA_FILE = "metadata.json"
+CONCURRENCY = 4          # Pages crawled in parallel in one browser
+PAGE_TIMEOUT_MS = 15000  # Max wait for a route to render
+
+ARTICLE_SELECTOR = "article.markdown-section#main"
+RENDER_MARKER_ID = "__crawler_rendered_marker"
 
 visited = set()
 metadata = []
@@ -17,33 +25,49 @@ metadata = []
 def sanitize_filename(title):
     return re.sub(r'[\\/*?:"<>|]', "_", title).strip().replace(" ", "_")
 
-def extract_all_internal_links(page):
-    links = page.eval_on_selector_all("a[href]", "els => els.map(el => el.href)")
+def normalize_url(url):
+    """Canonical form of a docsify URL: the hash route without its `?id=` anchor."""
+    parts = urlsplit(url)
+    route = parts.fragment.split("?", 1)[0]
+    return f"{parts.scheme}://{parts.netloc}/#{route}" if route else f"{parts.scheme}://{parts.netloc}/"
+
+async def extract_all_internal_links(page):
+    links = await page.eval_on_selector_all("a[href]", "els => els.map(el => el.href)")
     return list(set(
-        link for link in links
+        normalize_url(link) for link in links
         if BASE_ORIGIN in link and '/#/' in link
     ))
 
-def wait_for_article_and_get_html(page):
-    page.wait_for_selector("article.markdown-section#main", timeout=10000)
-    return page.inner_html("article.markdown-section#main")
-
-def crawl_page(page, url):
-    if url in visited:
-        return
-    visited.add(url)
-
-    print(f"📄 Visiting: {url}")
-    try:
-        page.goto(url, wait_until="domcontentloaded")
-        page.wait_for_timeout(1000)
-        html = wait_for_article_and_get_html(page)
-    except Exception as e:
-        print(f"❌ Error loading page: {url}\n{e}")
-        return
-
-    # Extract title and save markdown
-    title = page.title().split(" - ")[0].strip() or f"page_{len(visited)}"
+async def wait_for_article_and_get_html(page, url):
+    """Navigate to a route and wait until docsify has rendered it.
+
+    Docsify re-renders the same <article> in place on hash changes, so a
+    marker is planted in the old content and we wait for it to disappear
+    instead of sleeping a fixed time.
+    """
+    await page.evaluate(
+        """([selector, markerId]) => {
+            const article = document.querySelector(selector);
+            if (article && !document.getElementById(markerId)) {
+                const marker = document.createElement('span');
+                marker.id = markerId;
+                article.appendChild(marker);
+            }
+        }""",
+        [ARTICLE_SELECTOR, RENDER_MARKER_ID],
+    )
+    await page.goto(url, wait_until="domcontentloaded")
+    await page.wait_for_function(
+        """([selector, markerId]) => {
+            const article = document.querySelector(selector);
+            return article && article.children.length > 0 && !document.getElementById(markerId);
+        }""",
+        arg=[ARTICLE_SELECTOR, RENDER_MARKER_ID],
+        timeout=PAGE_TIMEOUT_MS,
+    )
+    return await page.inner_html(ARTICLE_SELECTOR)
+
+def save_page(title, url, html):
     filename = sanitize_filename(title)
     filepath = os.path.join(OUTPUT_DIR, f"{filename}.md")
 
@@ -63,27 +87,71 @@ def crawl_page(page, url):
         "downloaded_at": datetime.now().isoformat()
     })
 
-    # Recursively crawl all links found on the page (not just main content)
-    links = extract_all_internal_links(page)
-    for link in links:
-        if link not in visited:
-            crawl_page(page, link)
+async def crawl_page(page, url):
+    """Crawl one URL and return the internal links found on it."""
+    print(f"📄 Visiting: {url}")
+    try:
+        html = await wait_for_article_and_get_html(page, url)
+    except Exception as e:
+        print(f"❌ Error loading page: {url}\n{e}")
+        return []
+
+    # Extract title and save markdown
+    title = (await page.title()).split(" - ")[0].strip() or f"page_{len(visited)}"
+    save_page(title, url, html)
+
+    # Queue all links found on the page (not just main content)
+    return await extract_all_internal_links(page)
+
+async def worker(context, queue):
+    page = await context.new_page()
+    try:
+        while True:
+            url = await queue.get()
+            try:
+                for link in await crawl_page(page, url):
+                    if link not in visited:
+                        visited.add(link)
+                        queue.put_nowait(link)
+            except Exception as e:
+                # A dead worker would leave queue.join() in crawl() waiting forever
+                print(f"❌ Error crawling page: {url}\n{e}")
+            finally:
+                queue.task_done()
+    finally:
+        await page.close()
+
+async def crawl(concurrency):
+    """Breadth-first crawl from BASE_URL with `concurrency` pages sharing one browser."""
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=True)
+        context = await browser.new_context()
+
+        queue = asyncio.Queue()
+        start_url = normalize_url(BASE_URL)
+        visited.add(start_url)
+        queue.put_nowait(start_url)
+
+        workers = [asyncio.create_task(worker(context, queue)) for _ in range(concurrency)]
+        await queue.join()
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await browser.close()
 
 def main():
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-    global visited, metadata
+    parser = argparse.ArgumentParser(description="Crawl the TDS course site into markdown files.")
+    parser.add_argument("--concurrency", type=int, default=CONCURRENCY, help="pages crawled in parallel")
+    args = parser.parse_args()
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=True)
-        context = browser.new_context()
-        page = context.new_page()
-        crawl_page(page, BASE_URL)
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    started = time.monotonic()
+    asyncio.run(crawl(args.concurrency))
 
-        with open(METADATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(metadata, f, indent=2)
+    with open(METADATA_FILE, "w", encoding="utf-8") as f:
+        json.dump(metadata, f, indent=2)
 
-        print(f"\n✅ Completed. {len(metadata)} pages saved.")
-        browser.close()
+    print(f"\n✅ Completed. {len(metadata)} pages saved in {time.monotonic() - started:.1f}s.")
 
 if __name__ == "__main__":
     main()
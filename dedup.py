@@ -0,0 +1,178 @@
+"""Exact and near-duplicate removal for the corpus, plus a content-hash manifest.
+
+Exact duplicates share a SHA-256 of their normalized text. Near duplicates
+(quoted replies, the same page crawled under several ``?id=`` anchors) are
+found with 64-bit SimHash over word shingles, using LSH banding so only
+records that share a band are compared. The manifest maps each record key
+to a hash of its title and content; upload_corpus.py plans from it, so only
+documents with added, changed or removed records are re-uploaded.
+
+Usage: python dedup.py [--distance 3] [--dry-run]
+"""
+import argparse
+import hashlib
+import json
+import os
+import re
+from collections import defaultdict
+
+from ingest import write_records
+from retrieval import DATA_DIR, data_files, iter_json_records
+
+MANIFEST_FILE = os.path.join(DATA_DIR, "manifest.json")
+SIMHASH_BITS = 64
+SHINGLE_WORDS = 3
+MAX_DISTANCE = 3
+
+WORD_RE = re.compile(r"\w+")
+
+
+def normalize(text):
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def content_hash(text):
+    return hashlib.sha256(normalize(text).encode("utf-8")).hexdigest()
+
+
+def record_hash(record):
+    """Hash of the exact title and content of a record, for change detection (not normalized)."""
+    text = f"{record.get('topic_title') or ''}\0{record.get('content') or ''}"
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def record_key(record):
+    """Stable identity of a record: its url, plus the chunk index if it has one."""
+    key = record.get("url", "")
+    if record.get("chunk"):
+        key += f"#chunk={record['chunk']}"
+    return key
+
+
+def simhash(text, bits=SIMHASH_BITS, shingle=SHINGLE_WORDS):
+    words = normalize(text).split()
+    shingles = [" ".join(words[i:i + shingle]) for i in range(max(len(words) - shingle + 1, 1))]
+    weights = [0] * bits
+    for piece in shingles:
+        value = int.from_bytes(hashlib.blake2b(piece.encode("utf-8"), digest_size=bits // 8).digest(), "big")
+        for bit in range(bits):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    return sum(1 << bit for bit in range(bits) if weights[bit] > 0)
+
+
+class Deduplicator:
+    """Streaming dedup: feed records in order, the first of each group is kept.
+
+    Fingerprints are split into ``max_distance + 1`` bands; two fingerprints
+    within ``max_distance`` bits must agree exactly on at least one band, so
+    looking up each band finds every near duplicate without a full scan.
+    """
+
+    def __init__(self, max_distance=MAX_DISTANCE, bits=SIMHASH_BITS):
+        self.max_distance = max_distance
+        self.bits = bits
+        self.bands = max_distance + 1
+        self.band_bits = bits // self.bands
+        self.exact = {}
+        self.band_index = [defaultdict(list) for _ in range(self.bands)]
+        self.empty = 0
+        self.exact_duplicates = 0
+        self.near_duplicates = 0
+
+    def _band_values(self, fingerprint):
+        mask = (1 << self.band_bits) - 1
+        return [(fingerprint >> (i * self.band_bits)) & mask for i in range(self.bands)]
+
+    def duplicate_of(self, record):
+        """Key of the kept record this one duplicates, or None (and remember it)."""
+        key = record_key(record)
+        digest = content_hash(record["content"])
+        if digest in self.exact:
+            self.exact_duplicates += 1
+            return self.exact[digest]
+
+        fingerprint = simhash(record["content"], self.bits)
+        bands = self._band_values(fingerprint)
+        for band, value in enumerate(bands):
+            for other_key, other_print in self.band_index[band][value]:
+                if bin(fingerprint ^ other_print).count("1") <= self.max_distance:
+                    self.near_duplicates += 1
+                    return other_key
+
+        self.exact[digest] = key
+        for band, value in enumerate(bands):
+            self.band_index[band][value].append((key, fingerprint))
+        return None
+
+    def unique(self, records):
+        """Yield records that are neither empty nor duplicates of earlier ones."""
+        for record in records:
+            if not normalize(record.get("content") or ""):
+                self.empty += 1
+            elif self.duplicate_of(record) is None:
+                yield record
+
+
+def load_manifest(path=MANIFEST_FILE):
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except (IOError, json.JSONDecodeError):
+        return {}
+
+
+def save_manifest(manifest, path=MANIFEST_FILE):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=0, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def manifest_is_current(path=MANIFEST_FILE, data_dir=DATA_DIR):
+    """Whether the manifest was written after every data file, i.e. it describes them."""
+    try:
+        written = os.path.getmtime(path)
+    except OSError:
+        return False
+    return all(os.path.getmtime(os.path.join(data_dir, name)) <= written for name in data_files(data_dir))
+
+
+def diff_manifest(old, new):
+    """Compare {key: hash} manifests: (added, changed, removed) key lists."""
+    added = [key for key in new if key not in old]
+    changed = [key for key in new if key in old and old[key] != new[key]]
+    removed = [key for key in old if key not in new]
+    return added, changed, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Remove duplicate records from data/*.json and update the manifest.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--manifest", default=MANIFEST_FILE)
+    parser.add_argument("--distance", type=int, default=MAX_DISTANCE, help="max SimHash bit distance for near duplicates")
+    parser.add_argument("--dry-run", action="store_true", help="report without rewriting data or manifest")
+    args = parser.parse_args()
+
+    dedup = Deduplicator(max_distance=args.distance)
+    manifest = {}
+
+    def tracked(records):
+        for record in records:
+            manifest[record_key(record)] = record_hash(record)
+            yield record
+
+    for name in data_files(args.data_dir):
+        path = os.path.join(args.data_dir, name)
+        records = tracked(dedup.unique(iter_json_records(path)))
+        kept = sum(1 for _ in records) if args.dry_run else write_records(records, path)
+        print(f"{name}: kept {kept} records")
+
+    print(f"Dropped {dedup.empty} empty, {dedup.exact_duplicates} exact and {dedup.near_duplicates} near duplicates")
+    added, changed, removed = diff_manifest(load_manifest(args.manifest), manifest)
+    print(f"Since last manifest: {len(added)} added, {len(changed)} changed, {len(removed)} removed")
+    if not args.dry_run:
+        save_manifest(manifest, args.manifest)
+
+
+if __name__ == "__main__":
+    main()
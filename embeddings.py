@@ -0,0 +1,267 @@
+"""Dense text vectors for local retrieval, and the batched pipeline that computes them.
+
+An embedder has a ``name`` (stored with the vectors, so queries use the
+same model), ``dimensions`` and ``embed(texts)`` returning unit rows, so
+a dot product is the cosine similarity. ``get_embedder`` picks one:
+
+* ``HashingEmbedder`` ("hashing") is deterministic and needs no model or
+  network: word unigrams, bigrams and character trigrams are hashed
+  (CRC32, stable across processes) into a fixed number of signed buckets,
+  weighted by sublinear term frequency. The character trigrams let it
+  match inflections and typos that exact-term BM25 misses.
+* ``OpenAIEmbedder`` ("openai:<model>") calls an OpenAI-compatible
+  /embeddings endpoint (OPENAI_BASE_URL, OPENAI_API_KEY).
+
+``embed_corpus`` embeds many texts: it skips those already in an
+``EmbeddingCache`` (keyed by model and content hash), groups the rest into
+batches of similar token length and spreads them over a process pool.
+"""
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import time
+import urllib.request
+import zlib
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+
+import numpy as np
+
+from retrieval import tokenize
+
+DIMENSIONS = 1024
+BIGRAM_WEIGHT = 0.5
+TRIGRAM_WEIGHT = 0.5
+
+# embed_corpus batches: at most this many estimated tokens, or texts, per batch
+BATCH_TOKENS = 8192
+BATCH_TEXTS = 256
+OPENAI_BASE_URL = "https://api.openai.com/v1"
+
+EmbedStats = namedtuple("EmbedStats", ["total", "cached", "embedded", "batches", "seconds"])
+
+
+def _bucket(feature, dimensions):
+    """(column, sign) of a feature; CRC32 so every process agrees."""
+    h = zlib.crc32(feature.encode("utf-8"))
+    return h % dimensions, 1.0 if h & 0x80000000 else -1.0
+
+
+@lru_cache(maxsize=200_000)
+def _token_features(token, dimensions):
+    """Bucket of a word and of each of its character trigrams; cached, the vocabulary is small."""
+    padded = f"#{token}#"
+    trigrams = tuple(_bucket("#" + padded[i:i + 3], dimensions) for i in range(len(padded) - 2))
+    return _bucket(token, dimensions), trigrams
+
+
+class HashingEmbedder:
+    """Signed feature hashing into ``dimensions`` float32 columns."""
+
+    def __init__(self, dimensions=DIMENSIONS):
+        self.dimensions = dimensions
+        self.name = "hashing" if dimensions == DIMENSIONS else f"hashing:{dimensions}"
+
+    def embed_one(self, text):
+        columns, weights = [], []
+        tokens = tokenize(text)
+        for token, count in Counter(tokens).items():
+            (column, sign), trigrams = _token_features(token, self.dimensions)
+            columns.append(column)
+            weights.append(sign * (1.0 + math.log(count)))
+            for column, sign in trigrams:
+                columns.append(column)
+                weights.append(sign * TRIGRAM_WEIGHT)
+        for bigram, count in Counter(zip(tokens, tokens[1:])).items():
+            column, sign = _bucket(" ".join(bigram), self.dimensions)
+            columns.append(column)
+            weights.append(sign * BIGRAM_WEIGHT * (1.0 + math.log(count)))
+        vector = np.bincount(np.asarray(columns, dtype=np.intp), weights=weights, minlength=self.dimensions).astype(np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed(self, texts):
+        """(len(texts), dimensions) float32 matrix of unit rows (zero rows for empty texts)."""
+        matrix = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = self.embed_one(text)
+        return matrix
+
+
+class OpenAIEmbedder:
+    """Embeddings from an OpenAI-compatible ``/embeddings`` endpoint, rows re-normalized."""
+
+    def __init__(self, model, api_key=None, base_url=None, timeout=60):
+        self.model = model
+        self.name = f"openai:{model}"
+        self.api_key = api_key or os.getenv("OPENAI_API_KEY", "")
+        self.base_url = (base_url or os.getenv("OPENAI_BASE_URL") or OPENAI_BASE_URL).rstrip("/")
+        self.timeout = timeout
+        self.dimensions = None  # known after the first call
+
+    def embed(self, texts):
+        request = urllib.request.Request(
+            f"{self.base_url}/embeddings",
+            data=json.dumps({"model": self.model, "input": list(texts)}).encode("utf-8"),
+            headers={"Content-Type": "application/json", "Authorization": f"Bearer {self.api_key}"},
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            data = json.load(response)["data"]
+        matrix = np.array([item["embedding"] for item in sorted(data, key=lambda item: item["index"])],
+                          dtype=np.float32)
+        self.dimensions = matrix.shape[1]
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+    def embed_one(self, text):
+        return self.embed([text])[0]
+
+
+def get_embedder(name=None):
+    """Embedder for a name: "hashing", "hashing:<dimensions>" or "openai:<model>".
+
+    Defaults to EMBEDDING_MODEL, then "hashing". Raises ValueError for an
+    unknown name or a remote model without OPENAI_API_KEY: quietly swapping
+    in another model would serve vectors that do not match the store's.
+    """
+    name = name or os.getenv("EMBEDDING_MODEL") or "hashing"
+    kind, _, option = name.partition(":")
+    if kind == "hashing":
+        return HashingEmbedder(int(option) if option else DIMENSIONS)
+    if kind == "openai" and option:
+        if not os.getenv("OPENAI_API_KEY"):
+            raise ValueError(f"Embedding model {name} needs OPENAI_API_KEY")
+        return OpenAIEmbedder(option)
+    raise ValueError(f"Unknown embedding model: {name}")
+
+
+def content_key(model, text):
+    return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """On-disk vectors keyed by model and content hash, so rebuilds only embed what changed."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB)")
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, keys):
+        """{key: float32 vector} for the keys that are cached."""
+        found = {}
+        keys = list(keys)
+        for start in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+            batch = keys[start:start + 500]
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+            )
+            found.update((key, np.frombuffer(vector, dtype=np.float32)) for key, vector in rows)
+        return found
+
+    def put_many(self, items):
+        self._conn.execute("BEGIN")
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO embeddings VALUES (?, ?)",
+            ((key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items),
+        )
+        self._conn.execute("COMMIT")
+
+
+def token_batches(texts, indices, max_tokens=BATCH_TOKENS, max_texts=BATCH_TEXTS):
+    """Group ``indices`` into batches of texts of similar length, sorted longest first.
+
+    Similar lengths keep padding low for models that pad a batch to its
+    longest text; ``max_tokens`` bounds the work per batch.
+    """
+    lengths = {i: len(texts[i]) // 4 + 1 for i in indices}
+    batches, batch, batch_tokens = [], [], 0
+    for i in sorted(indices, key=lambda i: lengths[i], reverse=True):
+        if batch and (batch_tokens + lengths[i] > max_tokens or len(batch) == max_texts):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(i)
+        batch_tokens += lengths[i]
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def embed_corpus(texts, embedder, cache=None, workers=1, max_tokens=BATCH_TOKENS):
+    """Embed ``texts`` (one unit row each); returns (matrix, EmbedStats).
+
+    Cached vectors are reused; the rest are embedded in token batches, on
+    ``workers`` processes when more than one (the embedder must be
+    picklable), and written back to the cache.
+    """
+    start = time.perf_counter()
+    keys = [content_key(embedder.name, text) for text in texts]
+    cached = cache.get_many(set(keys)) if cache is not None else {}
+    missing = [i for i, key in enumerate(keys) if key not in cached]
+    batches = token_batches(texts, missing, max_tokens=max_tokens)
+    batch_texts = [[texts[i] for i in batch] for batch in batches]
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(embedder.embed, batch_texts))
+    else:
+        results = [embedder.embed(batch) for batch in batch_texts]
+
+    computed = {}
+    for batch, vectors in zip(batches, results):
+        computed.update(zip((keys[i] for i in batch), vectors))
+    if cache is not None and computed:
+        cache.put_many(computed.items())
+    vectors = {**cached, **computed}
+    dimensions = len(next(iter(vectors.values()))) if vectors else getattr(embedder, "dimensions", None) or 0
+    matrix = np.zeros((len(texts), dimensions), dtype=np.float32)
+    for row, key in enumerate(keys):
+        matrix[row] = vectors[key]
+    stats = EmbedStats(len(texts), len(texts) - len(missing), len(missing), len(batches), time.perf_counter() - start)
+    return matrix, stats
+
+
+def chunk_text(chunk):
+    return chunk["title"] + " " + chunk["content"]
+
+
+class VectorIndex:
+    """Cosine search: rows are unit vectors, so a query is one matrix-vector product.
+
+    With an ``ann`` index (ann.IVFIndex over the same rows) only the vectors
+    in the lists it probes are scored; otherwise the search is exact.
+    Without ``vectors`` the chunks are embedded here, with ``embedder`` or
+    else the EMBEDDING_MODEL one (see get_embedder); for a remote model
+    that is a network round trip per batch on every start, which a
+    vector_store.py build avoids.
+    """
+
+    def __init__(self, chunks, embedder=None, vectors=None, ann=None):
+        self.chunks = chunks
+        self.embedder = embedder or get_embedder()
+        if vectors is None:
+            vectors = embed_corpus([chunk_text(chunk) for chunk in chunks], self.embedder)[0]
+        self.vectors = vectors
+        self.ann = ann
+
+    def nearest(self, query, k):
+        """[(chunk_idx, cosine)] of the ``k`` most similar chunks, best first, positive only."""
+        if not len(self.vectors) or k <= 0:
+            return []
+        if self.ann is not None:
+            scores, ids = self.ann.search(self.embedder.embed_one(query), k)
+            return [(int(idx), float(score)) for idx, score in zip(ids, scores) if score > 0]
+        similarities = self.vectors @ self.embedder.embed_one(query)
+        k = min(k, len(similarities))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        top = top[np.argsort(-similarities[top], kind="stable")]
+        return [(int(idx), float(similarities[idx])) for idx in top if similarities[idx] > 0]
+
+    def search(self, query, k=5):
+        return [(score, self.chunks[idx]) for idx, score in self.nearest(query, k)]
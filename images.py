@@ -0,0 +1,119 @@
+import base64
+import binascii
+import hashlib
+import io
+from collections import namedtuple
+
+# Pillow is imported on first use (it adds ~25ms to a cold start) and is optional:
+# without it images are size-checked and hashed only
+Image = ImageOps = None
+
+MAX_IMAGE_BYTES = 5 * 1024 * 1024
+MAX_DIMENSION = 1024
+OUTPUT_FORMAT = "WEBP"
+OUTPUT_QUALITY = 80
+REENCODE_ABOVE_BYTES = 200 * 1024
+
+ProcessedImage = namedtuple(
+    "ProcessedImage", ["data", "hash", "width", "height", "original_bytes", "bytes", "perceptual_hash"]
+)
+
+
+class ImageTooLargeError(ValueError):
+    """The uploaded image exceeds the configured size limit."""
+
+
+class InvalidImageError(ValueError):
+    """The uploaded image is not valid base64 or not a readable image."""
+
+
+def decode_base64_image(data, max_bytes=MAX_IMAGE_BYTES):
+    """Decode a base64 image (optionally a data: URL), enforcing ``max_bytes``.
+
+    The encoded length is checked first so oversized uploads are rejected
+    without decoding them.
+    """
+    if data.startswith("data:"):
+        data = data.split(",", 1)[-1]
+    if len(data) > (max_bytes * 4 // 3) + 4:
+        raise ImageTooLargeError(f"Image is larger than {max_bytes} bytes")
+    try:
+        raw = base64.b64decode(data, validate=True)
+    except (binascii.Error, ValueError) as e:
+        raise InvalidImageError(f"Image is not valid base64: {e}")
+    if len(raw) > max_bytes:
+        raise ImageTooLargeError(f"Image is larger than {max_bytes} bytes")
+    return raw
+
+
+def _load_pillow():
+    """Import Pillow once; False when it is not installed."""
+    global Image, ImageOps
+    if Image is None:
+        try:
+            from PIL import Image, ImageOps
+        except ImportError:
+            Image = False
+    return bool(Image)
+
+
+def difference_hash(image, size=8):
+    """64-bit dHash: survives re-encoding and resizing of the same picture.
+
+    Coarse by design: pictures without gradients at 9x8 pixels, such as
+    most text screenshots on a white background, all hash to zero.
+    """
+    gray = image.convert("L").resize((size + 1, size), Image.BILINEAR)
+    pixels = list(gray.getdata())
+    bits = 0
+    for row in range(size):
+        for col in range(size):
+            left = pixels[row * (size + 1) + col]
+            right = pixels[row * (size + 1) + col + 1]
+            bits = (bits << 1) | (left > right)
+    return f"{bits:016x}"
+
+
+def process_image(data, max_bytes=MAX_IMAGE_BYTES, max_dimension=MAX_DIMENSION,
+                  output_format=OUTPUT_FORMAT, quality=OUTPUT_QUALITY):
+    """Decode once, downscale to ``max_dimension`` and re-encode if it pays off.
+
+    Returns a ProcessedImage whose ``data`` is the base64 to forward and
+    whose ``hash`` identifies the upload for caching (a SHA-256 of the
+    decoded bytes). ``perceptual_hash`` is a dHash that also matches
+    re-encoded or resized copies, for opt-in near-duplicate caching; it is
+    None without Pillow or when the picture is too flat to tell apart.
+    """
+    raw = decode_base64_image(data, max_bytes)
+    digest = "sha256:" + hashlib.sha256(raw).hexdigest()
+    if not _load_pillow():
+        return ProcessedImage(base64.b64encode(raw).decode("ascii"), digest, None, None, len(raw), len(raw), None)
+
+    try:
+        image = Image.open(io.BytesIO(raw))
+        image.load()
+    except Exception as e:
+        raise InvalidImageError(f"Unreadable image: {e}")
+
+    source_format = image.format
+    image = ImageOps.exif_transpose(image)
+    resized = max(image.size) > max_dimension
+    if resized:
+        image.thumbnail((max_dimension, max_dimension), Image.LANCZOS)
+    dhash = difference_hash(image)
+    perceptual = "dhash:" + dhash if int(dhash, 16) else None
+
+    output = raw
+    # Already-small images in the target format (e.g. resized by the frontend) go through as is
+    if resized or (len(raw) > REENCODE_ABOVE_BYTES and source_format != output_format):
+        if image.mode not in ("RGB", "RGBA"):
+            image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        buffer = io.BytesIO()
+        image.save(buffer, format=output_format, quality=quality)
+        if resized or buffer.tell() < len(raw):
+            output = buffer.getvalue()
+
+    return ProcessedImage(
+        base64.b64encode(output).decode("ascii"), digest, image.width, image.height, len(raw), len(output),
+        perceptual,
+    )
@@ -0,0 +1,200 @@
+"""Build the flattened corpus in data/ from the raw scraper outputs.
+
+Reads data_scraping_script/discourse_json/topic_*.json and
+data_scraping_script/tds_pages_md/*.md one file at a time, cleans each
+post/page, chunks long pages and writes records as they are produced, so
+memory stays flat regardless of corpus size.
+
+Usage: python ingest.py [--format json|jsonl] [--chunk-tokens 300]
+"""
+import argparse
+import glob
+import itertools
+import json
+import os
+import re
+from html.parser import HTMLParser
+
+from chunking import CHUNK_TOKENS, FENCE_RE, chunk_markdown, clean_field, parse_front_matter
+from retrieval import DATA_DIR
+
+SCRAPE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data_scraping_script")
+DISCOURSE_DIR = os.path.join(SCRAPE_DIR, "discourse_json")
+PAGES_DIR = os.path.join(SCRAPE_DIR, "tds_pages_md")
+DISCOURSE_BASE_URL = "https://discourse.onlinedegree.iitm.ac.in/"
+
+BLANK_LINES_RE = re.compile(r"\n\s*\n\s*\n+")
+SPACES_RE = re.compile(r"[ \t\u00a0]+")
+BLOCK_TAGS = {"p", "br", "div", "li", "ul", "ol", "pre", "blockquote", "aside", "tr",
+              "h1", "h2", "h3", "h4", "h5", "h6"}
+
+
+class _TextExtractor(HTMLParser):
+    """Collects the visible text of Discourse `cooked` HTML."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self._skip += 1
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style"):
+            self._skip = max(self._skip - 1, 0)
+        elif tag in BLOCK_TAGS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(html):
+    parser = _TextExtractor()
+    parser.feed(html)
+    parser.close()
+    return "".join(parser.parts)
+
+
+def clean_text(text):
+    """Normalize whitespace: single spaces, at most one blank line, no padding."""
+    text = SPACES_RE.sub(" ", text.replace("\r\n", "\n"))
+    text = "\n".join(line.strip() for line in text.split("\n"))
+    return BLANK_LINES_RE.sub("\n\n", text).strip()
+
+
+def clean_markdown(text):
+    """Tidy a markdown page without touching its layout.
+
+    Indentation is kept (it nests lists and marks code blocks) and fenced
+    code is left exactly as written; elsewhere trailing whitespace and NULs
+    are dropped and blank lines collapse to one.
+    """
+    lines, fence, blank = [], None, False
+    for line in text.replace("\r\n", "\n").replace("\x00", "").split("\n"):
+        if fence:
+            lines.append(line)
+            if line.strip().startswith(fence):
+                fence = None
+            continue
+        match = FENCE_RE.match(line)
+        if match:
+            fence = match.group(1)
+        line = line.rstrip()
+        if not line and (blank or not lines):
+            continue
+        blank = not line
+        lines.append(line)
+    return "\n".join(lines).rstrip()
+
+
+def iter_discourse_posts(discourse_dir=DISCOURSE_DIR):
+    """Yield one record per post, reading one topic file at a time."""
+    for path in sorted(glob.glob(os.path.join(discourse_dir, "topic_*.json"))):
+        with open(path, encoding="utf-8") as f:
+            topic = json.load(f)
+        topic_id = topic.get("id")
+        slug = topic.get("slug") or str(topic_id)
+        title = clean_field(topic.get("title"))
+        for post in topic.get("post_stream", {}).get("posts", []):
+            content = clean_text(html_to_text(post.get("cooked") or post.get("raw") or ""))
+            if not content:
+                continue
+            yield {
+                "topic_id": topic_id,
+                "topic_title": title,
+                "url": f"{DISCOURSE_BASE_URL}t/{slug}/{topic_id}/{post.get('post_number')}",
+                "content": content,
+                "post_number": post.get("post_number"),
+                "reply_to_post_number": post.get("reply_to_post_number"),
+                "created_at": post.get("created_at"),
+            }
+
+
+def iter_pages(pages_dir=PAGES_DIR):
+    """Yield one record per crawled markdown page."""
+    for path in sorted(glob.glob(os.path.join(pages_dir, "*.md"))):
+        with open(path, encoding="utf-8") as f:
+            fields, body = parse_front_matter(f.read())
+        content = clean_markdown(body)
+        if not content:
+            continue
+        yield {
+            "url": fields.get("original_url", ""),
+            "topic_title": fields.get("title") or os.path.splitext(os.path.basename(path))[0],
+            "content": content,
+            "downloaded_at": fields.get("downloaded_at"),
+        }
+
+
+def split_pages(records, max_tokens=CHUNK_TOKENS):
+    """Split long pages along their markdown structure; each piece keeps the record's fields.
+
+    Discourse posts are written whole: retrieval chunks them per thread
+    (see chunking.thread_chunks), and a split post would lose its context.
+    """
+    for record in records:
+        if record.get("topic_id") is not None:
+            yield {**record, "chunk": 0}
+            continue
+        pieces = chunk_markdown(record["content"], max_tokens) or [(record["content"], "")]
+        for index, (piece, _) in enumerate(pieces):
+            yield {**record, "content": piece, "chunk": index}
+
+
+def write_records(records, path):
+    """Stream records to `path` as a JSON array (.json) or JSON Lines (.jsonl).
+
+    Returns the number of records written. The file is replaced atomically.
+    """
+    jsonl = path.endswith(".jsonl")
+    tmp_path = path + ".tmp"
+    count = 0
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        if not jsonl:
+            f.write("[")
+        for record in records:
+            line = json.dumps(record, ensure_ascii=False)
+            if jsonl:
+                f.write(line + "\n")
+            else:
+                f.write(("\n  " if count == 0 else ",\n  ") + line)
+            count += 1
+        if not jsonl:
+            f.write("\n]\n")
+    os.replace(tmp_path, path)
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build data/*.json from the raw Discourse and TDS site scrapes.")
+    parser.add_argument("--discourse-dir", default=DISCOURSE_DIR)
+    parser.add_argument("--pages-dir", default=PAGES_DIR)
+    parser.add_argument("--out-dir", default=DATA_DIR)
+    parser.add_argument("--format", choices=["json", "jsonl"], default="json")
+    parser.add_argument("--chunk-tokens", type=int, default=CHUNK_TOKENS, help="max tokens per chunk")
+    args = parser.parse_args()
+
+    os.makedirs(args.out_dir, exist_ok=True)
+    sources = [
+        ("discourse", iter_discourse_posts(args.discourse_dir)),
+        ("tds_website", iter_pages(args.pages_dir)),
+    ]
+    for name, records in sources:
+        path = os.path.join(args.out_dir, f"{name}.{args.format}")
+        first = next(records, None)
+        if first is None:
+            print(f"No raw {name} files found, leaving {path} untouched")
+            continue
+        records = itertools.chain([first], records)
+        count = write_records(split_pages(records, max_tokens=args.chunk_tokens), path)
+        print(f"Wrote {count} records to {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,41 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
 from fastapi import Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse
-import json
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import HTMLResponse, PlainTextResponse, Response, StreamingResponse
+from contextlib import asynccontextmanager
 from pydantic import BaseModel
-from pinecone import Pinecone
-from pinecone_plugins.assistant.models.chat import Message
 from typing import Optional
 from dotenv import load_dotenv
-import uvicorn
+from upstream import (
+    ChatExecutor, CircuitBreaker, CircuitOpenError, QueueFullError, UpstreamPolicy, UpstreamTimeoutError,
+    is_transient,
+)
+from retrieval import HybridIndex, LocalAssistant, hit_links
+from assets import DEFAULT_CACHE_CONTROL, CompressedAsset
+from build_frontend import DIST_DIR, SOURCE_FILE as FRONTEND_SOURCE, is_stale
+from answers import InvalidAnswerError, dumps, extract_json, normalize_answer, prose_answer
+from answer_cache import AnswerCache, cache_key, image_digest, normalize_question
+from sessions import SessionManager, new_session_id
+from images import ImageTooLargeError, InvalidImageError, process_image
+from streaming import AnswerStreamExtractor, chunk_text, sse_event
+from metrics import (
+    ANSWER_PARSES, REGISTRY, UPSTREAM_ERRORS, UPSTREAM_FALLBACKS, MetricsMiddleware, handler_finished, handler_started,
+    record_stage, request_timings, stage,
+)
 import os
+import time
+import asyncio
+import threading
 
 load_dotenv() 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app):
+    yield
+    chat_executor.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,675 +45,560 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize Pinecone
-pc = Pinecone(api_key=os.getenv('pinecone_api_key'))
-assistant = pc.assistant.Assistant(assistant_name="tds-virtual-assistant")
+# Compress larger JSON/NDJSON bodies; SSE and already-encoded responses are left alone
+app.add_middleware(GZipMiddleware, minimum_size=int(os.getenv("GZIP_MIN_SIZE", "1000")))
+
+# Answer backend: the hosted Pinecone assistant, or local retrieval over data/*.json
+ANSWER_BACKEND = os.getenv("ANSWER_BACKEND", "pinecone").lower()
+LOCAL_TOP_K = int(os.getenv("LOCAL_TOP_K", "5"))
+
+# Built on first use (see get_assistant): importing pinecone and describing the
+# assistant over the network would otherwise delay every cold start
+assistant = None
+assistant_lock = asyncio.Lock()
+
+# assistant.chat is blocking, so it runs on a bounded pool instead of the event loop
+chat_executor = ChatExecutor(
+    max_concurrency=int(os.getenv("CHAT_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("CHAT_QUEUE_SIZE", "64")),
+)
+
+# Per-attempt deadline, retries of transient errors, optional hedging (seconds or "p95")
+# and a circuit breaker that fails fast after repeated upstream failures
+upstream = UpstreamPolicy(
+    chat_executor,
+    timeout=float(os.getenv("UPSTREAM_TIMEOUT", "30")),
+    retries=int(os.getenv("UPSTREAM_RETRIES", "2")),
+    backoff=float(os.getenv("UPSTREAM_BACKOFF", "0.25")),
+    hedge_after=os.getenv("UPSTREAM_HEDGE_AFTER") or None,
+    breaker=CircuitBreaker(
+        failure_threshold=int(os.getenv("BREAKER_FAILURES", "5")),
+        reset_timeout=float(os.getenv("BREAKER_RESET", "30")),
+    ),
+)
+
+# Local hybrid index over data/*.json, built once on first use and shared by the local
+# backend, the fallback and link attribution
+corpus_index = None
+corpus_index_lock = threading.Lock()
+# Lists an IVF index (large data/index stores only) scans per query: higher is slower but finds more
+ANN_NPROBE = int(os.getenv("ANN_NPROBE", "0"))
+
+# Where answer links come from: "assistant" (the links in its JSON), "retrieval" (the
+# best matching data/*.json records, and the assistant is told to leave links out) or
+# "both" (retrieved links first, then the assistant's)
+LINKS_SOURCE = os.getenv("LINKS_SOURCE", "assistant").lower()
+LINKS_MAX = int(os.getenv("LINKS_MAX", "3"))
+LINKS_PROMPT = '\n\nLeave "links" empty: links to the course material are added separately.'
+
+# Answer source while upstream is failing or the circuit is open: "local" (BM25) or "none"
+UPSTREAM_FALLBACK = os.getenv("UPSTREAM_FALLBACK", "none").lower()
+fallback_assistant = None
+fallback_lock = asyncio.Lock()
+
+# Answer cache in front of the assistant (ANSWER_CACHE_SIZE=0 disables it)
+answer_cache = None
+if int(os.getenv("ANSWER_CACHE_SIZE", "1024")) > 0:
+    answer_cache = AnswerCache(
+        max_entries=int(os.getenv("ANSWER_CACHE_SIZE", "1024")),
+        ttl=float(os.getenv("ANSWER_CACHE_TTL", "3600")),
+        similarity_threshold=float(os.getenv("ANSWER_CACHE_SIMILARITY", "0")),
+        path=os.getenv("ANSWER_CACHE_PATH") or None,
+    )
+# Image questions are cached per exact upload; "perceptual" also matches re-encoded or resized copies
+ANSWER_CACHE_IMAGE_MATCH = os.getenv("ANSWER_CACHE_IMAGE_MATCH", "exact").lower()
+
+# Multi-turn chat: requests carrying a session_id are answered with that conversation's
+# recent turns (within SESSION_TOKEN_BUDGET) and a summary of older ones (SESSION_MAX=0 disables)
+sessions = None
+if int(os.getenv("SESSION_MAX", "10000")) > 0:
+    sessions = SessionManager(
+        max_sessions=int(os.getenv("SESSION_MAX", "10000")),
+        ttl=float(os.getenv("SESSION_TTL", "86400")),
+        token_budget=int(os.getenv("SESSION_TOKEN_BUDGET", "1500")),
+        summary_tokens=int(os.getenv("SESSION_SUMMARY_TOKENS", "300")),
+        path=os.getenv("SESSION_PATH") or None,
+    )
+
+# Uploaded images: hard size limit, and the resolution they are downscaled to
+IMAGE_MAX_BYTES = int(os.getenv("IMAGE_MAX_BYTES", str(5 * 1024 * 1024)))
+IMAGE_MAX_DIMENSION = int(os.getenv("IMAGE_MAX_DIMENSION", "1024"))
+
+# Ask the assistant once more for strict JSON when a reply cannot be repaired (0 disables)
+ANSWER_RETRY = os.getenv("ANSWER_RETRY", "1") == "1"
+REFORMAT_PROMPT = (
+    'Your previous reply could not be parsed. Reply again with only a JSON object '
+    '{"answer": string, "links": [{"url": string, "text": string}]} and no other text.'
+)
+
+# /api/batch limits: questions per request, and how many are answered at once
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "500"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+
+# Per-request stage timings in a Server-Timing header (and the SSE done event)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+REGISTRY.gauge("virtual_ta_upstream_in_flight", "Assistant calls running on the chat executor.",
+               callback=lambda: chat_executor.in_flight)
+REGISTRY.gauge("virtual_ta_upstream_queued", "Assistant calls waiting for an executor slot.",
+               callback=lambda: chat_executor.queued)
+REGISTRY.gauge("virtual_ta_upstream_circuit_open", "1 while the upstream circuit breaker is open.",
+               callback=lambda: int(upstream.breaker.state == CircuitBreaker.OPEN))
+REGISTRY.gauge("virtual_ta_sessions", "Conversations held in the session store.",
+               callback=lambda: len(sessions) if sessions is not None else None)
+REGISTRY.gauge("virtual_ta_cache_hits", "Answer cache hits since start.",
+               callback=lambda: answer_cache.hits if answer_cache else None)
+REGISTRY.gauge("virtual_ta_cache_misses", "Answer cache misses since start.",
+               callback=lambda: answer_cache.misses if answer_cache else None)
+REGISTRY.gauge("virtual_ta_cache_hit_ratio", "Answer cache hit ratio since start.",
+               callback=lambda: answer_cache.stats()["hit_ratio"] if answer_cache else None)
 
 # Request model
 class QueryRequest(BaseModel):
     question: str
     image: Optional[str] = None
+    session_id: Optional[str] = None
 
-# Response model (matches expected format)
+# Response model (matches expected format). Documents the schema only: answers are
+# checked by answers.normalize_answer and returned pre-serialized
 class QueryResponse(BaseModel):
     answer: str
     links: list[dict[str, str]]
 
-# HTML template for the frontend
-HTML_TEMPLATE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>TDS Virtual Assistant</title>
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-
-        body {
-            font-family: -apple-system, BlinkMacSystemFont, 'Segoe UI', system-ui, sans-serif;
-            background-color: #000000;
-            color: #ffffff;
-            height: 100vh;
-            overflow: hidden;
-        }
-
-        .chat-container {
-            display: flex;
-            flex-direction: column;
-            height: 100vh;
-            max-width: 768px;
-            margin: 0 auto;
-            background-color: #000000;
-        }
-
-        .header {
-            padding: 20px;
-            border-bottom: 1px solid #262626;
-            background-color: #000000;
-        }
-
-        .header h1 {
-            font-size: 20px;
-            font-weight: 600;
-            color: #ffffff;
-        }
-
-        .chat-messages {
-            flex: 1;
-            overflow-y: auto;
-            padding: 0;
-            background-color: #000000;
-        }
-
-        .chat-messages::-webkit-scrollbar {
-            width: 4px;
-        }
-
-        .chat-messages::-webkit-scrollbar-track {
-            background: transparent;
-        }
-
-        .chat-messages::-webkit-scrollbar-thumb {
-            background: #333333;
-            border-radius: 2px;
-        }
-
-        .message {
-            padding: 24px 20px;
-            border-bottom: 1px solid #0a0a0a;
-        }
-
-        .message.user {
-            background-color: #000000;
-        }
-
-        .message.assistant {
-            background-color: #0a0a0a;
-        }
-
-        .message-header {
-            display: flex;
-            align-items: center;
-            margin-bottom: 8px;
-            gap: 8px;
-        }
-
-        .avatar {
-            width: 24px;
-            height: 24px;
-            border-radius: 4px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 14px;
-            font-weight: 600;
-        }
-
-        .user-avatar {
-            background-color: #1d4ed8;
-            color: white;
-        }
-
-        .assistant-avatar {
-            background-color: #ffffff;
-            color: #000000;
-        }
-
-        .message-author {
-            font-size: 14px;
-            font-weight: 600;
-            color: #ffffff;
-        }
-
-        .message-content {
-            font-size: 15px;
-            line-height: 1.6;
-            color: #ffffff;
-            margin-left: 32px;
-            white-space: pre-wrap;
-            word-wrap: break-word;
-        }
-
-        .links-section {
-            margin-left: 32px;
-            margin-top: 16px;
-        }
-
-        .links-title {
-            font-size: 14px;
-            font-weight: 600;
-            color: #9ca3af;
-            margin-bottom: 8px;
-        }
-
-        .link-item {
-            display: block;
-            padding: 8px 12px;
-            margin-bottom: 4px;
-            background-color: #1a1a1a;
-            border: 1px solid #262626;
-            border-radius: 6px;
-            text-decoration: none;
-            color: #ffffff;
-            font-size: 14px;
-            transition: background-color 0.2s ease;
-        }
-
-        .link-item:hover {
-            background-color: #262626;
-        }
-
-        .input-section {
-            padding: 20px;
-            border-top: 1px solid #262626;
-            background-color: #000000;
-        }
-
-        .input-container {
-            position: relative;
-            background-color: #1a1a1a;
-            border: 1px solid #262626;
-            border-radius: 24px;
-            padding: 4px;
-            display: flex;
-            align-items: flex-end;
-            gap: 8px;
-            min-height: 48px;
-        }
-
-        .input-container:focus-within {
-            border-color: #404040;
-        }
-
-        .image-upload-wrapper {
-            display: flex;
-            align-items: center;
-            padding-left: 8px;
-        }
-
-        .image-upload {
-            position: relative;
-            overflow: hidden;
-        }
-
-        .image-upload input[type=file] {
-            position: absolute;
-            opacity: 0;
-            width: 100%;
-            height: 100%;
-            cursor: pointer;
-        }
-
-        .image-upload-button {
-            width: 32px;
-            height: 32px;
-            border-radius: 6px;
-            background-color: transparent;
-            border: none;
-            color: #9ca3af;
-            cursor: pointer;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 16px;
-            transition: color 0.2s ease;
-        }
-
-        .image-upload-button:hover {
-            color: #ffffff;
-        }
-
-        .message-input {
-            flex: 1;
-            border: none;
-            background: transparent;
-            color: #ffffff;
-            font-size: 15px;
-            line-height: 1.4;
-            padding: 12px 8px;
-            resize: none;
-            min-height: 20px;
-            max-height: 120px;
-            outline: none;
-        }
+# One entry of a /api/batch response; `error` is set instead of an answer on failure
+class BatchResult(BaseModel):
+    index: int
+    answer: Optional[str] = None
+    links: list[dict[str, str]] = []
+    error: Optional[str] = None
+
+# The chat UI (static/index.html), loaded on first request. build_frontend.py writes the
+# minified, precompressed copy in static/dist; a missing or stale build falls back to the source
+FRONTEND_DIST = os.path.join(DIST_DIR, "index.html")
+frontend = None
+
+def get_frontend():
+    global frontend
+    if frontend is None:
+        path = FRONTEND_SOURCE if is_stale() else FRONTEND_DIST
+        frontend = CompressedAsset.from_file(
+            path,
+            "text/html; charset=utf-8",
+            cache_control=os.getenv("FRONTEND_CACHE_CONTROL", DEFAULT_CACHE_CONTROL),
+        )
+    return frontend
 
-        .message-input::placeholder {
-            color: #6b7280;
-        }
-
-        .send-button {
-            width: 32px;
-            height: 32px;
-            border-radius: 6px;
-            background-color: #ffffff;
-            border: none;
-            color: #000000;
-            cursor: pointer;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 16px;
-            font-weight: 600;
-            margin-right: 8px;
-            transition: background-color 0.2s ease;
-        }
-
-        .send-button:hover:not(:disabled) {
-            background-color: #e5e5e5;
-        }
-
-        .send-button:disabled {
-            background-color: #404040;
-            color: #6b7280;
-            cursor: not-allowed;
-        }
-
-        .image-preview {
-            max-width: 200px;
-            max-height: 150px;
-            border-radius: 8px;
-            margin: 8px 0;
-            border: 1px solid #262626;
-        }
-
-        .empty-state {
-            display: flex;
-            flex-direction: column;
-            align-items: center;
-            justify-content: center;
-            height: 100%;
-            padding: 40px 20px;
-            text-align: center;
-        }
-
-        .empty-state-icon {
-            width: 48px;
-            height: 48px;
-            background-color: #1a1a1a;
-            border-radius: 12px;
-            display: flex;
-            align-items: center;
-            justify-content: center;
-            font-size: 24px;
-            margin-bottom: 16px;
-        }
-
-        .empty-state h2 {
-            font-size: 20px;
-            font-weight: 600;
-            color: #ffffff;
-            margin-bottom: 8px;
-        }
-
-        .empty-state p {
-            font-size: 15px;
-            color: #6b7280;
-            max-width: 400px;
-        }
-
-        .typing-indicator {
-            display: flex;
-            align-items: center;
-            gap: 4px;
-            margin-left: 32px;
-            padding: 8px 0;
-        }
-
-        .typing-dot {
-            width: 4px;
-            height: 4px;
-            border-radius: 50%;
-            background-color: #6b7280;
-            animation: typing 1.4s infinite ease-in-out;
-        }
-
-        .typing-dot:nth-child(2) { animation-delay: 0.2s; }
-        .typing-dot:nth-child(3) { animation-delay: 0.4s; }
-
-        @keyframes typing {
-            0%, 80%, 100% { opacity: 0.3; }
-            40% { opacity: 1; }
-        }
-
-        .loading-spinner {
-            width: 16px;
-            height: 16px;
-            border: 2px solid #6b7280;
-            border-top: 2px solid #000000;
-            border-radius: 50%;
-            animation: spin 1s linear infinite;
-        }
-
-        @keyframes spin {
-            0% { transform: rotate(0deg); }
-            100% { transform: rotate(360deg); }
-        }
-
-        /* Mobile Responsive */
-        @media (max-width: 768px) {
-            .header {
-                padding: 16px;
-            }
-
-            .header h1 {
-                font-size: 18px;
-            }
-
-            .message {
-                padding: 20px 16px;
-            }
-
-            .input-section {
-                padding: 16px;
-            }
-
-            .empty-state {
-                padding: 32px 16px;
-            }
-
-            .empty-state h2 {
-                font-size: 18px;
-            }
-
-            .empty-state p {
-                font-size: 14px;
-            }
+@app.get("/", response_class=HTMLResponse)
+async def serve_frontend(request: Request):
+    """Serve the chat interface at the root URL"""
+    return get_frontend().response(request.headers)
+
+async def prepare_image(request: QueryRequest):
+    """Decode, bound and hash the request's image once; None without one"""
+    if not request.image:
+        return None
+    with stage("image"):
+        return await asyncio.to_thread(
+            process_image, request.image, max_bytes=IMAGE_MAX_BYTES, max_dimension=IMAGE_MAX_DIMENSION
+        )
+
+def cache_image_hash(image):
+    """Answer-cache identity of the attached image ("" for none; see ANSWER_CACHE_IMAGE_MATCH)"""
+    if image is None:
+        return ""
+    if ANSWER_CACHE_IMAGE_MATCH == "perceptual" and image.perceptual_hash:
+        return image.perceptual_hash
+    return image.hash
+
+def load_corpus_index():
+    global corpus_index
+    with corpus_index_lock:
+        if corpus_index is None:
+            corpus_index = HybridIndex.from_corpus()
+            if ANN_NPROBE and corpus_index.vectors.ann is not None:
+                corpus_index.vectors.ann.nprobe = ANN_NPROBE
+    return corpus_index
+
+def create_assistant():
+    if ANSWER_BACKEND == "local":
+        return LocalAssistant(load_corpus_index(), top_k=LOCAL_TOP_K)
+    from pinecone import Pinecone
+
+    pc = Pinecone(api_key=os.getenv('pinecone_api_key'))
+    return pc.assistant.Assistant(assistant_name="tds-virtual-assistant")
+
+async def get_assistant():
+    """The answer backend, created off the event loop by the first request that needs it"""
+    global assistant
+    if assistant is None:
+        async with assistant_lock:
+            if assistant is None:
+                with stage("connect"):
+                    assistant = await asyncio.to_thread(create_assistant)
+    return assistant
+
+def session_history(request: QueryRequest):
+    """Earlier turns of the request's conversation as assistant messages; [] without one"""
+    if sessions is None or not request.session_id:
+        return []
+    with stage("session"):
+        return sessions.history(request.session_id)
+
+def record_turn(request: QueryRequest, response):
+    if sessions is not None and request.session_id:
+        sessions.record(request.session_id, request.question, response["answer"])
+
+def build_message(request: QueryRequest, image=None):
+    """Prepare the user message for the Pinecone assistant"""
+    # The local backend searches on the message text and already links its own hits
+    message = {
+        "role": "user",
+        "content": request.question + LINKS_PROMPT
+        if LINKS_SOURCE == "retrieval" and ANSWER_BACKEND != "local" else request.question
+    }
+    
+    if image is not None:
+        message["image"] = {
+            "data": image.data
         }
+    return message
 
-        @media (max-width: 480px) {
-            .chat-container {
-                max-width: 100%;
-            }
-
-            .header {
-                padding: 12px 16px;
-            }
-
-            .message {
-                padding: 16px 12px;
-            }
-
-            .message-content {
-                margin-left: 28px;
-            }
+async def call_upstream(fn, *args, read=False, **kwargs):
+    """Run a blocking assistant call under the upstream policy, counting failures
 
-            .links-section {
-                margin-left: 28px;
-            }
-
-            .typing-indicator {
-                margin-left: 28px;
-            }
+    With ``read`` the call is a read from an open stream: deadline only (see UpstreamPolicy.read).
+    """
+    try:
+        if read:
+            return await upstream.read(fn, *args, **kwargs)
+        return await upstream.call(fn, *args, **kwargs)
+    except QueueFullError:
+        UPSTREAM_ERRORS.inc(kind="queue_full")
+        raise
+    except CircuitOpenError:
+        UPSTREAM_ERRORS.inc(kind="circuit_open")
+        raise
+    except Exception as e:
+        UPSTREAM_ERRORS.inc(kind=type(e).__name__)
+        raise
+
+async def answer_query(request: QueryRequest) -> dict:
+    """Answer one question through the cache and the assistant; errors propagate.
+
+    Returns a validated ``{"answer", "links"}`` dict (see answers.normalize_answer).
+    Follow-ups in a session depend on the conversation, so only a session's
+    first question goes through the cache.
+    """
+    image = await prepare_image(request)
+    image_hash = cache_image_hash(image)
+    history = session_history(request)
+    use_cache = answer_cache is not None and not history
+    if use_cache:
+        with stage("cache"):
+            cached = answer_cache.get(request.question, image_hash)
+        if cached is not None:
+            record_turn(request, cached)
+            return cached
+
+    messages = history + [build_message(request, image)]
+    
+    # Get response from Pinecone assistant
+    try:
+        client = await get_assistant()
+        with stage("upstream"):
+            resp = await call_upstream(client.chat, messages=messages)
+    except Exception as e:
+        fallback = await fallback_answer(request, e)
+        if fallback is None:
+            raise
+        record_turn(request, fallback)
+        return fallback
+    
+    # The system prompt asks for JSON, but replies may be fenced, wrapped in prose or sloppy
+    reply = resp["message"]["content"]
+    try:
+        response, outcome = parse_reply(reply)
+    except InvalidAnswerError:
+        response, outcome = await retry_reply(messages, reply)
+    ANSWER_PARSES.inc(outcome=outcome)
+    response = await attach_links(request, response)
+    if use_cache:
+        answer_cache.set(request.question, image_hash, response)
+    record_turn(request, response)
+    return response
+
+async def fallback_answer(request: QueryRequest, error: Exception):
+    """Local answer while upstream is down or the circuit is open; None when not applicable.
+
+    Fallback answers are not cached, so the real answer replaces them once
+    upstream recovers.
+    """
+    global fallback_assistant
+    if UPSTREAM_FALLBACK != "local" or ANSWER_BACKEND == "local":
+        return None
+    if not (isinstance(error, CircuitOpenError) or is_transient(error)):
+        return None
+    async with fallback_lock:
+        if fallback_assistant is None:
+            fallback_assistant = LocalAssistant(
+                await asyncio.to_thread(load_corpus_index), top_k=LOCAL_TOP_K
+            )
+    UPSTREAM_FALLBACKS.inc(reason="circuit_open" if isinstance(error, CircuitOpenError) else "error")
+    with stage("fallback"):
+        # Searching may embed the question over the network (EMBEDDING_MODEL=openai:*)
+        return await asyncio.to_thread(fallback_assistant.answer, request.question)
+
+async def attach_links(request: QueryRequest, response):
+    """Replace or extend the assistant's links with the best matching corpus records (LINKS_SOURCE)"""
+    if LINKS_SOURCE not in ("retrieval", "both") or ANSWER_BACKEND == "local":
+        return response
+    index = await asyncio.to_thread(load_corpus_index)
+    with stage("retrieve"):
+        links = hit_links(await asyncio.to_thread(index.search, request.question, LINKS_MAX * 4), limit=LINKS_MAX)
+    if LINKS_SOURCE == "both":
+        urls = {link["url"] for link in links}
+        links += [link for link in response["links"] if link["url"] not in urls]
+    return {"answer": response["answer"], "links": links}
+
+def parse_reply(reply):
+    """Decode and normalize an assistant reply; returns (response, "strict" or "repaired")"""
+    if isinstance(reply, dict):
+        with stage("validate"):
+            return normalize_answer(reply), "strict"
+    with stage("decode"):
+        data, repaired = extract_json(reply)
+    with stage("validate"):
+        return normalize_answer(data), "repaired" if repaired else "strict"
+
+async def retry_reply(messages, reply):
+    """Fallback for an unrepairable reply: ask once for JSON only, else answer with the prose"""
+    if ANSWER_RETRY:
+        followup = messages + [{"role": "assistant", "content": reply}, {"role": "user", "content": REFORMAT_PROMPT}]
+        try:
+            with stage("retry"):
+                resp = await call_upstream((await get_assistant()).chat, messages=followup)
+            return parse_reply(resp["message"]["content"])[0], "retried"
+        except Exception:
+            pass
+    return prose_answer(reply), "prose"
+
+def json_response(value):
+    """Pre-serialized JSON response: skips response_model validation and the stdlib encoder
+
+    Ends the handler's timing first, so encoding counts in the "serialize" stage the middleware records.
+    """
+    handler_finished()
+    return Response(content=dumps(value), media_type="application/json")
+
+def error_detail(e: Exception):
+    if isinstance(e, (ImageTooLargeError, InvalidImageError)):
+        return str(e)
+    if isinstance(e, (QueueFullError, CircuitOpenError)):
+        return f"Assistant is busy, try again shortly: {str(e)}"
+    if isinstance(e, UpstreamTimeoutError):
+        return f"Assistant timed out: {str(e)}"
+    return f"Error processing query: {str(e)}"
 
-            .input-section {
-                padding: 12px;
-            }
+@app.post("/api/", response_model=QueryResponse)
+async def process_query(request: QueryRequest):
+    handler_started()
+    try:
+        return json_response(await answer_query(request))
+    except ImageTooLargeError as e:
+        raise HTTPException(status_code=413, detail=error_detail(e))
+    except InvalidImageError as e:
+        raise HTTPException(status_code=400, detail=error_detail(e))
+    except (QueueFullError, CircuitOpenError) as e:
+        raise HTTPException(status_code=503, detail=error_detail(e))
+    except UpstreamTimeoutError as e:
+        raise HTTPException(status_code=504, detail=error_detail(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=error_detail(e))
+    finally:
+        handler_finished()
+
+async def batch_results(requests: list[QueryRequest]):
+    """Answer a batch with bounded fan-out, yielding BatchResult dicts as they complete.
+
+    Identical questions (same normalized text, image and session) are answered once
+    and the result is reported for every index that asked it.
+    """
+    indices_by_key = {}
+    for index, request in enumerate(requests):
+        key = (cache_key(normalize_question(request.question), image_digest(request.image)), request.session_id)
+        indices_by_key.setdefault(key, []).append(index)
+
+    semaphore = asyncio.Semaphore(BATCH_MAX_CONCURRENCY)
+
+    async def answer_one(indices):
+        async with semaphore:
+            try:
+                return indices, await answer_query(requests[indices[0]]), None
+            except Exception as e:
+                return indices, None, error_detail(e)
+
+    for task in asyncio.as_completed([answer_one(indices) for indices in indices_by_key.values()]):
+        indices, response, error = await task
+        for index in indices:
+            if error is None:
+                yield {"index": index, "answer": response["answer"], "links": response["links"], "error": None}
+            else:
+                yield {"index": index, "answer": None, "links": [], "error": error}
+
+@app.post("/api/batch", response_model=list[BatchResult])
+async def process_batch(requests: list[QueryRequest], stream: bool = Query(False)):
+    """Answer many questions in one request; `?stream=true` sends NDJSON lines as they finish"""
+    if len(requests) > BATCH_MAX_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large: {len(requests)} > {BATCH_MAX_SIZE}")
+    handler_started()
+    if stream:
+        async def ndjson_lines():
+            try:
+                async for result in batch_results(requests):
+                    yield dumps(result) + b"\n"
+            finally:
+                handler_finished()
+        return StreamingResponse(ndjson_lines(), media_type="application/x-ndjson")
+    try:
+        results = [result async for result in batch_results(requests)]
+        return json_response(sorted(results, key=lambda result: result["index"]))
+    finally:
+        handler_finished()
 
-            .avatar {
-                width: 20px;
-                height: 20px;
-                font-size: 12px;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="chat-container">
-        <div class="header">
-            <h1>TDS Virtual Assistant</h1>
-        </div>
-        
-        <div class="chat-messages" id="chatMessages">
-            <div class="empty-state">
-                <div class="empty-state-icon">🤖</div>
-                <h2>Welcome to TDS Assistant</h2>
-                <p>Ask me anything or upload an image to get started. I'm here to help!</p>
-            </div>
-        </div>
-        
-        <div class="input-section">
-            <div class="input-container">
-                <div class="image-upload-wrapper">
-                    <div class="image-upload">
-                        <input type="file" id="imageInput" accept="image/*">
-                        <button type="button" class="image-upload-button">📎</button>
-                    </div>
-                </div>
-                <textarea 
-                    id="messageInput" 
-                    class="message-input" 
-                    placeholder="Message TDS Assistant..."
-                    rows="1"
-                ></textarea>
-                <button id="sendButton" class="send-button">↑</button>
-            </div>
-            <img id="imagePreview" class="image-preview" style="display: none;">
-        </div>
-    </div>
-
-    <script>
-        const chatMessages = document.getElementById('chatMessages');
-        const messageInput = document.getElementById('messageInput');
-        const sendButton = document.getElementById('sendButton');
-        const imageInput = document.getElementById('imageInput');
-        const imagePreview = document.getElementById('imagePreview');
-        
-        let currentImage = null;
-        
-        // Auto-resize textarea
-        messageInput.addEventListener('input', function() {
-            this.style.height = 'auto';
-            this.style.height = Math.min(this.scrollHeight, 120) + 'px';
-        });
-        
-        // Handle image upload
-        imageInput.addEventListener('change', function(e) {
-            const file = e.target.files[0];
-            if (file) {
-                const reader = new FileReader();
-                reader.onload = function(e) {
-                    currentImage = e.target.result.split(',')[1];
-                    imagePreview.src = e.target.result;
-                    imagePreview.style.display = 'block';
-                };
-                reader.readAsDataURL(file);
-            }
-        });
-        
-        // Send message on Enter
-        messageInput.addEventListener('keydown', function(e) {
-            if (e.key === 'Enter' && !e.shiftKey) {
-                e.preventDefault();
-                sendMessage();
-            }
-        });
-        
-        sendButton.addEventListener('click', sendMessage);
-        
-        function clearEmptyState() {
-            const emptyState = chatMessages.querySelector('.empty-state');
-            if (emptyState) {
-                emptyState.remove();
-            }
-        }
-        
-        function addMessage(content, isUser = false, links = []) {
-            clearEmptyState();
-            
-            const messageDiv = document.createElement('div');
-            messageDiv.className = `message ${isUser ? 'user' : 'assistant'}`;
-            
-            let messageHTML = `
-                <div class="message-header">
-                    <div class="avatar ${isUser ? 'user-avatar' : 'assistant-avatar'}">
-                        ${isUser ? 'U' : 'AI'}
-                    </div>
-                    <span class="message-author">${isUser ? 'You' : 'TDS Assistant'}</span>
-                </div>
-                <div class="message-content">${content}</div>
-            `;
-            
-            if (Array.isArray(links) && links.length > 0) {
-                messageHTML += `
-                    <div class="links-section">
-                        <div class="links-title">Related Links</div>
-                        ${links.map(link => `
-                            <a href="${link.url}" target="_blank" class="link-item">
-                                ${link.url.length > 50 ? link.url.substring(0, 47) + '...' : link.url}
-                            </a>
-                        `).join('')}
-                    </div>
-                `;
-        }
-            
-            messageDiv.innerHTML = messageHTML;
-            chatMessages.appendChild(messageDiv);
-            chatMessages.scrollTop = chatMessages.scrollHeight;
-        }
-        
-        function addTypingIndicator() {
-            clearEmptyState();
-            const messageDiv = document.createElement('div');
-            messageDiv.className = 'message assistant';
-            messageDiv.id = 'typing-indicator';
-            messageDiv.innerHTML = `
-                <div class="message-header">
-                    <div class="avatar assistant-avatar">AI</div>
-                    <span class="message-author">TDS Assistant</span>
-                </div>
-                <div class="typing-indicator">
-                    <div class="typing-dot"></div>
-                    <div class="typing-dot"></div>
-                    <div class="typing-dot"></div>
-                </div>
-            `;
-            chatMessages.appendChild(messageDiv);
-            chatMessages.scrollTop = chatMessages.scrollHeight;
-        }
-        
-        function removeTypingIndicator() {
-            const typingIndicator = document.getElementById('typing-indicator');
-            if (typingIndicator) {
-                typingIndicator.remove();
-            }
-        }
-        
-        async function sendMessage() {
-            const message = messageInput.value.trim();
-            if (!message && !currentImage) return;
-            
-            // Add user message
-            if (message) {
-                addMessage(message, true);
-            }
-            
-            // Clear input
-            messageInput.value = '';
-            messageInput.style.height = 'auto';
-            
-            // Disable send button and show loading
-            sendButton.disabled = true;
-            sendButton.innerHTML = '<div class="loading-spinner"></div>';
-            
-            // Add typing indicator
-            addTypingIndicator();
-            
-            try {
-                const requestBody = {
-                    question: message || "Please analyze this image"
-                };
-                
-                if (currentImage) {
-                    requestBody.image = currentImage;
-                }
-                
-                // Use relative URL since we're serving from same domain
-                const response = await fetch('/api/', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify(requestBody)
-                });
-                
-                if (!response.ok) {
-                    throw new Error(`HTTP error! status: ${response.status}`);
-                }
-                
-                const data = await response.json();
-                
-                // Remove typing indicator
-                removeTypingIndicator();
-                
-                // Add assistant response
-                addMessage(data.answer, false, data.links);
-                
-            } catch (error) {
-                removeTypingIndicator();
-                addMessage(`Sorry, I encountered an error: ${error.message}`, false);
-            } finally {
-                // Re-enable send button
-                sendButton.disabled = false;
-                sendButton.innerHTML = '↑';
-                
-                // Clear image
-                currentImage = null;
-                imagePreview.style.display = 'none';
-                imageInput.value = '';
-                
-                // Focus back to input
-                messageInput.focus();
-            }
-        }
-        
-        // Focus on input when page loads
-        window.addEventListener('DOMContentLoaded', () => {
-            messageInput.focus();
-        });
-    </script>
-</body>
-</html>
-"""
+# next() default marking the end of an assistant stream. Not None: the Pinecone SDK
+# yields None for stream events it does not recognise
+_STREAM_END = object()
 
-@app.get("/", response_class=HTMLResponse)
-async def serve_frontend():
-    """Serve the chat interface at the root URL"""
-    return HTML_TEMPLATE
+async def answer_events(request: QueryRequest):
+    """Yield the answer as SSE `token` events, then a `links` and a `done` event"""
+    try:
+        image = await prepare_image(request)
+    except (ImageTooLargeError, InvalidImageError) as e:
+        yield sse_event("error", {"detail": error_detail(e)})
+        return
+    image_hash = cache_image_hash(image)
+    history = session_history(request)
+    use_cache = answer_cache is not None and not history
+    if use_cache:
+        with stage("cache"):
+            cached = answer_cache.get(request.question, image_hash)
+        if cached is not None:
+            record_turn(request, cached)
+            for event in answer_replay(cached):
+                yield event
+            return
 
-@app.post("/api/", response_model=QueryResponse)
-async def process_query(request: QueryRequest):
     try:
-        # Prepare message for Pinecone assistant
-        message = {
-            "role": "user",
-            "content": request.question
-        }
-        
-        if request.image:
-            message["image"] = {
-                "data": request.image
-            }
-        
-        # Get response from Pinecone assistant
-        resp = assistant.chat(messages=[message])
-        
-        # Assume response is already in the correct format due to system prompt
-        response_data = resp["message"]["content"]
-        
-        # If response is a string, try to parse it as JSON (in case Pinecone returns JSON as string)
-        if isinstance(response_data, str):
-            response_data = json.loads(response_data)
-        
-        return QueryResponse(**response_data)
-    
+        messages = history + [build_message(request, image)]
+        try:
+            client = await get_assistant()
+            upstream_start = time.perf_counter()
+            # Opening the stream may be retried; once chunks flow a failure ends the answer
+            # Not sampled for hedge_delay: streams are never hedged and open long before they finish
+            chunks = await call_upstream(client.chat, messages=messages, stream=True, hedge=False, sample=False)
+        except Exception as e:
+            fallback = await fallback_answer(request, e)
+            if fallback is None:
+                raise
+            record_turn(request, fallback)
+            for event in answer_replay(fallback):
+                yield event
+            return
+        extractor = AnswerStreamExtractor()
+        upstream_wait = 0.0
+        while True:
+            # Each next() blocks on the network, so it runs on the executor too
+            wait_start = time.perf_counter()
+            chunk = await call_upstream(next, chunks, _STREAM_END, read=True)
+            upstream_wait += time.perf_counter() - wait_start
+            if chunk is _STREAM_END:
+                break
+            if chunk is None:
+                continue
+            if "first_token" not in request_timings():
+                record_stage("first_token", time.perf_counter() - upstream_start)
+            text = extractor.feed(chunk_text(chunk))
+            if text:
+                yield sse_event("token", {"text": text})
+        record_stage("upstream", upstream_wait)
+
+        # Tokens are already out, so no retry here: repair, or keep the prose as the answer
+        try:
+            if not extractor.is_json:
+                raise InvalidAnswerError("Reply is not JSON")
+            response, outcome = parse_reply(extractor.text)
+        except InvalidAnswerError:
+            response, outcome = prose_answer(extractor.text), "prose"
+        ANSWER_PARSES.inc(outcome=outcome)
+        response = await attach_links(request, response)
+        if use_cache:
+            answer_cache.set(request.question, image_hash, response)
+        record_turn(request, response)
+        yield sse_event("links", response["links"])
+        yield sse_event("done", done_payload())
+
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing query: {str(e)}")
+        yield sse_event("error", {"detail": error_detail(e)})
+
+def answer_replay(response):
+    """SSE events for an answer that is already complete (cache hit or fallback)"""
+    yield sse_event("token", {"text": response["answer"]})
+    yield sse_event("links", response["links"])
+    yield sse_event("done", done_payload())
+
+def done_payload():
+    """Final SSE event; carries the stage timings when SERVER_TIMING is on"""
+    if not SERVER_TIMING:
+        return {}
+    return {"timings": {name: round(seconds * 1000, 2) for name, seconds in request_timings().items()}}
+
+@app.post("/api/stream")
+async def stream_query(request: QueryRequest):
+    handler_started()
+
+    async def events():
+        try:
+            async for event in answer_events(request):
+                yield event
+        finally:
+            handler_finished()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/api/cache")
+async def cache_stats():
+    if answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **answer_cache.stats()}
+
+@app.post("/api/session")
+async def create_session():
+    """Start a conversation: pass the returned session_id with each question of it"""
+    if sessions is None:
+        raise HTTPException(status_code=404, detail="Sessions are disabled")
+    return {"session_id": new_session_id()}
+
+@app.delete("/api/session/{session_id}")
+async def delete_session(session_id: str):
+    if sessions is not None:
+        sessions.delete(session_id)
+    return {"deleted": session_id}
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
 
 @app.get("/api/test")
 async def test(): 
     return {"response": "Test Done"}
+
+# Added last so it wraps every route and knows their paths
+app.add_middleware(
+    MetricsMiddleware,
+    paths=[route.path for route in app.routes],
+    server_timing=SERVER_TIMING,
+)
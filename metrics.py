@@ -0,0 +1,255 @@
+"""Minimal Prometheus-style metrics and per-request stage timing.
+
+Kept dependency-free (no prometheus_client) so the serverless bundle stays
+small. ``render`` produces the text exposition format served at /metrics.
+"""
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """A gauge that is either set directly or read from ``callback`` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labels=(), callback=None):
+        super().__init__(name, help_text, labels)
+        self._values = {}
+        self.callback = callback
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def samples(self):
+        if self.callback is not None:
+            value = self.callback()
+            return [] if value is None else [f"{self.name} {value}"]
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def samples(self):
+        lines = []
+        for key, series in sorted(self._series.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', bound)])} {count}")
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, [('le', '+Inf')])} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {series[-2]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, *args, **kwargs):
+        return self.register(Counter(*args, **kwargs))
+
+    def gauge(self, *args, **kwargs):
+        return self.register(Gauge(*args, **kwargs))
+
+    def histogram(self, *args, **kwargs):
+        return self.register(Histogram(*args, **kwargs))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.header())
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    "virtual_ta_request_seconds", "End-to-end request latency.", labels=("path", "status"))
+STAGE_SECONDS = REGISTRY.histogram(
+    "virtual_ta_stage_seconds", "Time spent in each stage of a request.", labels=("path", "stage"))
+REQUESTS_IN_FLIGHT = REGISTRY.gauge(
+    "virtual_ta_requests_in_flight", "Requests currently being handled.", labels=("path",))
+UPSTREAM_ERRORS = REGISTRY.counter(
+    "virtual_ta_upstream_errors_total", "Failed assistant calls by error type.", labels=("kind",))
+UPSTREAM_RETRIES = REGISTRY.counter(
+    "virtual_ta_upstream_retries_total", "Assistant calls retried after a transient failure.")
+UPSTREAM_HEDGES = REGISTRY.counter(
+    "virtual_ta_upstream_hedges_total", "Duplicate assistant calls sent after the hedge delay.")
+UPSTREAM_FALLBACKS = REGISTRY.counter(
+    "virtual_ta_upstream_fallbacks_total", "Answers served by the fallback while upstream failed.",
+    labels=("reason",))
+ANSWER_PARSES = REGISTRY.counter(
+    "virtual_ta_answer_parses_total", "Assistant replies by how they were parsed.", labels=("outcome",))
+
+
+# Stage timings of the current request: (path, {stage: seconds}, marks)
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+@contextmanager
+def stage(name):
+    """Time a block as stage ``name`` of the current request."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+
+def record_stage(name, seconds):
+    current = _request_timings.get()
+    path = current[0] if current else ""
+    STAGE_SECONDS.observe(seconds, path=path, stage=name)
+    if current:
+        current[1][name] = current[1].get(name, 0.0) + seconds
+
+
+def request_timings():
+    """{stage: seconds} recorded so far for the current request."""
+    current = _request_timings.get()
+    return dict(current[1]) if current else {}
+
+
+def handler_started():
+    """Mark the start of the endpoint body; the time before it is request parsing."""
+    current = _request_timings.get()
+    if current:
+        record_stage("parse", time.perf_counter() - current[2]["start"])
+
+
+def handler_finished():
+    """Mark the end of the endpoint body; the time after it is response serialization.
+
+    The first call wins, so a handler can mark its end before it serializes
+    the response and still call this again from a ``finally``.
+    """
+    current = _request_timings.get()
+    if current:
+        current[2].setdefault("handler_end", time.perf_counter())
+
+
+def server_timing_header(timings):
+    return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in timings.items())
+
+
+class MetricsMiddleware:
+    """ASGI middleware: in-flight gauge, request histogram and Server-Timing.
+
+    Runs in the endpoint's task, so stages recorded by the handler land in
+    this request's context. Unknown paths are folded into "other" to keep
+    label cardinality bounded.
+    """
+
+    def __init__(self, app, paths=(), server_timing=False):
+        self.app = app
+        self.paths = set(paths)
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        path = scope["path"] if scope["path"] in self.paths else "other"
+        start = time.perf_counter()
+        marks = {"start": start}
+        token = _request_timings.set((path, {}, marks))
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                if "handler_end" in marks:
+                    record_stage("serialize", time.perf_counter() - marks.pop("handler_end"))
+                if self.server_timing:
+                    timings = request_timings()
+                    timings["total"] = time.perf_counter() - start
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", server_timing_header(timings).encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc(path=path)
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUESTS_IN_FLIGHT.dec(path=path)
+            REQUEST_SECONDS.observe(time.perf_counter() - start, path=path, status=status["code"])
+            _request_timings.reset(token)
@@ -0,0 +1,287 @@
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+
+from chunking import chunk_records
+from streaming import content_chunks
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+DATA_SOURCES = ["discourse", "tds_website"]
+
+# Hybrid search: candidates taken from each ranking, the RRF constant, how many fused
+# results the cross-scorer re-ranks and how much its score counts against the fused one
+CANDIDATES = 50
+RRF_K = 60
+RERANK_DEPTH = 20
+RERANK_WEIGHT = 0.5
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be but by can do does for from has have how i if in is it "
+    "its me my no not of on or should so that the their there this to was we what "
+    "when which who will with would you your".split()
+)
+
+
+def tokenize(text):
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+def _unquote(value):
+    # Some records were written with the JSON quotes still around them
+    if isinstance(value, str) and len(value) >= 2 and value[0] == value[-1] == '"':
+        return value[1:-1]
+    return value
+
+
+def iter_json_records(path):
+    """Yield records from a JSON array file or, for .jsonl, one per line."""
+    with open(path, encoding="utf-8") as f:
+        if path.endswith(".jsonl"):
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+        else:
+            yield from json.load(f)
+
+
+def data_files(data_dir=DATA_DIR):
+    """Names of the corpus files in ``data_dir``: each source's .jsonl or .json, the newer if both exist.
+
+    ``python ingest.py --format`` picks the format, and an older file in the
+    other format is ignored rather than read twice.
+    """
+    names = []
+    for source in DATA_SOURCES:
+        present = [name for name in (f"{source}.jsonl", f"{source}.json")
+                   if os.path.exists(os.path.join(data_dir, name))]
+        if present:
+            names.append(max(present, key=lambda name: os.path.getmtime(os.path.join(data_dir, name))))
+    return names
+
+
+def load_records(data_dir=DATA_DIR, files=None):
+    """Load the flattened corpus records ({url, title, content}, plus topic_id, post numbers and chunk for posts)."""
+    records = []
+    for name in files or data_files(data_dir):
+        path = os.path.join(data_dir, name)
+        for record in iter_json_records(path):
+            records.append({
+                "url": _unquote(record.get("url", "")),
+                "title": _unquote(record.get("topic_title", "")),
+                "content": record.get("content") or "",
+            })
+            for key in ("topic_id", "post_number", "reply_to_post_number", "chunk"):
+                if record.get(key) is not None:
+                    records[-1][key] = record[key]
+    return records
+
+
+def build_chunks(records):
+    """Token-budgeted chunks of the corpus (see chunking.py)."""
+    return chunk_records(records)
+
+
+class BM25Index:
+    """Okapi BM25 over a list of chunks, using an inverted index."""
+
+    def __init__(self, chunks, k1=1.5, b=0.75):
+        self.chunks = chunks
+        self.k1 = k1
+        self.b = b
+        self.postings = defaultdict(list)  # term -> [(chunk_idx, term_freq)]
+        self.doc_len = []
+        for idx, chunk in enumerate(chunks):
+            terms = tokenize(chunk["title"] + " " + chunk["content"])
+            self.doc_len.append(len(terms))
+            for term, tf in Counter(terms).items():
+                self.postings[term].append((idx, tf))
+        n = len(chunks)
+        self.avg_len = (sum(self.doc_len) / n) if n else 0.0
+        self.idf = {
+            term: math.log(1 + (n - len(p) + 0.5) / (len(p) + 0.5))
+            for term, p in self.postings.items()
+        }
+
+    def scores(self, query):
+        """Return {chunk_idx: score} for every chunk matching a query term."""
+        scores = defaultdict(float)
+        k1, b, avg_len = self.k1, self.b, self.avg_len or 1.0
+        for term in set(tokenize(query)):
+            idf = self.idf.get(term)
+            if idf is None:
+                continue
+            for idx, tf in self.postings[term]:
+                norm = k1 * (1 - b + b * self.doc_len[idx] / avg_len)
+                scores[idx] += idf * tf * (k1 + 1) / (tf + norm)
+        return scores
+
+    def search(self, query, k=5):
+        scores = self.scores(query)
+        top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [(score, self.chunks[idx]) for idx, score in top]
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse ranked lists of ids: each list adds 1 / (k + rank) to every id it holds."""
+    fused = defaultdict(float)
+    for ranking in rankings:
+        for rank, idx in enumerate(ranking, start=1):
+            fused[idx] += 1.0 / (k + rank)
+    return fused
+
+
+def _proximity(tokens, terms):
+    """Matched query terms over the shortest token span holding all of them (0 to 1)."""
+    positions = [(i, token) for i, token in enumerate(tokens) if token in terms]
+    needed = len({token for _, token in positions})
+    if not needed:
+        return 0.0
+    counts = Counter()
+    have, left, best = 0, 0, len(tokens)
+    for position, token in positions:
+        counts[token] += 1
+        have += counts[token] == 1
+        while have == needed:
+            start, first = positions[left]
+            best = min(best, position - start + 1)
+            counts[first] -= 1
+            have -= counts[first] == 0
+            left += 1
+    return needed / best
+
+
+def cross_score(query, chunk, idf):
+    """Score a (query, chunk) pair read together, from 0 to 1.
+
+    Unlike BM25 and the embeddings, which score query and chunk
+    independently, this looks at how they line up: the idf-weighted share
+    of query terms the chunk (and its title) contains, query bigrams that
+    occur as bigrams in the chunk, and how close together the matches are.
+    """
+    terms = tokenize(query)
+    weights = {term: idf.get(term, 0.0) for term in terms}
+    total = sum(weights.values())
+    if not total:
+        return 0.0
+    tokens = tokenize(chunk["content"])
+    title_terms = set(tokenize(chunk["title"]))
+    present = set(tokens) | title_terms
+    coverage = sum(w for term, w in weights.items() if term in present) / total
+    title = sum(w for term, w in weights.items() if term in title_terms) / total
+    pairs = set(zip(terms, terms[1:]))
+    phrase = len(pairs & set(zip(tokens, tokens[1:]))) / len(pairs) if pairs else 0.0
+    proximity = _proximity(tokens, weights.keys()) * len(present & weights.keys()) / len(weights)
+    return 0.4 * coverage + 0.2 * title + 0.2 * phrase + 0.2 * proximity
+
+
+class HybridIndex:
+    """BM25 and embedding rankings fused with RRF, the head re-ranked by ``cross_score``.
+
+    Lexical search finds exact names (GA4, Podman); the vectors catch
+    inflections and near-misses it does not. Search returns ``(score,
+    chunk)`` pairs like ``BM25Index.search``.
+    """
+
+    def __init__(self, bm25, vectors, candidates=CANDIDATES, rrf_k=RRF_K,
+                 rerank_depth=RERANK_DEPTH, rerank_weight=RERANK_WEIGHT):
+        self.bm25 = bm25
+        self.vectors = vectors
+        self.chunks = bm25.chunks
+        self.candidates = candidates
+        self.rrf_k = rrf_k
+        self.rerank_depth = rerank_depth
+        self.rerank_weight = rerank_weight
+
+    @classmethod
+    def from_chunks(cls, chunks, embedder=None, **kwargs):
+        from embeddings import VectorIndex  # numpy is only needed once an index is built
+
+        return cls(BM25Index(chunks), VectorIndex(chunks, embedder), **kwargs)
+
+    @classmethod
+    def from_store(cls, store, **kwargs):
+        """Index a vector_store.VectorStore: its vectors and BM25 postings are used as mapped, not rebuilt."""
+        from embeddings import VectorIndex
+
+        vectors = VectorIndex(store.chunks, store.embedder(), store.vectors, ann=store.ann)
+        return cls(store.bm25(), vectors, **kwargs)
+
+    @classmethod
+    def from_corpus(cls, data_dir=DATA_DIR, **kwargs):
+        """Open data_dir/index when it is current (see vector_store.py), else chunk and embed the JSON."""
+        from vector_store import open_store
+
+        store = None if "embedder" in kwargs else open_store(os.path.join(data_dir, "index"), data_dir)
+        if store is not None:
+            return cls.from_store(store, **kwargs)
+        return cls.from_chunks(build_chunks(load_records(data_dir)), **kwargs)
+
+    def search(self, query, k=5):
+        lexical = heapq.nlargest(self.candidates, self.bm25.scores(query).items(), key=lambda item: item[1])
+        semantic = self.vectors.nearest(query, self.candidates)
+        fused = reciprocal_rank_fusion([[idx for idx, _ in lexical], [idx for idx, _ in semantic]], self.rrf_k)
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+        if not ranked:
+            return []
+
+        head, tail = ranked[:self.rerank_depth], ranked[self.rerank_depth:]
+        if self.rerank_depth:
+            best = head[0][1]
+            weight = self.rerank_weight
+            head = sorted(
+                ((idx, (1 - weight) * score / best + weight * cross_score(query, self.chunks[idx], self.bm25.idf))
+                 for idx, score in head),
+                key=lambda item: item[1], reverse=True,
+            )
+        return [(score, self.chunks[idx]) for idx, score in (head + tail)[:k]]
+
+
+def hit_links(hits, limit=None):
+    """{url, text} links of search hits, best first, one per URL."""
+    links, seen = [], set()
+    for _, chunk in hits:
+        if chunk["url"] and chunk["url"] not in seen:
+            seen.add(chunk["url"])
+            links.append({"url": chunk["url"], "text": chunk["title"] or chunk["url"]})
+            if limit and len(links) == limit:
+                break
+    return links
+
+
+class LocalAssistant:
+    """In-process stand-in for the Pinecone assistant.
+
+    ``chat`` answers from the best matching corpus chunks instead of an LLM and
+    returns the same ``{"message": {"content": ...}}`` shape (or stream of
+    ``content_chunk`` deltas) as the remote client, so ``process_query`` can
+    use either backend.
+    """
+
+    def __init__(self, index, top_k=5, answer_chars=800):
+        self.index = index
+        self.top_k = top_k
+        self.answer_chars = answer_chars
+
+    @classmethod
+    def from_corpus(cls, data_dir=DATA_DIR, **kwargs):
+        return cls(HybridIndex.from_corpus(data_dir), **kwargs)
+
+    def answer(self, question):
+        hits = self.index.search(question, k=self.top_k)
+        if not hits:
+            return {"answer": "I couldn't find anything about that in the course material.", "links": []}
+        links = hit_links(hits)
+        answer = hits[0][1]["content"]
+        if len(answer) > self.answer_chars:
+            answer = answer[:self.answer_chars].rsplit(" ", 1)[0] + "..."
+        return {"answer": answer, "links": links}
+
+    def chat(self, messages, stream=False, **kwargs):
+        answer = self.answer(messages[-1]["content"])
+        if stream:
+            return content_chunks(json.dumps(answer))
+        return {"message": {"role": "assistant", "content": answer}}
@@ -0,0 +1,168 @@
+"""Server-side conversation history for multi-turn chat, bounded per session.
+
+Each session keeps its most recent turns verbatim within a token budget;
+turns pushed out of the budget are folded into a short running summary,
+so the messages sent upstream (and the memory held per session) stop
+growing after a few turns. Sessions live in an LRU store, in memory or in
+SQLite so they survive restarts.
+"""
+import json
+import re
+import secrets
+import sqlite3
+import time
+from collections import OrderedDict, namedtuple
+
+Session = namedtuple("Session", ["summary", "turns", "updated_at"])  # turns: [[question, answer], ...]
+
+SENTENCE_RE = re.compile(r"(?<=[.!?])\s+")
+WHITESPACE_RE = re.compile(r"\s+")
+
+
+def new_session_id():
+    return secrets.token_urlsafe(16)
+
+
+def estimate_tokens(text):
+    """Cheap token estimate (~4 characters per token for English text)."""
+    return len(text) // 4 + 1
+
+
+def _clip(text, max_chars):
+    text = WHITESPACE_RE.sub(" ", text).strip()
+    return text if len(text) <= max_chars else text[:max_chars - 3].rstrip() + "..."
+
+
+def extractive_summary(summary, turns, max_tokens):
+    """Default summarizer: one line per turn (question and the answer's first sentence).
+
+    Oldest lines are dropped first once the summary exceeds ``max_tokens``.
+    """
+    lines = summary.splitlines() if summary else []
+    for question, answer in turns:
+        first_sentence = SENTENCE_RE.split(answer.strip(), 1)[0]
+        lines.append(f"- Q: {_clip(question, 160)} A: {_clip(first_sentence, 240)}")
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class MemorySessionStore:
+    """In-process LRU store: least recently used sessions sit at the front."""
+
+    def __init__(self):
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, session_id):
+        session = self._data.get(session_id)
+        if session is not None:
+            self._data.move_to_end(session_id)
+        return session
+
+    def put(self, session_id, session):
+        self._data[session_id] = session
+        self._data.move_to_end(session_id)
+
+    def delete(self, session_id):
+        self._data.pop(session_id, None)
+
+    def pop_oldest(self):
+        session_id, _ = self._data.popitem(last=False)
+        return session_id
+
+
+class SQLiteSessionStore:
+    """On-disk LRU store so conversations survive restarts and are shared by workers."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, summary TEXT, turns TEXT, updated_at REAL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at)")
+
+    def __len__(self):
+        return self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def get(self, session_id):
+        row = self._conn.execute(
+            "SELECT summary, turns, updated_at FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return Session(row[0], json.loads(row[1]), row[2])
+
+    def put(self, session_id, session):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions VALUES (?, ?, ?, ?)",
+            (session_id, session.summary, json.dumps(session.turns), session.updated_at),
+        )
+
+    def delete(self, session_id):
+        self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def pop_oldest(self):
+        row = self._conn.execute("SELECT id FROM sessions ORDER BY updated_at LIMIT 1").fetchone()
+        self.delete(row[0])
+        return row[0]
+
+
+class SessionManager:
+    """Keeps each conversation within ``token_budget`` recent tokens plus a summary.
+
+    ``summarize(summary, turns, max_tokens)`` folds evicted turns into the
+    running summary; the default is extractive and free. At most
+    ``max_sessions`` are kept (least recently used evicted) and sessions
+    idle for ``ttl`` seconds start over.
+    """
+
+    def __init__(self, max_sessions=10000, ttl=86400, token_budget=1500, summary_tokens=300,
+                 summarize=extractive_summary, path=None):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self.summarize = summarize
+        self.store = SQLiteSessionStore(path) if path else MemorySessionStore()
+
+    def __len__(self):
+        return len(self.store)
+
+    def get(self, session_id):
+        session = self.store.get(session_id)
+        if session is not None and self.ttl and time.time() - session.updated_at > self.ttl:
+            self.store.delete(session_id)
+            return None
+        return session
+
+    def history(self, session_id):
+        """Messages to send before the new question: the summary, then the kept turns."""
+        session = self.get(session_id)
+        if session is None:
+            return []
+        messages = []
+        if session.summary:
+            messages.append({"role": "user", "content": f"Summary of our conversation so far:\n{session.summary}"})
+        for question, answer in session.turns:
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
+        return messages
+
+    def record(self, session_id, question, answer):
+        """Append a turn, then fold the oldest turns into the summary until it fits the budget."""
+        session = self.get(session_id) or Session("", [], 0.0)
+        turns = session.turns + [[question, answer]]
+        evicted = []
+        while len(turns) > 1 and sum(estimate_tokens(q) + estimate_tokens(a) for q, a in turns) > self.token_budget:
+            evicted.append(turns.pop(0))
+        summary = self.summarize(session.summary, evicted, self.summary_tokens) if evicted else session.summary
+        self.store.put(session_id, Session(summary, turns, time.time()))
+        while len(self.store) > self.max_sessions:
+            self.store.pop_oldest()
+
+    def delete(self, session_id):
+        self.store.delete(session_id)
@@ -0,0 +1,99 @@
+import re
+
+from answers import dumps
+
+ANSWER_KEY_RE = re.compile(r'"answer"\s*:\s*"')
+SIMPLE_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+
+
+def sse_event(event, data):
+    """Format one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {dumps(data).decode()}\n\n"
+
+
+def chunk_text(chunk):
+    """Text delta carried by an assistant stream chunk, or '' for other chunk types."""
+    if chunk["type"] != "content_chunk":
+        return ""
+    return chunk["delta"]["content"] or ""
+
+
+def content_chunks(text, size=16):
+    """Split a full reply into assistant-style ``content_chunk`` deltas."""
+    for i in range(0, len(text), size):
+        yield {"type": "content_chunk", "delta": {"content": text[i:i + size]}}
+
+
+class AnswerStreamExtractor:
+    """Pulls the ``answer`` string out of a JSON reply as it streams in.
+
+    The assistant replies with ``{"answer": "...", "links": [...]}``, so the
+    raw deltas are JSON text. ``feed`` returns the newly decoded part of the
+    answer value, holding back incomplete escape sequences until the next
+    delta. Replies that turn out not to be JSON are passed through as is.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self._mode = "seek"
+        self._pos = 0
+
+    def feed(self, delta):
+        self.text += delta
+        if self._mode == "seek":
+            stripped = self.text.lstrip()
+            if stripped and stripped[0] not in "{`":
+                self._mode = "raw"
+                self._pos = len(self.text)
+                return self.text
+            match = ANSWER_KEY_RE.search(self.text)
+            if not match:
+                return ""
+            self._mode = "string"
+            self._pos = match.end()
+        if self._mode == "raw":
+            self._pos = len(self.text)
+            return delta
+        if self._mode == "string":
+            return self._decode()
+        return ""
+
+    def _decode(self):
+        out = []
+        text, i = self.text, self._pos
+        while i < len(text):
+            char = text[i]
+            if char == '"':
+                self._mode = "done"
+                i += 1
+                break
+            if char != "\\":
+                out.append(char)
+                i += 1
+                continue
+            if i + 1 >= len(text):
+                break
+            escape = text[i + 1]
+            if escape == "u":
+                if i + 6 > len(text):
+                    break
+                code = int(text[i + 2:i + 6], 16)
+                if 0xD800 <= code < 0xDC00:
+                    # High surrogate: wait for its low half and combine them
+                    if i + 12 > len(text):
+                        break
+                    low = int(text[i + 8:i + 12], 16)
+                    out.append(chr(0x10000 + ((code - 0xD800) << 10) + (low - 0xDC00)))
+                    i += 12
+                    continue
+                out.append(chr(code))
+                i += 6
+            else:
+                out.append(SIMPLE_ESCAPES.get(escape, escape))
+                i += 2
+        self._pos = i
+        return "".join(out)
+
+    @property
+    def is_json(self):
+        return self._mode != "raw"
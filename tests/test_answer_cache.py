@@ -0,0 +1,15 @@
+from answer_cache import AnswerCache, bag_of_words
+
+
+def test_negated_question_is_not_a_near_duplicate():
+    cache = AnswerCache(similarity_threshold=0.5)
+    cache.set("Should I use Docker for this course?", "", {"answer": "yes", "links": []})
+
+    assert cache.get("Should I use docker for the course?") is not None
+    assert cache.get("Should I not use Docker for this course?") is None
+    assert cache.get("Shouldn't I use Docker for this course?") is None
+
+
+def test_bag_of_words_keeps_negations():
+    assert bag_of_words("I don't have no access")["not"] == 1
+    assert bag_of_words("I don't have no access")["no"] == 1
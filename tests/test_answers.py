@@ -0,0 +1,45 @@
+import pytest
+
+from answers import InvalidAnswerError, extract_json, normalize_answer, prose_answer
+
+LINK = '{"url": "https://tds.s-anand.net/#/docker", "text": "Docker"}'
+
+
+def test_strict_json_is_not_repaired():
+    assert extract_json('{"answer": "ok", "links": []}') == ({"answer": "ok", "links": []}, False)
+
+
+@pytest.mark.parametrize("reply", [
+    f'```json\n{{"answer": "ok", "links": [{LINK}]}}\n```',
+    f'Here you go:\n```\n{{"answer": "ok", "links": [{LINK}]}}\n```\nAnything else?',
+    f'Sure! {{"answer": "ok", "links": [{LINK}]}} Hope that helps.',
+    f'{{"answer": "ok", "links": [{LINK},],}}',
+    f'{{"answer": "ok", "links": [{LINK}}}',
+])
+def test_fenced_wrapped_and_sloppy_replies_are_repaired(reply):
+    data, repaired = extract_json(reply)
+    assert repaired
+    assert normalize_answer(data) == {"answer": "ok", "links": [{"url": "https://tds.s-anand.net/#/docker", "text": "Docker"}]}
+
+
+def test_truncated_reply_keeps_the_answer_and_drops_the_cut_link():
+    data, _ = extract_json('{"answer": "Use Docker", "links": [' + LINK + ', {"url": "https://tds.s-an')
+    assert normalize_answer(data)["links"] == [{"url": "https://tds.s-anand.net/#/docker", "text": "Docker"}]
+
+
+def test_unterminated_answer_string_is_closed():
+    data, _ = extract_json('```json\n{"answer": "Line one\nline two\\')
+    assert data == {"answer": "Line one\nline two"}
+
+
+def test_object_without_answer_is_skipped_for_a_later_one():
+    data, _ = extract_json('Example: {"a": 1} then {"answer": "real"}')
+    assert data == {"answer": "real"}
+
+
+def test_reply_without_json_raises_and_falls_back_to_prose():
+    url = "https://tds.s-anand.net/#/docker"
+    reply = f"Use Docker, see {url}."
+    with pytest.raises(InvalidAnswerError):
+        extract_json(reply)
+    assert prose_answer(reply) == {"answer": reply, "links": [{"url": url, "text": url}]}
@@ -0,0 +1,13 @@
+from assets import CompressedAsset
+
+
+def test_etag_differs_per_content_coding():
+    asset = CompressedAsset(b"<html>" + b"x" * 1000 + b"</html>", "text/html")
+    gzip = asset.response({"accept-encoding": "gzip"})
+    identity = asset.response({})
+    assert gzip.headers["content-encoding"] == "gzip"
+    assert gzip.headers["etag"] != identity.headers["etag"]
+
+    # A validator only revalidates the representation it was issued for
+    assert asset.response({"accept-encoding": "gzip", "if-none-match": gzip.headers["etag"]}).status_code == 304
+    assert asset.response({"if-none-match": gzip.headers["etag"]}).status_code == 200
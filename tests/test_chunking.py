@@ -0,0 +1,33 @@
+from chunking import chunk_markdown, chunk_records
+from ingest import clean_markdown, split_pages
+
+BODY = " ".join(f"Sentence {i} talks about topic{i}." for i in range(300))
+POSTS = [
+    {"url": "https://d/t/x/9/1", "title": "T", "topic_id": 9, "content": BODY},
+    {"url": "https://d/t/x/9/2", "title": "T", "topic_id": 9, "content": "A reply.", "reply_to_post_number": 1},
+]
+
+
+def indexed(records):
+    return "\n".join(chunk["content"] for chunk in chunk_records(records))
+
+
+def test_ingested_long_post_is_indexed_whole():
+    records = list(split_pages(POSTS))
+    assert len(records) == len(POSTS)
+    assert "Sentence 150 " in indexed(records)
+
+
+def test_pieces_of_a_split_post_are_joined():
+    pieces = [{**POSTS[0], "content": piece, "chunk": i}
+              for i, (piece, _) in enumerate(chunk_markdown(BODY, 300, overlap=0))]
+    assert len(pieces) > 1
+    text = indexed(pieces[::-1] + POSTS[1:])
+    assert "Sentence 150 " in text and "Sentence 299 " in text
+
+
+def test_page_cleanup_keeps_code_and_list_indentation():
+    page = ("Intro  \r\n\n\n\n- item\n    - nested\n\n```yaml\nservices:\n  web:\n\n\n    image: x   \n```\n\n"
+            "    indented = 1\n")
+    assert clean_markdown(page) == ("Intro\n\n- item\n    - nested\n\n```yaml\nservices:\n  web:\n\n\n    image: x   \n```\n\n"
+                                    "    indented = 1")
@@ -0,0 +1,19 @@
+import pytest
+
+from embeddings import VectorIndex, get_embedder
+
+CHUNKS = [{"url": "u", "title": "Docker", "content": "podman and docker"}]
+
+
+def test_remote_model_without_key_is_an_error(monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    with pytest.raises(ValueError, match="OPENAI_API_KEY"):
+        get_embedder("openai:text-embedding-3-small")
+
+
+def test_vector_index_uses_the_configured_model(monkeypatch):
+    monkeypatch.setenv("EMBEDDING_MODEL", "hashing:64")
+    index = VectorIndex(CHUNKS)
+    assert index.embedder.name == "hashing:64"
+    assert index.vectors.shape == (1, 64)
+    assert index.nearest("docker", 1)[0][0] == 0
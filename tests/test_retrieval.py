@@ -0,0 +1,14 @@
+import json
+import os
+
+from retrieval import data_files, load_records
+
+
+def test_data_files_prefer_the_newer_format(tmp_path):
+    (tmp_path / "discourse.json").write_text(json.dumps([{"url": "old", "content": "stale"}]))
+    (tmp_path / "discourse.jsonl").write_text(json.dumps({"url": "new", "content": "fresh"}) + "\n")
+    os.utime(tmp_path / "discourse.json", (0, 0))
+    (tmp_path / "tds_website.json").write_text("[]")
+
+    assert data_files(tmp_path) == ["discourse.jsonl", "tds_website.json"]
+    assert [record["url"] for record in load_records(tmp_path)] == ["new"]
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+from streaming import AnswerStreamExtractor, chunk_text, content_chunks
+
+ANSWER = 'Line one\nsaid "hi" \\ café \U0001F600 done'
+REPLY = json.dumps({"answer": ANSWER, "links": [{"url": "https://x/#/a", "text": "A"}]})
+
+
+def stream(deltas):
+    extractor = AnswerStreamExtractor()
+    return "".join(extractor.feed(delta) for delta in deltas), extractor
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 16])
+def test_answer_survives_any_chunk_boundary(size):
+    # Small sizes cut \n, \", \\ and the 😀 surrogate pair apart
+    text, extractor = stream(chunk_text(chunk) for chunk in content_chunks(REPLY, size))
+    assert text == ANSWER
+    assert extractor.is_json and extractor.text == REPLY
+
+
+def test_fenced_reply_streams_the_answer_only():
+    text, extractor = stream(["```json\n{\"ans", "wer\": \"Use ", "Docker\", \"links\": []}\n```"])
+    assert text == "Use Docker"
+    assert extractor.is_json
+
+
+def test_unterminated_answer_yields_what_arrived():
+    text, extractor = stream(['{"answer": "cut off mid', " sentence\\"])
+    assert text == "cut off mid sentence"
+    assert extractor.is_json
+
+
+def test_prose_reply_passes_through():
+    text, extractor = stream(["Use Docker, ", "see the docs."])
+    assert text == "Use Docker, see the docs."
+    assert not extractor.is_json
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from upstream import ChatExecutor, CircuitBreaker, CircuitOpenError, UpstreamPolicy
+
+
+def failing():
+    raise ConnectionError("upstream down")
+
+
+def open_policy():
+    """A policy whose breaker has opened and whose reset timeout has already passed."""
+    policy = UpstreamPolicy(ChatExecutor(max_concurrency=2), timeout=5, retries=0,
+                            breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+    with pytest.raises(ConnectionError):
+        asyncio.run(policy.call(failing))
+    assert policy.breaker.state == CircuitBreaker.OPEN
+    time.sleep(0.06)
+    return policy
+
+
+def test_cancelled_probe_releases_half_open_breaker():
+    policy = open_policy()
+    release = threading.Event()
+
+    async def cancel_probe():
+        probe = asyncio.ensure_future(policy.call(release.wait, 5))
+        await asyncio.sleep(0.05)
+        assert policy.breaker.state == CircuitBreaker.HALF_OPEN
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        release.set()
+        # The next call is let through as a fresh probe instead of failing fast
+        return await policy.call(lambda: "ok")
+
+    assert asyncio.run(cancel_probe()) == "ok"
+    assert policy.breaker.state == CircuitBreaker.CLOSED
+
+
+def test_probe_in_progress_rejects_other_calls():
+    policy = open_policy()
+    release = threading.Event()
+
+    async def concurrent_calls():
+        probe = asyncio.ensure_future(policy.call(release.wait, 5))
+        await asyncio.sleep(0.05)
+        with pytest.raises(CircuitOpenError):
+            await policy.call(lambda: "ok")
+        release.set()
+        return await probe
+
+    assert asyncio.run(concurrent_calls()) is True
+
+
+def test_stream_reads_skip_latency_window_and_breaker():
+    policy = UpstreamPolicy(ChatExecutor(), breaker=CircuitBreaker(failure_threshold=2))
+    chunks = iter(range(50))
+
+    async def read_all():
+        opened = await policy.call(lambda: chunks, sample=False)
+        return [chunk async for chunk in _drain(policy, opened)]
+
+    policy.breaker.record_failure()
+    assert asyncio.run(read_all()) == list(range(50))
+    assert len(policy.latencies) == 0
+    # Only the call that opened the stream counts as a success
+    assert policy.breaker.failures == 0
+
+
+async def _drain(policy, chunks):
+    while (chunk := await policy.read(next, chunks, None)) is not None:
+        yield chunk
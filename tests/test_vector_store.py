@@ -0,0 +1,73 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import vector_store
+from embeddings import HashingEmbedder
+from retrieval import BM25Index
+from vector_store import VectorStore, build_ann, build_store, open_store, write_store
+
+
+def write(path, contents):
+    embedder = HashingEmbedder(dimensions=64)
+    chunks = [{"url": f"https://x/{i}", "title": "T", "content": text} for i, text in enumerate(contents)]
+    write_store(path, chunks, embedder.embed(contents), embedder)
+
+
+def test_rebuild_leaves_open_store_readable(tmp_path):
+    path = tmp_path / "index"
+    write(path, ["docker and podman", "git branches"])
+    old = VectorStore(path)
+    write(path, ["a completely different corpus"] * 3)
+
+    # The open store still reads its own build, and a new open sees the new one
+    assert [chunk["content"] for chunk in old.chunks] == ["docker and podman", "git branches"]
+    assert len(VectorStore(path)) == 3
+    # Only the current build is kept next to the link
+    assert sorted(os.listdir(tmp_path)) == ["index", os.path.basename(os.path.realpath(path))]
+
+
+def test_mapped_bm25_matches_in_memory_index(tmp_path):
+    contents = ["docker and podman", "git branches and docker", "podman rootless containers", ""]
+    write(tmp_path / "index", contents)
+    store = VectorStore(tmp_path / "index")
+    mapped, built = store.bm25(), BM25Index(list(store.chunks))
+
+    for query in ["docker", "podman containers", "git docker", "kubernetes", ""]:
+        assert mapped.scores(query) == pytest.approx(built.scores(query))
+    assert mapped.idf.get("docker") == pytest.approx(built.idf["docker"])
+    assert mapped.idf.get("kubernetes", 0.0) == 0.0
+
+
+def test_current_store_is_checked_without_reading_the_data(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    data.mkdir()
+    (data / "discourse.jsonl").write_text(json.dumps({"url": "u", "topic_title": "T", "content": "docker"}) + "\n")
+    build_store(str(data / "index"), data_dir=str(data), cache_path=None)
+    assert open_store(str(data / "index"), str(data)) is not None
+
+    monkeypatch.setattr(vector_store, "source_hashes", lambda data_dir: pytest.fail("data files were hashed"))
+    assert open_store(str(data / "index"), str(data)) is not None
+
+
+def test_rebuild_adds_to_the_previous_ivf_centroids(tmp_path):
+    embedder = HashingEmbedder(dimensions=64)
+    path = tmp_path / "index"
+
+    def rebuild(count, **kwargs):
+        contents = [f"topic {i} about docker podman git {i % 7}" for i in range(count)]
+        chunks = [{"url": f"https://x/{i}", "title": "T", "content": text} for i, text in enumerate(contents)]
+        vectors = embedder.embed(contents)
+        previous = VectorStore(path) if path.exists() else None
+        ann = build_ann(vectors, embedder, previous, ann_min=0, **kwargs)
+        write_store(path, chunks, vectors, embedder, ann=ann)
+        return VectorStore(path).ann
+
+    trained = rebuild(40)
+    grown = rebuild(60)
+    assert np.array_equal(grown.centroids, trained.centroids)
+    assert len(grown) == 60 and grown.trained_on == 40
+    assert rebuild(60, retrain=True).trained_on == 60
+    assert rebuild(130).trained_on == 130  # more than ANN_RETRAIN_GROWTH times the training set
@@ -0,0 +1,210 @@
+"""Incrementally sync data/*.json into the Pinecone assistant's knowledge files.
+
+Records are grouped into documents (one per Discourse topic, one per site
+page). A document's fingerprint lists its records' keys and hashes, taken
+from the dedup manifest (data/manifest.json, see dedup.py) when it is
+current, and is compared against a manifest of what was uploaded before.
+Only documents with added, changed or removed records are uploaded,
+concurrently with bounded parallelism; replaced and stale files are
+deleted.
+
+Usage: python upload_corpus.py [--workers 4] [--dry-run]
+"""
+import argparse
+import hashlib
+import io
+import os
+import re
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+from pinecone import Pinecone
+
+from dedup import MANIFEST_FILE, load_manifest, manifest_is_current, record_hash, record_key, save_manifest
+from ingest import clean_field
+from retrieval import DATA_DIR, data_files, iter_json_records
+
+ASSISTANT_NAME = "tds-virtual-assistant"
+UPLOAD_MANIFEST_FILE = os.path.join(DATA_DIR, "upload_manifest.json")
+WORKERS = 4
+
+SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+
+def _slug(text):
+    return SLUG_RE.sub("-", text.lower()).strip("-")[:80] or "page"
+
+
+def build_documents(records, record_hashes=None):
+    """Group records into {file_name: {"text", "metadata", "records"}} documents.
+
+    Discourse posts are grouped per topic with each post's URL inline so the
+    assistant can cite it; site pages are grouped per route (``?id=`` anchors
+    of the same page share one document). ``records`` is a fingerprint of
+    the document's records, with hashes from ``record_hashes`` (the dedup
+    manifest) where it has them.
+    """
+    record_hashes = record_hashes or {}
+    documents = OrderedDict()
+    for record in records:
+        url, title = clean_field(record.get("url")), clean_field(record.get("topic_title"))
+        if record.get("topic_id") is not None:
+            name = f"discourse_topic_{record['topic_id']}.md"
+            header = f"# {title}\n\nDiscourse topic: {url.rsplit('/', 1)[0]}\n"
+            section = f"\n## Post\n\nURL: {url}\n\n{record['content']}\n"
+            source = "discourse"
+        else:
+            route = url.split("?", 1)[0]
+            name = f"tds_{_slug(route.split('#/', 1)[-1])}.md"
+            header = f"# {title}\n\nURL: {route}\n"
+            section = f"\n{record['content']}\n"
+            source = "tds_website"
+        doc = documents.setdefault(name, {"parts": [header], "records": [],
+                                          "metadata": {"source": source, "url": url, "title": title}})
+        doc["parts"].append(section)
+        key = record_key(record)
+        doc["records"].append(f"{key} {record_hashes.get(key) or record_hash(record)}")
+    return OrderedDict(
+        (name, {"text": "".join(doc["parts"]), "metadata": doc["metadata"],
+                "records": hashlib.sha256("\n".join(doc["records"]).encode("utf-8")).hexdigest()})
+        for name, doc in documents.items()
+    )
+
+
+def document_hash(document):
+    return hashlib.sha256(document["text"].encode("utf-8")).hexdigest()
+
+
+def is_changed(document, entry):
+    """Whether ``document`` differs from what its upload manifest ``entry`` says was uploaded."""
+    if "records" in entry:
+        return entry["records"] != document["records"]
+    # Uploaded before fingerprints were recorded: compare the text
+    return entry.get("hash") != document_hash(document)
+
+
+def plan_sync(documents, manifest):
+    """Return (names to upload, [(name, file_id)] to delete as stale)."""
+    to_upload = [name for name, doc in documents.items() if is_changed(doc, manifest.get(name, {}))]
+    stale = [(name, entry["file_id"]) for name, entry in manifest.items()
+             if name not in documents and "file_id" in entry]
+    return to_upload, stale
+
+
+def upload_document(assistant, name, document):
+    data = document["text"].encode("utf-8")
+    metadata = {**document["metadata"], "content_hash": document_hash(document)}
+    # timeout=-1: return once accepted instead of polling until processed
+    file_model = assistant.upload_bytes_stream(io.BytesIO(data), name, metadata=metadata, timeout=-1)
+    return file_model["id"], len(data)
+
+
+def sync(assistant, documents, manifest, workers=WORKERS):
+    """Upload new/changed documents and delete replaced/stale files.
+
+    ``manifest`` ({name: {"hash", "records", "file_id", "pending_delete"}})
+    is updated in place as each upload succeeds, so an interrupted run
+    resumes where it stopped. Replaced and stale file ids stay listed under
+    ``pending_delete`` until their deletion succeeds, so a failed delete is
+    retried by the next run instead of leaving an orphan copy behind.
+    Returns a stats dict.
+    """
+    to_upload, stale = plan_sync(documents, manifest)
+    stats = {"uploaded": 0, "deleted": 0, "failed": 0, "unchanged": len(documents) - len(to_upload), "bytes": 0}
+    started = time.perf_counter()
+    for name, file_id in stale:
+        manifest[name] = {"pending_delete": manifest[name].get("pending_delete", []) + [file_id]}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(upload_document, assistant, name, documents[name]): name for name in to_upload}
+        for future in as_completed(futures):
+            name = futures[future]
+            try:
+                file_id, size = future.result()
+            except Exception as e:
+                print(f"Failed to upload {name}: {e}")
+                stats["failed"] += 1
+                continue
+            old = manifest.get(name, {})
+            pending = old.get("pending_delete", []) + ([old["file_id"]] if "file_id" in old else [])
+            manifest[name] = {"hash": document_hash(documents[name]), "records": documents[name]["records"],
+                              "file_id": file_id}
+            if pending:
+                manifest[name]["pending_delete"] = pending
+            stats["uploaded"] += 1
+            stats["bytes"] += size
+
+        deletions = {executor.submit(assistant.delete_file, file_id, timeout=-1): (name, file_id)
+                     for name, entry in manifest.items() for file_id in entry.get("pending_delete", [])}
+        for future in as_completed(deletions):
+            name, file_id = deletions[future]
+            try:
+                future.result()
+            except Exception as e:
+                print(f"Failed to delete {file_id} ({name}), will retry next run: {e}")
+                continue
+            entry = manifest[name]
+            entry["pending_delete"].remove(file_id)
+            if not entry["pending_delete"]:
+                del entry["pending_delete"]
+                if not entry:  # a stale document, now fully removed
+                    del manifest[name]
+            stats["deleted"] += 1
+
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+def report(stats):
+    seconds = stats["seconds"] or 1e-9
+    print(f"Uploaded {stats['uploaded']} documents ({stats['bytes'] / 1e6:.2f} MB), "
+          f"deleted {stats['deleted']}, unchanged {stats['unchanged']}, failed {stats['failed']} "
+          f"in {stats['seconds']:.1f}s: {stats['uploaded'] / seconds:.1f} docs/s, "
+          f"{stats['bytes'] / 1e6 / seconds:.2f} MB/s")
+
+
+def load_documents(data_dir=DATA_DIR, manifest_path=None):
+    """Documents from the data files, fingerprinted from the dedup manifest if it is current.
+
+    ``manifest_path`` defaults to manifest.json in ``data_dir``.
+    """
+    manifest_path = manifest_path or os.path.join(data_dir, os.path.basename(MANIFEST_FILE))
+    def records():
+        for name in data_files(data_dir):
+            yield from iter_json_records(os.path.join(data_dir, name))
+    record_hashes = None
+    if manifest_is_current(manifest_path, data_dir):
+        record_hashes = load_manifest(manifest_path)
+    return build_documents(records(), record_hashes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync data/*.json into the Pinecone assistant.")
+    parser.add_argument("--data-dir", default=DATA_DIR)
+    parser.add_argument("--manifest", default=UPLOAD_MANIFEST_FILE)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="concurrent uploads")
+    parser.add_argument("--dry-run", action="store_true", help="show what would change without uploading")
+    args = parser.parse_args()
+
+    documents = load_documents(args.data_dir)
+    manifest = load_manifest(args.manifest)
+    to_upload, stale = plan_sync(documents, manifest)
+    pending = sum(len(entry.get("pending_delete", [])) for entry in manifest.values())
+    print(f"{len(documents)} documents: {len(to_upload)} to upload, {len(stale)} stale, "
+          f"{pending} deletions to retry")
+    if args.dry_run:
+        return
+
+    load_dotenv()
+    pc = Pinecone(api_key=os.getenv("pinecone_api_key"))
+    assistant = pc.assistant.Assistant(assistant_name=ASSISTANT_NAME)
+    try:
+        report(sync(assistant, documents, manifest, workers=args.workers))
+    finally:
+        save_manifest(manifest, args.manifest)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+import asyncio
+import functools
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from metrics import UPSTREAM_HEDGES, UPSTREAM_RETRIES
+
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class QueueFullError(Exception):
+    """Raised when the upstream queue is full and the call is rejected."""
+
+
+class UpstreamTimeoutError(Exception):
+    """Raised when an upstream call misses its deadline."""
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling upstream while the circuit breaker is open."""
+
+
+def is_transient(error):
+    """Whether a failed call is worth retrying: timeouts, connection errors, 429/5xx."""
+    if isinstance(error, (UpstreamTimeoutError, ConnectionError, TimeoutError)):
+        return True
+    # Not imported here: if the pinecone client raised a urllib3 error, urllib3 is loaded
+    urllib3_exceptions = sys.modules.get("urllib3.exceptions")
+    if urllib3_exceptions is not None and isinstance(error, urllib3_exceptions.HTTPError):
+        return True
+    status = getattr(error, "status", None) or getattr(error, "status_code", None)
+    return status in TRANSIENT_STATUS
+
+
+class ChatExecutor:
+    """Runs blocking assistant calls on a bounded thread pool.
+
+    At most ``max_concurrency`` calls run at once; up to ``max_queue`` more
+    wait for a free worker. Anything beyond that is rejected immediately
+    with ``QueueFullError`` instead of piling up behind a slow upstream.
+    """
+
+    def __init__(self, max_concurrency=8, max_queue=64):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_concurrency, thread_name_prefix="assistant-chat"
+        )
+        self._pending = 0
+
+    @property
+    def in_flight(self):
+        return min(self._pending, self.max_concurrency)
+
+    @property
+    def queued(self):
+        return max(self._pending - self.max_concurrency, 0)
+
+    async def run(self, fn, *args, **kwargs):
+        # Only touched from the event loop thread, so a plain counter is safe
+        if self._pending >= self.max_concurrency + self.max_queue:
+            raise QueueFullError(
+                f"{self._pending} upstream calls pending (limit {self.max_concurrency + self.max_queue})"
+            )
+        loop = asyncio.get_running_loop()
+        future = self._executor.submit(functools.partial(fn, *args, **kwargs))
+        self._pending += 1
+        # Released when the thread finishes, not when the caller stops waiting:
+        # a call abandoned on timeout still occupies its worker
+        future.add_done_callback(lambda _: self._release_threadsafe(loop))
+        return await asyncio.wrap_future(future)
+
+    def _release_threadsafe(self, loop):
+        try:
+            loop.call_soon_threadsafe(self._release)
+        except RuntimeError:  # loop already closed at shutdown
+            pass
+
+    def _release(self):
+        self._pending -= 1
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+class CircuitBreaker:
+    """Fails fast after ``failure_threshold`` consecutive transient failures.
+
+    Once open, calls are rejected with CircuitOpenError for ``reset_timeout``
+    seconds; then a single probe call is let through (half-open) and its
+    outcome closes or re-opens the circuit.
+    """
+
+    CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+
+    def before_call(self):
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError(f"Upstream circuit open after {self.failures} failures")
+            self.state = self.HALF_OPEN
+        if self.state == self.HALF_OPEN:
+            if self._probing:
+                raise CircuitOpenError("Upstream circuit half-open, probe in progress")
+            self._probing = True
+
+    def record_success(self):
+        self.state = self.CLOSED
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        self._probing = False
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self.state = self.OPEN
+            self._opened_at = time.monotonic()
+
+    def release(self):
+        """End a probe that neither succeeded nor failed transiently."""
+        self._probing = False
+
+
+class UpstreamPolicy:
+    """Deadlines, jittered retries, hedging and a circuit breaker around ChatExecutor.
+
+    Each attempt gets ``timeout`` seconds. Transient failures (see
+    is_transient) are retried up to ``retries`` times after a full-jitter
+    exponential backoff. With ``hedge_after`` set, a duplicate request is
+    sent if the first has not answered by then: a number of seconds, or
+    "p95" for the 95th percentile of recent latencies. Hedges are only sent
+    while the executor has an idle worker, and the slower copy is abandoned.
+    """
+
+    def __init__(self, executor, timeout=30.0, retries=2, backoff=0.25, max_backoff=4.0,
+                 hedge_after=None, breaker=None, latency_window=200):
+        self.executor = executor
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.latencies = deque(maxlen=latency_window)
+
+    def hedge_delay(self):
+        if self.hedge_after is None:
+            return None
+        if self.hedge_after != "p95":
+            return float(self.hedge_after)
+        if len(self.latencies) < 20:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    async def call(self, fn, *args, retry=True, hedge=True, sample=True, **kwargs):
+        """Run ``fn(*args, **kwargs)`` on the executor under this policy.
+
+        Each call adds one latency sample for hedge_delay unless ``sample``
+        is False: opening a stream is never hedged, and the time to its first
+        chunk says little about how long a whole answer takes.
+        """
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = await self._attempt(fn, args, kwargs, hedge, sample)
+            except Exception as e:
+                if not is_transient(e):
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                if not retry or attempt >= self.retries or self.breaker.state == CircuitBreaker.OPEN:
+                    raise
+                attempt += 1
+                UPSTREAM_RETRIES.inc()
+                await asyncio.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1))))
+                continue
+            except BaseException:
+                # Cancelled (e.g. the client disconnected): no verdict, but the probe slot must be freed
+                self.breaker.release()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def read(self, fn, *args, **kwargs):
+        """Run ``fn`` on the executor with the per-attempt deadline only.
+
+        For reads from a stream that ``call`` already opened: no retries or
+        hedging, no latency sample and no breaker bookkeeping, so a long
+        answer neither skews hedge_delay nor resets the failure count.
+        """
+        try:
+            return await asyncio.wait_for(self.executor.run(fn, *args, **kwargs), self.timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamTimeoutError(f"No upstream response within {self.timeout}s")
+
+    async def _timed(self, fn, args, kwargs, sample):
+        start = time.perf_counter()
+        try:
+            result = await asyncio.wait_for(self.executor.run(fn, *args, **kwargs), self.timeout)
+        except asyncio.TimeoutError:
+            raise UpstreamTimeoutError(f"No upstream response within {self.timeout}s")
+        if sample:
+            self.latencies.append(time.perf_counter() - start)
+        return result
+
+    async def _attempt(self, fn, args, kwargs, hedge, sample):
+        tasks = [asyncio.ensure_future(self._timed(fn, args, kwargs, sample))]
+        try:
+            delay = self.hedge_delay() if hedge else None
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self.executor.in_flight < self.executor.max_concurrency:
+                    UPSTREAM_HEDGES.inc()
+                    tasks.append(asyncio.ensure_future(self._timed(fn, args, kwargs, sample)))
+            # First success wins; fail only when every copy has failed
+            error = None
+            for next_done in asyncio.as_completed(tasks):
+                try:
+                    return await next_done
+                except Exception as e:
+                    error = error or e
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()  # mark retrieved
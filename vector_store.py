@@ -0,0 +1,417 @@
+"""Compact, memory-mapped store of the corpus chunks and their embeddings.
+
+Layout of the store directory (data/index by default, a symlink to the
+current build in a sibling data/index-* directory):
+
+    vectors.npy       (n, dimensions) float16 or float32 embedding matrix
+    text.bin          every chunk's content, UTF-8, concatenated
+    text_offsets.npy  (n + 1,) int64 byte offsets of each chunk in text.bin
+    rows.npy          (n, 2) int32 indices of each chunk's url and title
+    bm25_terms.bin    the BM25 vocabulary, sorted, UTF-8, concatenated
+    bm25_term_offsets.npy  (terms + 1,) int64 byte offsets of each term in bm25_terms.bin
+    bm25_idf.npy      (terms,) float64 idf of each term
+    bm25_offsets.npy  (terms + 1,) int64 start of each term's postings in bm25_postings.npy
+    bm25_postings.npy (postings, 2) int32 (chunk, term frequency) pairs, grouped by term
+    bm25_doc_len.npy  (n,) int32 tokens per chunk
+    meta.json         counts, dtype, embedder, chunking settings, source file hashes, sizes
+                      and mtimes, the average BM25 document length and the deduplicated url
+                      and title tables
+    ivf/              an ann.IVFIndex over the vectors, for large corpora
+
+Opening a store maps the arrays and the text blobs instead of reading them,
+so it costs the same for any corpus size, and uvicorn workers on one host
+share the pages through the OS page cache. Chunks are decoded only when
+they are accessed, and BM25 queries read the postings of their terms
+straight from the mapped arrays. Whether the store is current is decided
+from the data files' sizes and mtimes; they are only hashed when those
+changed. A rebuild writes a new directory and swaps the symlink, so it
+never changes files a running worker has mapped.
+
+Usage: python vector_store.py [--dtype float32|float16] [--model hashing] [--workers 1]
+         [--no-cache] [--ann-min 20000] [--retrain] [--check]
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+
+import chunking
+from ann import IVFIndex
+from embeddings import EmbeddingCache, chunk_text, embed_corpus, get_embedder
+from retrieval import DATA_DIR, BM25Index, build_chunks, data_files, load_records, tokenize
+
+STORE_DIR = os.path.join(DATA_DIR, "index")
+EMBEDDING_CACHE = os.path.join(DATA_DIR, "embeddings.sqlite")
+FORMAT_VERSION = 2
+# Below this many chunks exact search is fast enough and no IVF index is built
+ANN_MIN_VECTORS = 20000
+# A rebuild keeps the previous store's IVF centroids until the corpus outgrows what they
+# were trained on by this factor
+ANN_RETRAIN_GROWTH = 2.0
+
+
+def source_hashes(data_dir=DATA_DIR):
+    """{file name: sha256} of the corpus files a store is built from."""
+    hashes = {}
+    for name in data_files(data_dir):
+        with open(os.path.join(data_dir, name), "rb") as f:
+            hashes[name] = hashlib.sha256(f.read()).hexdigest()
+    return hashes
+
+
+def source_stats(data_dir=DATA_DIR):
+    """{file name: [size, mtime_ns]} of the corpus files, from stat() alone."""
+    stats = {}
+    for name in data_files(data_dir):
+        st = os.stat(os.path.join(data_dir, name))
+        stats[name] = [st.st_size, st.st_mtime_ns]
+    return stats
+
+
+def _publish(staging, path):
+    """Atomically point ``path`` (a symlink) at the finished store directory ``staging``.
+
+    Files of the previous store are never rewritten, so workers that have it
+    mapped keep reading it; its directory is removed once nothing links to it.
+    """
+    link = f"{staging}.link"
+    os.symlink(os.path.basename(staging), link)
+    previous = os.path.realpath(path) if os.path.islink(path) else None
+    if os.path.isdir(path) and not os.path.islink(path):
+        # A store from before stores were published through a symlink
+        previous = f"{staging}.old"
+        os.replace(path, previous)
+    os.replace(link, path)
+    if previous and os.path.isdir(previous):
+        shutil.rmtree(previous, ignore_errors=True)
+
+
+def write_store(path, chunks, vectors, embedder, sources=None, dtype="float32", ann=None, stats=None):
+    """Write ``chunks`` and their ``vectors`` (one row per chunk) as a store at ``path``.
+
+    ``sources`` and ``stats`` are the source_hashes and source_stats of the
+    data files the chunks came from. The store (with ``ann``, an IVFIndex
+    over the vectors, under ivf/) is written to a new sibling directory and
+    swapped in whole, so readers only ever see a complete store: the old
+    one or the new one.
+    """
+    path = os.path.abspath(path)
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=f"{os.path.basename(path)}-", dir=parent)
+    os.chmod(staging, 0o755)
+    try:
+        _write_files(staging, chunks, vectors, embedder, sources, stats, dtype)
+        if ann is not None:
+            ann.save(os.path.join(staging, "ivf"))
+        _publish(staging, path)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+
+def _write_bm25(path, chunks):
+    """Write the BM25 postings of ``chunks`` as arrays; returns the average document length."""
+    bm25 = BM25Index(chunks)
+    terms = sorted(bm25.postings)
+    term_offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    offsets = np.zeros(len(terms) + 1, dtype=np.int64)
+    with open(os.path.join(path, "bm25_terms.bin"), "wb") as f:
+        for i, term in enumerate(terms):
+            data = term.encode("utf-8")
+            f.write(data)
+            term_offsets[i + 1] = term_offsets[i] + len(data)
+            offsets[i + 1] = offsets[i] + len(bm25.postings[term])
+    postings = np.array([pair for term in terms for pair in bm25.postings[term]], dtype=np.int32).reshape(-1, 2)
+    np.save(os.path.join(path, "bm25_term_offsets.npy"), term_offsets)
+    np.save(os.path.join(path, "bm25_idf.npy"), np.array([bm25.idf[term] for term in terms], dtype=np.float64))
+    np.save(os.path.join(path, "bm25_offsets.npy"), offsets)
+    np.save(os.path.join(path, "bm25_postings.npy"), postings)
+    np.save(os.path.join(path, "bm25_doc_len.npy"), np.array(bm25.doc_len, dtype=np.int32))
+    return bm25.avg_len
+
+
+def _write_files(path, chunks, vectors, embedder, sources, stats, dtype):
+    urls, titles = {}, {}
+    rows = np.empty((len(chunks), 2), dtype=np.int32)
+    offsets = np.zeros(len(chunks) + 1, dtype=np.int64)
+    with open(os.path.join(path, "text.bin"), "wb") as f:
+        for i, chunk in enumerate(chunks):
+            data = chunk["content"].encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+            rows[i] = urls.setdefault(chunk["url"], len(urls)), titles.setdefault(chunk["title"], len(titles))
+    np.save(os.path.join(path, "text_offsets.npy"), offsets)
+    np.save(os.path.join(path, "rows.npy"), rows)
+    np.save(os.path.join(path, "vectors.npy"), np.asarray(vectors, dtype=dtype))
+    avg_len = _write_bm25(path, chunks)
+    meta = {
+        "version": FORMAT_VERSION,
+        "count": len(chunks),
+        "dimensions": int(vectors.shape[1]),
+        "dtype": dtype,
+        "embedder": embedder.name,
+        "chunking": chunking.settings(),
+        "sources": sources or {},
+        "source_stats": stats or {},
+        "bm25_avg_len": avg_len,
+        "urls": list(urls),
+        "titles": list(titles),
+    }
+    # Written last: a store without meta.json is incomplete
+    with open(os.path.join(path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+
+class ChunkView:
+    """Read-only sequence of chunk dicts decoded on access from the mapped store."""
+
+    def __init__(self, store):
+        self._store = store
+
+    def __len__(self):
+        return self._store.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        return self._store.chunk(i)
+
+    def __iter__(self):
+        return (self._store.chunk(i) for i in range(len(self)))
+
+
+class TermTable:
+    """Read-only {term: idf} over the sorted, mapped vocabulary of a store; lookups are binary searches."""
+
+    def __init__(self, blob, offsets, idf):
+        self._blob = blob
+        self._offsets = offsets
+        self.idf = idf
+
+    def __len__(self):
+        return len(self.idf)
+
+    def _term(self, i):
+        return self._blob[int(self._offsets[i]):int(self._offsets[i + 1])]
+
+    def find(self, term):
+        """Position of ``term`` in the table, or -1."""
+        key = term.encode("utf-8")
+        lo, hi = 0, len(self.idf)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < len(self.idf) and self._term(lo) == key else -1
+
+    def get(self, term, default=None):
+        i = self.find(term)
+        return default if i < 0 else float(self.idf[i])
+
+    def __contains__(self, term):
+        return self.find(term) >= 0
+
+
+class MappedBM25Index(BM25Index):
+    """A retrieval.BM25Index read from a store's postings arrays instead of built from the chunks."""
+
+    def __init__(self, store, k1=1.5, b=0.75):
+        self.chunks = store.chunks
+        self.k1 = k1
+        self.b = b
+        self.idf = store.terms
+        self.offsets = store.bm25_offsets
+        self.postings = store.bm25_postings
+        self.doc_len = store.bm25_doc_len
+        self.avg_len = store.meta["bm25_avg_len"]
+
+    def scores(self, query):
+        k1, b, avg_len = self.k1, self.b, self.avg_len or 1.0
+        ids, parts = [], []
+        for term in set(tokenize(query)):
+            i = self.idf.find(term)
+            if i < 0:
+                continue
+            block = self.postings[self.offsets[i]:self.offsets[i + 1]]
+            idx, tf = block[:, 0], block[:, 1].astype(np.float64)
+            norm = k1 * (1 - b + b * self.doc_len[idx] / avg_len)
+            ids.append(idx)
+            parts.append(self.idf.idf[i] * tf * (k1 + 1) / (tf + norm))
+        if not ids:
+            return {}
+        unique, inverse = np.unique(np.concatenate(ids), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(parts))
+        return dict(zip(unique.tolist(), totals.tolist()))
+
+
+def _map_file(path):
+    with open(path, "rb") as f:
+        # mmap cannot map an empty file
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+
+class VectorStore:
+    """A store opened with memory maps; see the module docstring for the layout."""
+
+    def __init__(self, path):
+        # Resolved once, so every file comes from the same build even if a new one is published meanwhile
+        path = os.path.realpath(path)
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported vector store version in {path}: {self.meta.get('version')}")
+        self.path = path
+        self.count = self.meta["count"]
+        self.urls = self.meta["urls"]
+        self.titles = self.meta["titles"]
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        self.offsets = np.load(os.path.join(path, "text_offsets.npy"), mmap_mode="r")
+        self.rows = np.load(os.path.join(path, "rows.npy"), mmap_mode="r")
+        self._text = _map_file(os.path.join(path, "text.bin"))
+        self.chunks = ChunkView(self)
+        self.terms = TermTable(
+            _map_file(os.path.join(path, "bm25_terms.bin")),
+            np.load(os.path.join(path, "bm25_term_offsets.npy"), mmap_mode="r"),
+            np.load(os.path.join(path, "bm25_idf.npy"), mmap_mode="r"),
+        )
+        self.bm25_offsets = np.load(os.path.join(path, "bm25_offsets.npy"), mmap_mode="r")
+        self.bm25_postings = np.load(os.path.join(path, "bm25_postings.npy"), mmap_mode="r")
+        self.bm25_doc_len = np.load(os.path.join(path, "bm25_doc_len.npy"), mmap_mode="r")
+        ivf_path = os.path.join(path, "ivf")
+        self.ann = IVFIndex.load(ivf_path) if os.path.exists(os.path.join(ivf_path, "meta.json")) else None
+
+    def __len__(self):
+        return self.count
+
+    def text(self, i):
+        return self._text[int(self.offsets[i]):int(self.offsets[i + 1])].decode("utf-8")
+
+    def chunk(self, i):
+        if not -self.count <= i < self.count:
+            raise IndexError(i)
+        i %= self.count
+        url, title = self.rows[i]
+        return {"url": self.urls[url], "title": self.titles[title], "content": self.text(i)}
+
+    def embedder(self):
+        """An embedder matching the one the vectors were built with."""
+        return get_embedder(self.meta["embedder"])
+
+    def bm25(self, **kwargs):
+        """A BM25 index over the stored postings (see MappedBM25Index)."""
+        return MappedBM25Index(self, **kwargs)
+
+    def is_current(self, data_dir=DATA_DIR):
+        """Built from the current data files and chunking settings (raises ValueError if its model is unusable).
+
+        The data files are compared by size and mtime; only if those differ
+        (after a fresh checkout, say) are they read and hashed.
+        """
+        if self.meta.get("chunking") != chunking.settings() or self.embedder().name != self.meta["embedder"]:
+            return False
+        return self.meta["source_stats"] == source_stats(data_dir) or self.meta["sources"] == source_hashes(data_dir)
+
+
+def build_ann(vectors, embedder, previous=None, ann_min=ANN_MIN_VECTORS, retrain=False):
+    """The IVF index for a store of ``vectors``, or None below ``ann_min`` of them.
+
+    When ``previous`` (the store being replaced) has an index over vectors
+    from the same embedder, its centroids are kept and the vectors are
+    ``add``ed to them, skipping k-means; unchanged chunks land in the same
+    lists as before. The centroids are retrained with ``retrain``, or once
+    the corpus has grown ANN_RETRAIN_GROWTH times past what they were
+    trained on.
+    """
+    if not len(vectors) or len(vectors) < ann_min:
+        return None
+    old = previous.ann if previous is not None else None
+    if (retrain or old is None or previous.meta["embedder"] != embedder.name
+            or old.centroids.shape[1] != vectors.shape[1]
+            or len(vectors) > ANN_RETRAIN_GROWTH * max(old.trained_on, 1)):
+        return IVFIndex.build(vectors)
+    ann = old.empty_copy()
+    ann.add(vectors)
+    return ann
+
+
+def build_store(path=STORE_DIR, data_dir=DATA_DIR, dtype="float32", model=None, workers=1,
+                cache_path=EMBEDDING_CACHE, ann_min=ANN_MIN_VECTORS, retrain=False):
+    """Chunk and embed data/*.json and write the store; returns the embedding EmbedStats.
+
+    Vectors of unchanged chunks come from the cache at ``cache_path`` (None
+    disables it). An IVF index is added when there are at least ``ann_min``
+    chunks, reusing the current store's centroids unless ``retrain`` (see
+    build_ann).
+    """
+    file_stats = source_stats(data_dir)  # before reading, so an edit made during the build leaves the store stale
+    chunks = build_chunks(load_records(data_dir))
+    embedder = get_embedder(model)
+    cache = EmbeddingCache(cache_path) if cache_path else None
+    vectors, stats = embed_corpus([chunk_text(chunk) for chunk in chunks], embedder, cache=cache, workers=workers)
+    try:
+        previous = VectorStore(path)
+    except (OSError, ValueError, KeyError):
+        previous = None
+    ann = build_ann(vectors, embedder, previous, ann_min=ann_min, retrain=retrain)
+    write_store(path, chunks, vectors, embedder, sources=source_hashes(data_dir), dtype=dtype, ann=ann,
+                stats=file_stats)
+    return stats
+
+
+def open_store(path=STORE_DIR, data_dir=DATA_DIR):
+    """The store at ``path`` if it exists and was built from the current data files, else None.
+
+    Raises ValueError when the store's embedding model cannot embed queries
+    here (see embeddings.get_embedder).
+    """
+    try:
+        store = VectorStore(path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return store if store.is_current(data_dir) else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the memory-mapped chunk and vector store from data/*.json.")
+    parser.add_argument("--out", default=STORE_DIR)
+    parser.add_argument("--dtype", choices=["float32", "float16"], default="float32",
+                        help="float16 halves the file but NumPy scores it several times slower")
+    parser.add_argument("--model", default=os.getenv("EMBEDDING_MODEL") or "hashing",
+                        help='"hashing", "hashing:<dimensions>" or "openai:<model>"')
+    parser.add_argument("--workers", type=int, default=1, help="embedding processes")
+    parser.add_argument("--no-cache", action="store_true", help="re-embed every chunk")
+    parser.add_argument("--ann-min", type=int, default=ANN_MIN_VECTORS,
+                        help="build an IVF index from this many chunks (0: always)")
+    parser.add_argument("--retrain", action="store_true",
+                        help="train new IVF centroids instead of reusing the current store's")
+    parser.add_argument("--check", action="store_true", help="exit non-zero if the store is missing or stale")
+    args = parser.parse_args()
+
+    if args.check:
+        current = open_store(args.out) is not None
+        print(f"{args.out} is up to date" if current else f"{args.out} is out of date: run python vector_store.py")
+        sys.exit(0 if current else 1)
+
+    stats = build_store(args.out, dtype=args.dtype, model=args.model, workers=args.workers,
+                        cache_path=None if args.no_cache else EMBEDDING_CACHE, ann_min=args.ann_min,
+                        retrain=args.retrain)
+    sizes = {name: os.path.getsize(os.path.join(args.out, name)) for name in sorted(os.listdir(args.out))
+             if os.path.isfile(os.path.join(args.out, name))}
+    rate = stats.embedded / stats.seconds if stats.seconds else 0.0
+    print(f"{stats.total} chunks written to {args.out}: {stats.cached} cached, {stats.embedded} embedded "
+          f"in {stats.batches} batches, {stats.seconds:.2f}s ({rate:,.0f} chunks/sec)")
+    for name, size in sizes.items():
+        print(f"{name:<18} {size:>10,} bytes")
+
+
+if __name__ == "__main__":
+    main()